@@ -1,4 +1,11 @@
 import math
+import operator
+import collections
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
 
 
 def standard_deviation(values):
@@ -73,3 +80,140 @@ def fairness_score(values):
         )
     except ZeroDivisionError:
         return total_deviation, 0.0
+
+
+class StatsAccumulator:
+    """
+    Single pass statistics over a metric values.
+    Values are counted by distinct value while iterating, count, sum, mean, min/max,
+    standard deviation, stats without extremes and scores are then derived from distinct values only.
+    Values may be tuples, as (delta, target) for hours, key functions select the compared item.
+    """
+
+    def __init__(self, values=()):
+        self.histogram = collections.Counter()
+        self.histogram.update(values)
+
+    @classmethod
+    def many(cls, rows, keys):
+        """
+        Accumulate several metrics in a single pass over rows
+        :param rows: iterable of rows
+        :param keys: list of functions returning a metric value given a row
+        :return: list of accumulators, one per key
+        """
+        accumulators = [cls() for _ in keys]
+        histograms = [accumulator.histogram for accumulator in accumulators]
+        for row in rows:
+            for key, histogram in zip(keys, histograms):
+                histogram[key(row)] += 1
+        return accumulators
+
+    @classmethod
+    def from_array(cls, values):
+        """
+        Accumulate values from a sequence or array of numbers, or of same size tuples,
+        histogram is built with numpy when available
+        """
+        if np is None:
+            return cls(
+                tuple(value) if isinstance(value, list) else value for value in values
+            )
+        array = np.asarray(values)
+        accumulator = cls()
+        if not array.size:
+            return accumulator
+        distinct, counts = np.unique(array, axis=0, return_counts=True)
+        distinct = distinct.tolist()
+        if array.ndim > 1:
+            distinct = map(tuple, distinct)
+        accumulator.histogram.update(dict(zip(distinct, counts.tolist())))
+        return accumulator
+
+    def add(self, value):
+        self.histogram[value] += 1
+
+    @property
+    def count(self):
+        return sum(self.histogram.values())
+
+    @property
+    def min(self):
+        return min(self.histogram) if self.histogram else None
+
+    @property
+    def max(self):
+        return max(self.histogram) if self.histogram else None
+
+    def sum(self, key=None):
+        if key is None:
+            return sum(value * count for value, count in self.histogram.items())
+        return sum(key(value) * count for value, count in self.histogram.items())
+
+    def mean(self, key=None):
+        count = self.count
+        return self.sum(key) / count if count else 0
+
+    def variance(self, key=None):
+        count = self.count
+        if not count:
+            return 0
+        average = self.sum(key) / count
+        deviation_term = 0
+        for value, value_count in self.histogram.items():
+            deviation = (key(value) if key else value) - average
+            deviation_term += value_count * deviation**2
+        return deviation_term / count
+
+    def wo_extremes(self):
+        """
+        Return a new accumulator without values equal to min or max value
+        """
+        accumulator = StatsAccumulator()
+        accumulator.histogram.update(self.histogram)
+        if self.histogram:
+            del accumulator.histogram[self.min]
+            accumulator.histogram.pop(self.max, None)
+        return accumulator
+
+    def standard_deviation(self, key=None):
+        """
+        Same as standard_deviation
+        """
+        if not self.histogram:
+            return 0
+        return round(math.sqrt(self.variance(key)), 1)
+
+    def hours_score(self):
+        """
+        Same as hours_score, values are (delta, target) tuples
+        """
+        total_delta = self.sum(operator.itemgetter(0))
+        total_target = self.sum(operator.itemgetter(1))
+        try:
+            return (
+                total_delta,
+                total_target,
+                round(100 - (100 * min(total_delta / total_target, 1)), 1),
+            )
+        except ZeroDivisionError:
+            return total_delta, total_target, 0.0
+
+    def fairness_score(self):
+        """
+        Same as fairness_score
+        """
+        if not self.histogram:
+            return 0, 0.0
+
+        total_sum = self.sum()
+        mean = total_sum / self.count
+        total_deviation = sum(
+            count * abs(value - mean) for value, count in self.histogram.items()
+        )
+        try:
+            return total_deviation, round(
+                100 - (100 * min(total_deviation / total_sum, 1)), 1
+            )
+        except ZeroDivisionError:
+            return total_deviation, 0.0
@@ -1,31 +1,259 @@
 import os
+import sys
 import argparse
 import logging
-from schedule_ascii.db import DBAdapter
-from schedule_ascii.parser import JSONParser
+import contextlib
+from schedule_ascii.db import DBAdapter, DEFAULT_BATCH_SIZE, FAST_PRAGMAS
+from schedule_ascii.model import ScheduleModel
+from schedule_ascii.snapshot import (
+    ScheduleSnapshot,
+    open_snapshot,
+    write_snapshot,
+    snapshot_file_path,
+)
+from schedule_ascii.parser import JSONParser, file_hash, store_rows
 from schedule_ascii.drawer import ScheduleDrawer, CapacityDrawer
+from schedule_ascii.profiling import Profiler
+from schedule_ascii.pipeline import RowProducer, draw_parallel
 
 logging.basicConfig()
+LOG = logging.getLogger(__name__)
 
 
-def do_draw(json_file_path):
-    json_parser = JSONParser(json_file_path)
+def parse_days(value):
+    """
+    Parse a "start:end" days window, end excluded, both bounds are optional
+    """
+    start, sep, end = value.partition(":")
+    if not sep:
+        raise argparse.ArgumentTypeError(
+            f"invalid days window {value}, expected start:end"
+        )
+    try:
+        return range(int(start) if start else 0, int(end) if end else sys.maxsize)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid days window {value}")
+
+
+def db_file_path(json_file_path):
+    """
+    Return sqlite file path stored next to the JSON file
+    """
     rel_path_name = os.path.basename(json_file_path)[:-5] + ".sqlite"
-    db_filename = os.path.join(os.path.dirname(json_file_path), rel_path_name)
-    db_adapter = DBAdapter(db_filename)
-    db_adapter.init_tables()
+    return os.path.join(os.path.dirname(json_file_path), rel_path_name)
+
 
-    json_parser.store(db_adapter)
+def load_db(
+    json_file_path,
+    batch_size=DEFAULT_BATCH_SIZE,
+    streaming=False,
+    cache=False,
+    rebuild=False,
+    profiler=None,
+    in_memory=False,
+    persist=True,
+    pragmas=None,
+    model=False,
+    snapshot=False,
+    auditor=None,
+    pipelined=False,
+):
+    """
+    Load JSON file to an sqlite db, or to a ScheduleModel
+    :param json_file_path:
+    :param batch_size: number of rows inserted per batch
+    :param streaming: read JSON file one array element at a time
+    :param cache: reuse existing sqlite file if built from the same JSON content and schema version
+    :param rebuild: force db rebuild, cache key is stored for later cached runs
+    :param profiler: optional profiling.Profiler collecting stages timing and statements counters
+    :param in_memory: load and compute in a :memory: db
+    :param persist: for in memory db, snapshot db to the sqlite file once loaded
+    :param pragmas: dict of PRAGMA settings, ie FAST_PRAGMAS
+    :param model: load to an in process ScheduleModel, no sqlite db is written. Other db options are ignored
+    :param snapshot: open the binary snapshot stored next to the JSON file if built from the same JSON content,
+        otherwise load the JSON file and write the snapshot for later runs
+    :param auditor: optional audit.QueryPlanAuditor explaining sqlite statements
+    :param pipelined: parse JSON file in a background thread while rows are inserted, see pipeline.RowProducer
+    :return: DBAdapter, ScheduleModel or ScheduleSnapshot
+    """
+    source_hash = file_hash(json_file_path) if cache or rebuild or snapshot else None
+    if snapshot and not rebuild:
+        schedule_snapshot = open_snapshot(
+            snapshot_file_path(json_file_path), source_hash, profiler=profiler
+        )
+        if schedule_snapshot is not None:
+            LOG.info(f"using snapshot {schedule_snapshot.snapshot_path}")
+            return schedule_snapshot
 
-    capacity_drawer = CapacityDrawer(db_adapter)
-    capacity_drawer.draw()
+    if model:
+        db_adapter = ScheduleModel(profiler=profiler)
+        with db_adapter.span("parse"):
+            json_parser = JSONParser(json_file_path, streaming=streaming)
+        with db_adapter.span("store"):
+            json_parser.store(db_adapter)
+    else:
+        db_adapter = _load_sqlite(
+            json_file_path,
+            source_hash,
+            batch_size=batch_size,
+            streaming=streaming,
+            cache=cache or rebuild,
+            rebuild=rebuild,
+            profiler=profiler,
+            in_memory=in_memory,
+            persist=persist,
+            pragmas=pragmas,
+            auditor=auditor,
+            pipelined=pipelined,
+        )
 
-    schedule_drawer = ScheduleDrawer(db_adapter)
-    schedule_drawer.init_shift_ascii_display()
+    if snapshot:
+        with db_adapter.span("write_snapshot"):
+            try:
+                write_snapshot(
+                    snapshot_file_path(json_file_path), db_adapter, source_hash
+                )
+            except ValueError as err:
+                # drawn from the loaded db, as without snapshot
+                LOG.warning(f"snapshot not written: {err}")
+    return db_adapter
+
+
+def _load_sqlite(
+    json_file_path,
+    source_hash,
+    batch_size,
+    streaming,
+    cache,
+    rebuild,
+    profiler,
+    in_memory,
+    persist,
+    pragmas,
+    auditor,
+    pipelined,
+):
+    db_filename = db_file_path(json_file_path)
+    db_adapter = DBAdapter(
+        db_filename,
+        batch_size=batch_size,
+        reset=not cache,
+        profiler=profiler,
+        in_memory=in_memory,
+        pragmas=pragmas,
+        auditor=auditor,
+    )
+
+    if cache and not rebuild and db_adapter.is_cached(source_hash):
+        LOG.info(f"using cached db {db_filename}")
+    else:
+        if cache:
+            db_adapter.reset()
+        if pipelined:
+            # parsing overlaps inserts, both are timed by the store span
+            with db_adapter.span("store"):
+                db_adapter.init_tables(indexes=False)
+                row_producer = RowProducer(
+                    json_file_path, streaming=streaming, batch_size=batch_size
+                )
+                store_rows(db_adapter, row_producer.rows())
+        else:
+            with db_adapter.span("parse"):
+                json_parser = JSONParser(json_file_path, streaming=streaming)
+            with db_adapter.span("store"):
+                # indexes are created by the parser once data is loaded
+                db_adapter.init_tables(indexes=False)
+                json_parser.store(db_adapter)
+        if cache:
+            db_adapter.store_cache_key(source_hash)
+        if in_memory and persist:
+            with db_adapter.span("snapshot"):
+                db_adapter.snapshot()
+    return db_adapter
+
+
+def draw(db_adapter, capacity_backend="sql", stream=None, day_range=None):
+    """
+    Draw capacity, shifts display and schedule of a loaded db
+    :param db_adapter:
+    :param capacity_backend: "sql" or "numpy", see CapacityDrawer. Snapshots are drawn from their
+        precomputed capacity
+    :param stream: text stream the report is written to, defaults to sys.stdout
+    :param day_range: range of days drawn by capacity & tasks grid, defaults to all days
+    :return:
+    """
+    if isinstance(db_adapter, ScheduleSnapshot):
+        capacity_backend = CapacityDrawer.SNAPSHOT_BACKEND
+    with db_adapter.span("capacity"):
+        capacity_drawer = CapacityDrawer(
+            db_adapter, backend=capacity_backend, stream=stream
+        )
+        capacity_drawer.draw(day_range)
+
+    schedule_drawer = ScheduleDrawer(db_adapter, stream=stream)
+    with db_adapter.span("init_shift_ascii_display"):
+        schedule_drawer.init_shift_ascii_display()
     for shift in db_adapter.select("shift", ["id", "ascii_display"]):
-        print(f"{shift[0]} {shift[1]}")
+        schedule_drawer.write_line(f"{shift[0]} {shift[1]}")
 
-    schedule_drawer.draw()
+    with db_adapter.span("schedule"):
+        schedule_drawer.draw(day_range)
+
+
+def do_draw(
+    json_file_path,
+    batch_size=DEFAULT_BATCH_SIZE,
+    streaming=False,
+    cache=False,
+    rebuild=False,
+    capacity_backend="sql",
+    stream=None,
+    day_range=None,
+    profiler=None,
+    in_memory=False,
+    persist=True,
+    pragmas=None,
+    model=False,
+    snapshot=False,
+    auditor=None,
+    pipelined=False,
+):
+    """
+    Load JSON file to an sqlite db and draw capacity & schedule, see load_db and draw.
+    If pipelined, parsing overlaps inserts and capacity & schedule are drawn at the same time
+    on their own read connection, see pipeline.draw_parallel. The db is closed once drawn
+    """
+    db_adapter = load_db(
+        json_file_path,
+        batch_size=batch_size,
+        streaming=streaming,
+        cache=cache,
+        rebuild=rebuild,
+        profiler=profiler,
+        in_memory=in_memory,
+        persist=persist,
+        pragmas=pragmas,
+        model=model,
+        snapshot=snapshot,
+        auditor=auditor,
+        pipelined=pipelined,
+    )
+    with contextlib.closing(db_adapter):
+        if pipelined:
+            draw_parallel(
+                db_adapter,
+                capacity_backend=capacity_backend,
+                stream=stream,
+                day_range=day_range,
+                pragmas=pragmas,
+            )
+        else:
+            draw(
+                db_adapter,
+                capacity_backend=capacity_backend,
+                stream=stream,
+                day_range=day_range,
+            )
 
 
 if __name__ == "__main__":
@@ -36,7 +264,207 @@ if __name__ == "__main__":
         "store db file at the root of JSON file path\n",
     )
     parser.add_argument("json_file_path", help="file to run (.mps)")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="number of rows inserted per batch when loading JSON data",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="read JSON file once, one array element at a time instead of loading it at once. "
+        "Elements written before the schedule key are held until it is read",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse sqlite file when JSON content and schema version did not change",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="force sqlite file rebuild, implies --cache",
+    )
+    parser.add_argument(
+        "--capacity-backend",
+        choices=CapacityDrawer.BACKENDS,
+        default="sql",
+        help="capacity computation backend, numpy backend requires numpy",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="write report to this file instead of stdout",
+    )
+    window_group = parser.add_mutually_exclusive_group()
+    window_group.add_argument(
+        "--days",
+        type=parse_days,
+        help="only draw capacity & tasks of days window start:end (end excluded), ie 0:28",
+    )
+    window_group.add_argument(
+        "--week",
+        type=int,
+        help="only draw capacity & tasks of week N of the schedule, first week is 0",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="write JSON profiling report of stages timing and SQL statements to PATH, - for stderr",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=10,
+        help="count of slowest statements in profiling report",
+    )
+    parser.add_argument(
+        "--audit",
+        metavar="PATH",
+        help="explain each distinct SQL statement and write JSON report of full scans, temp B-trees "
+        "and suggested indexes to PATH, - for stderr",
+    )
+    parser.add_argument(
+        "--audit-create-indexes",
+        action="store_true",
+        help="create indexes suggested by --audit as statements are audited",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="load and compute in an in memory db, then snapshot it to the sqlite file",
+    )
+    parser.add_argument(
+        "--no-persist",
+        action="store_true",
+        help="do not write the sqlite file, implies --memory",
+    )
+    parser.add_argument(
+        "--fast-pragmas",
+        action="store_true",
+        help="disable fsync and keep journal & temp tables in memory",
+    )
+
+    parser.add_argument(
+        "--model",
+        action="store_true",
+        help="render from an in process compact model instead of an sqlite db, no sqlite file is written",
+    )
+
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="write a memory mapped binary snapshot next to the sqlite file, "
+        "later runs render from it while the JSON file is unchanged",
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="parse JSON file in a background thread while rows are inserted, "
+        "then draw capacity & schedule at the same time on separate read connections",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep db open and redraw each time the JSON file changes, only changed rows are applied",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.5,
+        help="seconds between JSON file checks in watch mode",
+    )
 
     parsed_args = parser.parse_args()
+    if parsed_args.watch and (parsed_args.model or parsed_args.snapshot):
+        parser.error("--watch can not be used with --model or --snapshot")
+    if parsed_args.model and (
+        parsed_args.cache or parsed_args.rebuild or parsed_args.memory
+    ):
+        parser.error("--model can not be used with --cache, --rebuild or --memory")
+    if parsed_args.pipeline and (
+        parsed_args.model
+        or parsed_args.snapshot
+        or parsed_args.watch
+        or parsed_args.memory
+        or parsed_args.no_persist
+    ):
+        parser.error(
+            "--pipeline can not be used with --model, --snapshot, --watch, --memory or --no-persist"
+        )
+    if parsed_args.pipeline and parsed_args.audit_create_indexes:
+        parser.error(
+            "--pipeline can not be used with --audit-create-indexes, "
+            "indexes can not be created while drawing on read connections"
+        )
+    day_range = parsed_args.days
+    if parsed_args.week is not None:
+        day_range = range(parsed_args.week * 7, (parsed_args.week + 1) * 7)
+
+    if parsed_args.watch:
+        from schedule_ascii.watch import ScheduleWatcher
+
+        watcher = ScheduleWatcher(
+            parsed_args.json_file_path,
+            capacity_backend=parsed_args.capacity_backend,
+            day_range=day_range,
+            streaming=parsed_args.stream,
+            batch_size=parsed_args.batch_size,
+            cache=parsed_args.cache,
+            rebuild=parsed_args.rebuild,
+            in_memory=parsed_args.memory or parsed_args.no_persist,
+            persist=not parsed_args.no_persist,
+            pragmas=FAST_PRAGMAS if parsed_args.fast_pragmas else None,
+        )
+        try:
+            watcher.run(parsed_args.output, parsed_args.interval)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    draw_profiler = Profiler() if parsed_args.profile else None
+    auditor = None
+    if parsed_args.audit:
+        from schedule_ascii.audit import QueryPlanAuditor
+
+        auditor = QueryPlanAuditor(create_indexes=parsed_args.audit_create_indexes)
+    with (
+        open(parsed_args.output, "w")
+        if parsed_args.output
+        else contextlib.nullcontext()
+    ) as output:
+        do_draw(
+            parsed_args.json_file_path,
+            batch_size=parsed_args.batch_size,
+            streaming=parsed_args.stream,
+            cache=parsed_args.cache,
+            rebuild=parsed_args.rebuild,
+            capacity_backend=parsed_args.capacity_backend,
+            stream=output,
+            day_range=day_range,
+            profiler=draw_profiler,
+            in_memory=parsed_args.memory or parsed_args.no_persist,
+            persist=not parsed_args.no_persist,
+            pragmas=FAST_PRAGMAS if parsed_args.fast_pragmas else None,
+            model=parsed_args.model,
+            snapshot=parsed_args.snapshot,
+            auditor=auditor,
+            pipelined=parsed_args.pipeline,
+        )
+
+    if auditor:
+        if parsed_args.audit == "-":
+            auditor.write(sys.stderr)
+        else:
+            with open(parsed_args.audit, "w") as fp:
+                auditor.write(fp)
 
-    do_draw(parsed_args.json_file_path)
+    if draw_profiler:
+        if parsed_args.profile == "-":
+            draw_profiler.write(sys.stderr, parsed_args.profile_top)
+        else:
+            with open(parsed_args.profile, "w") as fp:
+                draw_profiler.write(fp, parsed_args.profile_top)
@@ -0,0 +1,356 @@
+"""
+Query plan audit: each distinct statement run by a DBAdapter is explained once with
+EXPLAIN QUERY PLAN. Full table scans, temporary B-trees and automatic indexes are reported,
+together with suggested indexes which can also be created as statements are audited.
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+import tempfile
+
+from schedule_ascii.asr import load_db, draw
+from schedule_ascii.bench import parse_grid
+from schedule_ascii.synth import write_schedule
+from schedule_ascii.profiling import statement_kind
+
+LOG = logging.getLogger(__name__)
+
+# default fixtures, (people, days)
+DEFAULT_GRID = [(50, 28), (400, 90)]
+
+# statement kinds having a query plan
+AUDITED_KINDS = ["select", "update", "delete"]
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: LEFT-JOIN)?$")
+AUTOMATIC_INDEX = re.compile(
+    r"^SEARCH (\w+) USING AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX \((.*)\)"
+)
+TEMP_BTREE = re.compile(r"^USE TEMP B-TREE FOR ")
+
+# column compared to a value (parameter, literal or subquery) or to another column,
+# with an operator an index can be used for
+COMPARISON = re.compile(
+    r"(?:\b(\w+)\.)?\b(\w+)\s*(==|=|>=|<=|>|<|\bIN\b|\bBETWEEN\b)\s*"
+    r"(?:(\?|'[^']*'|-?\d+\b|\()|(?:\b(\w+)\.)?\b(\w+))",
+    re.I,
+)
+EQUALITY_OPERATORS = ["=", "==", "IN"]
+
+
+class QueryPlanAuditor:
+    """
+    Explain statements run by a DBAdapter, opt-in: DBAdapter only audits when an auditor is given.
+    Statements are explained on the connection they run on, before they run
+    """
+
+    def __init__(self, create_indexes=False):
+        """
+        :param create_indexes: create suggested indexes as soon as a statement is audited,
+            so that later statements run with them
+        """
+        self.create_indexes = create_indexes
+        # normalized statement: audit entry
+        self.statements = {}
+        self.created_indexes = []
+
+    def audit(self, con, request, params=()):
+        """
+        Explain a statement if its shape was not audited yet
+        :param con: sqlite connection the statement runs on
+        :param request: SQL statement
+        :param params: bound parameters
+        """
+        statement = " ".join(request.split())
+        if statement in self.statements:
+            return
+        kind = statement_kind(statement)
+        if kind not in AUDITED_KINDS:
+            return
+        entry = self.statements[statement] = self.explain(con, statement, params)
+        entry["kind"] = kind
+        if self.create_indexes and entry["suggested_indexes"]:
+            for index in entry["suggested_indexes"]:
+                LOG.info(f"creating {index}")
+                con.execute(index)
+                self.created_indexes.append(index)
+            entry["plan_after"] = [
+                detail for _, _, detail in self.plan(con, statement, params)
+            ]
+
+    def plan(self, con, statement, params):
+        """
+        :return: list of (id, parent id, detail) query plan rows
+        """
+        return [
+            (row[0], row[1], row[3])
+            for row in con.execute(f"EXPLAIN QUERY PLAN {statement}", params)
+        ]
+
+    def explain(self, con, statement, params):
+        """
+        Return audit entry of a statement: plan, findings and suggested indexes.
+        Findings are full scans of a table filtered by value or nested in a join (tables read
+        whole by an outer loop are not reported), temporary B-trees and automatic indexes
+        """
+        plan = self.plan(con, statement, params)
+        tables = {
+            name: [column[1] for column in con.execute(f"PRAGMA table_info({name})")]
+            for (name,) in con.execute(
+                "SELECT name FROM sqlite_master WHERE type='table'"
+            )
+        }
+        comparisons = parse_comparisons(statement)
+        outer_loops = {}
+        findings = []
+        suggested_indexes = []
+        for plan_id, parent_id, detail in plan:
+            if detail.startswith(("SCAN ", "SEARCH ")):
+                outer_loops.setdefault(parent_id, plan_id)
+            scan = FULL_SCAN.match(detail)
+            automatic_index = AUTOMATIC_INDEX.match(detail)
+            if scan and scan.group(1) in tables:
+                # CTEs, subqueries and materialized views are not tables and are not reported
+                table = scan.group(1)
+                columns = table_comparisons(
+                    comparisons, statement, table, tables[table]
+                )
+                nested = outer_loops[parent_id] != plan_id
+                if not nested and not any(is_value for _, _, is_value in columns):
+                    continue
+                findings.append(
+                    {
+                        "type": "full_scan",
+                        "table": table,
+                        "rows": con.execute(f"SELECT count(*) FROM {table}").fetchone()[
+                            0
+                        ],
+                        "detail": detail,
+                    }
+                )
+            elif automatic_index and automatic_index.group(1) in tables:
+                table = automatic_index.group(1)
+                findings.append(
+                    {"type": "automatic_index", "table": table, "detail": detail}
+                )
+                columns = [
+                    (column, operator, True)
+                    for _, column, operator, *_ in COMPARISON.findall(
+                        automatic_index.group(2)
+                    )
+                ]
+            elif TEMP_BTREE.match(detail):
+                findings.append({"type": "temp_btree", "table": None, "detail": detail})
+                continue
+            else:
+                continue
+            index = suggest_index(con, table, columns)
+            if index and index not in suggested_indexes:
+                suggested_indexes.append(index)
+        return {
+            "statement": statement,
+            "plan": [detail for _, _, detail in plan],
+            "findings": findings,
+            "suggested_indexes": suggested_indexes,
+        }
+
+    def report(self):
+        """
+        Return a JSON serializable report of statements having findings and suggested indexes
+        """
+        flagged = [entry for entry in self.statements.values() if entry["findings"]]
+        suggested_indexes = []
+        for entry in flagged:
+            for index in entry["suggested_indexes"]:
+                if index not in suggested_indexes:
+                    suggested_indexes.append(index)
+        return {
+            "audited": len(self.statements),
+            "flagged": len(flagged),
+            "statements": flagged,
+            "suggested_indexes": suggested_indexes,
+            "created_indexes": self.created_indexes,
+        }
+
+    def write(self, fp):
+        json.dump(self.report(), fp, indent=2)
+        fp.write("\n")
+
+
+def parse_comparisons(statement):
+    """
+    List comparisons of a statement, a comparison of two columns is listed for both columns
+    :return: list of (qualifier or "", column, operator, compared to a value)
+    """
+    comparisons = []
+    for (
+        qualifier,
+        column,
+        operator,
+        value,
+        other_qualifier,
+        other_column,
+    ) in COMPARISON.findall(statement):
+        comparisons.append((qualifier, column, operator, bool(value)))
+        if other_column:
+            comparisons.append((other_qualifier, other_column, operator, False))
+    return comparisons
+
+
+def table_comparisons(comparisons, statement, table, table_columns):
+    """
+    List (column, operator, compared to a value) of a table. Unqualified columns are only
+    attributed to the table when the statement has no join, ie when selecting from a single view
+    """
+    single_source = re.search(r"\bJOIN\b", statement, re.I) is None
+    return [
+        (column, operator, is_value)
+        for qualifier, column, operator, is_value in comparisons
+        if column in table_columns
+        and (qualifier == table or (not qualifier and single_source))
+    ]
+
+
+def suggest_index(con, table, columns):
+    """
+    Return CREATE INDEX statement of a table for compared columns, equality columns first then
+    a single range column. None if no column is compared or an existing index starts with them
+    :param con: sqlite connection
+    :param table: table name
+    :param columns: list of (column, operator, compared to a value)
+    :return:
+    """
+    equality_columns = []
+    range_columns = []
+    for column, operator, _ in columns:
+        target = (
+            equality_columns
+            if operator.upper() in EQUALITY_OPERATORS
+            else range_columns
+        )
+        if column not in target:
+            target.append(column)
+    index_columns = (
+        equality_columns
+        + [column for column in range_columns if column not in equality_columns][:1]
+    )
+    if not index_columns:
+        return None
+    # primary key first, it is the rowid or the table order of WITHOUT ROWID tables
+    primary_key = sorted(
+        (row[5], row[1]) for row in con.execute(f"PRAGMA table_info({table})") if row[5]
+    )
+    indexes = [[column for _, column in primary_key]]
+    for index in con.execute(f"PRAGMA index_list({table})").fetchall():
+        indexes.append(
+            [row[2] for row in con.execute(f"PRAGMA index_info({index[1]})")]
+        )
+    if any(indexed[: len(index_columns)] == index_columns for indexed in indexes):
+        return None
+    return (
+        f"CREATE INDEX IF NOT EXISTS {table}_{'_'.join(index_columns)}_idx "
+        f"ON {table}({', '.join(index_columns)})"
+    )
+
+
+def audit_file(json_file_path, create_indexes=False):
+    """
+    Load a JSON file to an in memory db and draw the asr report with an auditor attached
+    :return: QueryPlanAuditor
+    """
+    auditor = QueryPlanAuditor(create_indexes=create_indexes)
+    db_adapter = load_db(json_file_path, in_memory=True, persist=False, auditor=auditor)
+    draw(db_adapter, stream=io.StringIO())
+    db_adapter.close()
+    return auditor
+
+
+def compare(reports, baseline):
+    """
+    List findings that are not part of baseline reports, findings are matched by case,
+    statement, type and table
+    :param reports: {case: report}
+    :param baseline: {case: report}
+    :return: list of (case, statement, finding)
+    """
+    known = {
+        (case, entry["statement"], finding["type"], finding["table"])
+        for case, report in baseline.items()
+        for entry in report["statements"]
+        for finding in entry["findings"]
+    }
+    return [
+        (case, entry["statement"], finding)
+        for case, report in reports.items()
+        for entry in report["statements"]
+        for finding in entry["findings"]
+        if (case, entry["statement"], finding["type"], finding["table"]) not in known
+    ]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="audit.py",
+        description="Explain statements run while loading and drawing schedules, report full table scans,\n"
+        "temporary B-trees and automatic indexes with suggested indexes, and compare to a baseline report.\n"
+        "Synthetic benchmark schedules are audited unless JSON files are given",
+    )
+    parser.add_argument("json_file_paths", nargs="*", help="JSON files to audit")
+    parser.add_argument(
+        "--grid",
+        type=parse_grid,
+        default=DEFAULT_GRID,
+        help="comma separated list of peoplexdays synthetic cases, ie 50x28,400x90",
+    )
+    parser.add_argument(
+        "--create-indexes",
+        action="store_true",
+        help="create suggested indexes while auditing, plans after creation are reported",
+    )
+    parser.add_argument(
+        "-o", "--output", default="audit_report.json", help="report file"
+    )
+    parser.add_argument(
+        "--baseline",
+        help="baseline report file, findings not part of it are reported as regressions",
+    )
+
+    parsed_args = parser.parse_args()
+
+    audit_reports = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        cases = [(path, path) for path in parsed_args.json_file_paths]
+        for people, days in [] if cases else parsed_args.grid:
+            json_file_path = os.path.join(work_dir, f"audit-{people}-{days}.json")
+            write_schedule(json_file_path, people=people, days=days)
+            cases.append((f"people={people},days={days}", json_file_path))
+        for case, json_file_path in cases:
+            audit_reports[case] = audit_file(
+                json_file_path, parsed_args.create_indexes
+            ).report()
+    with open(parsed_args.output, "w") as fp:
+        json.dump(audit_reports, fp, indent=2)
+        fp.write("\n")
+
+    for case, audit_report in audit_reports.items():
+        print(
+            f"{case}: {audit_report['audited']} statements audited, {audit_report['flagged']} flagged"
+        )
+        for entry in audit_report["statements"]:
+            for finding in entry["findings"]:
+                print(f"  {finding['detail']}: {entry['statement'][:100]}")
+        for index in audit_report["suggested_indexes"]:
+            print(f"  suggested: {index}")
+
+    if parsed_args.baseline:
+        with open(parsed_args.baseline) as fp:
+            regressions = compare(audit_reports, json.load(fp))
+        for case, statement, finding in regressions:
+            print(f"REGRESSION {case}: {finding['detail']}: {statement}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,175 @@
+import io
+import os
+import sys
+import glob
+import time
+import argparse
+import traceback
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+from schedule_ascii.asr import do_draw
+from schedule_ascii.drawer import CapacityDrawer
+
+
+def draw_file(json_file_path, draw_options):
+    """
+    Draw a JSON file report to a string, errors are returned instead of raised
+    so that a malformed file does not stop the batch
+    :param json_file_path:
+    :param draw_options: do_draw keyword arguments
+    :return: tuple of (json_file_path, report, seconds, error)
+    """
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        do_draw(json_file_path, stream=output, **draw_options)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return json_file_path, output.getvalue(), time.perf_counter() - start, error
+
+
+def expand_paths(patterns):
+    """
+    Expand glob patterns and directories to a sorted list of JSON files, duplicates removed
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.json")
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return list(dict.fromkeys(paths))
+
+
+def report_names(json_file_paths):
+    """
+    Return report file names of JSON files, paths relative to the inputs common directory with a
+    .txt extension, so that files of the same name in different directories get their own report
+    """
+    if not json_file_paths:
+        return []
+    abs_paths = [os.path.abspath(json_file_path) for json_file_path in json_file_paths]
+    common_dir = os.path.commonpath([os.path.dirname(path) for path in abs_paths])
+    return [
+        os.path.splitext(os.path.relpath(path, common_dir))[0] + ".txt"
+        for path in abs_paths
+    ]
+
+
+def run(json_file_paths, workers=None, output_dir=None, stream=None, **draw_options):
+    """
+    Draw JSON files in a process pool. Each report is written at once, to stream in input order
+    or to output_dir/<relative path>.txt (see report_names), so that reports are never interleaved.
+    A crashed worker process fails the files it did not complete, other files are still reported
+    :param json_file_paths: list of JSON files
+    :param workers: count of worker processes, defaults to cpu count
+    :param output_dir: directory of report files, reports are written to stream if not set
+    :param stream: text stream, defaults to sys.stdout
+    :param draw_options: do_draw keyword arguments
+    :return: list of (json_file_path, seconds, error) in input order
+    """
+    stream = stream if stream is not None else sys.stdout
+    summary = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(draw_file, json_file_path, draw_options)
+            for json_file_path in json_file_paths
+        ]
+        # results are consumed in input order, later files keep running meanwhile
+        for json_file_path, report_name, future in zip(
+            json_file_paths, report_names(json_file_paths), futures
+        ):
+            try:
+                json_file_path, report, seconds, error = future.result()
+            except BrokenProcessPool:
+                report, seconds = "", 0.0
+                error = traceback.format_exc()
+            if output_dir:
+                report_path = os.path.join(output_dir, report_name)
+                os.makedirs(os.path.dirname(report_path), exist_ok=True)
+                with open(report_path, "w") as fp:
+                    fp.write(report)
+            else:
+                stream.write(f"==> {json_file_path} <==\n{report}")
+                stream.flush()
+            summary.append((json_file_path, seconds, error))
+    return summary
+
+
+def draw_summary(summary, stream=None):
+    """
+    Write per file timings and failures table
+    """
+    stream = stream if stream is not None else sys.stdout
+    width = max([len("file")] + [len(path) for path, _, _ in summary]) + 2
+    template = f"{{:<{width}}}{{:<10}}{{:>10}}\n"
+    stream.write(template.format("file", "status", "seconds"))
+    for json_file_path, seconds, error in summary:
+        stream.write(
+            template.format(
+                json_file_path, "FAILED" if error else "ok", f"{seconds:.3f}"
+            )
+        )
+    for json_file_path, _, error in summary:
+        if error:
+            stream.write(f"\n{json_file_path}:\n{error}")
+    failures = sum(1 for _, _, error in summary if error)
+    stream.write(f"\n{len(summary)} files, {failures} failed\n")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="batch.py",
+        description="Draw many JSON files in parallel, each file gets its own sqlite db and report\n",
+    )
+    parser.add_argument(
+        "json_file_paths", nargs="+", help="JSON files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="count of worker processes",
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="write each report to OUTPUT_DIR/<file path>.txt instead of stdout, "
+        "file paths are relative to the JSON files common directory",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse sqlite files when JSON content and schema version did not change",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="load and compute in memory dbs, then snapshot them to sqlite files",
+    )
+    parser.add_argument(
+        "--capacity-backend",
+        choices=CapacityDrawer.BACKENDS,
+        default="sql",
+        help="capacity computation backend, numpy backend requires numpy",
+    )
+
+    parsed_args = parser.parse_args()
+
+    if parsed_args.output_dir:
+        os.makedirs(parsed_args.output_dir, exist_ok=True)
+    batch_summary = run(
+        expand_paths(parsed_args.json_file_paths),
+        workers=parsed_args.workers,
+        output_dir=parsed_args.output_dir,
+        cache=parsed_args.cache,
+        in_memory=parsed_args.memory,
+        capacity_backend=parsed_args.capacity_backend,
+    )
+    # summary goes to stderr so that stdout only holds reports
+    draw_summary(batch_summary, sys.stderr)
+
+    if any(error for _, _, error in batch_summary):
+        sys.exit(1)
@@ -0,0 +1,223 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import concurrent.futures
+
+from schedule_ascii.db import DBAdapter
+from schedule_ascii.synth import write_schedule
+from schedule_ascii.parser import JSONParser
+from schedule_ascii.drawer import ScheduleDrawer, CapacityDrawer
+
+# default scaling grid, (people, days)
+DEFAULT_GRID = [(50, 28), (200, 90), (400, 90), (400, 365)]
+
+STAGES = ["parse", "store", "capacity", "grid"]
+
+
+def run_case(json_file_path, people, days):
+    """
+    Time each pipeline stage of a generated schedule, meant to run in a fresh process
+    so that peak RSS is the one of loading and drawing this case
+    :param json_file_path: generated schedule, sqlite file is written next to it
+    :param people: count of people
+    :param days: count of days
+    :return: case result dict
+    """
+    db_adapter = DBAdapter(json_file_path[:-5] + ".sqlite")
+    db_adapter.init_tables(indexes=False)
+    output = io.StringIO()
+    timings = {}
+
+    start = time.perf_counter()
+    json_parser = JSONParser(json_file_path)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    json_parser.store(db_adapter)
+    timings["store"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    CapacityDrawer(db_adapter, stream=output).draw()
+    timings["capacity"] = time.perf_counter() - start
+
+    # tasks grid only, other schedule tables are not timed
+    schedule_drawer = ScheduleDrawer(db_adapter, stream=output)
+    schedule_drawer.init_shift_ascii_display()
+    start = time.perf_counter()
+    schedule_drawer.draw_tasks()
+    schedule_drawer.flush()
+    timings["grid"] = time.perf_counter() - start
+
+    rows = sum(
+        db_adapter.select(table, ["count(*)"])[0][0]
+        for table, in db_adapter.select("sqlite_master", ["name"], "type=?", ("table",))
+    )
+    shift_count = db_adapter.select("shift", ["count(*)"])[0][0]
+    throughputs = {
+        "parse": rows / timings["parse"],
+        "store": rows / timings["store"],
+        "capacity": shift_count * days / timings["capacity"],
+        "grid": people * days / timings["grid"],
+    }
+    return {
+        "case": f"people={people},days={days}",
+        "people": people,
+        "days": days,
+        "rows": rows,
+        "seconds": timings,
+        # rows/s for parse & store, cells/s for capacity & grid
+        "throughput": throughputs,
+        # ru_maxrss is in KiB on linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run(grid, **kwargs):
+    """
+    Run all cases of the scaling grid. Each schedule is generated in its own process,
+    then measured in another fresh process, so that generator memory is not part of peak RSS
+    :param grid: list of (people, days)
+    :param kwargs: other generate_schedule parameters
+    :return: list of case results
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for people, days in grid:
+            json_file_path = os.path.join(work_dir, f"bench-{people}-{days}.json")
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                executor.submit(
+                    write_schedule, json_file_path, people=people, days=days, **kwargs
+                ).result()
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                results.append(
+                    executor.submit(run_case, json_file_path, people, days).result()
+                )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare stage timings to baseline results
+    :param results: list of case results
+    :param baseline: list of baseline case results
+    :param tolerance: accepted slowdown ratio, ie 0.2 for 20%
+    :return: list of (case, stage, baseline seconds, seconds, ratio, is_regression)
+    """
+    baseline_cases = {result["case"]: result for result in baseline}
+    comparisons = []
+    for result in results:
+        baseline_result = baseline_cases.get(result["case"])
+        if baseline_result is None:
+            continue
+        for stage in STAGES:
+            baseline_seconds = baseline_result["seconds"][stage]
+            seconds = result["seconds"][stage]
+            ratio = seconds / baseline_seconds if baseline_seconds else 1.0
+            comparisons.append(
+                (
+                    result["case"],
+                    stage,
+                    baseline_seconds,
+                    seconds,
+                    ratio,
+                    ratio > 1 + tolerance,
+                )
+            )
+    return comparisons
+
+
+def print_results(results, comparisons):
+    block = "{:<24}{:<10}{:>12}{:>16}{:>12}"
+    print(block.format("case", "stage", "seconds", "throughput", "rss (MB)"))
+    for result in results:
+        for stage in STAGES:
+            print(
+                block.format(
+                    result["case"],
+                    stage,
+                    f"{result['seconds'][stage]:.3f}",
+                    f"{result['throughput'][stage]:.0f}",
+                    f"{result['peak_rss_mb']:.1f}",
+                )
+            )
+    if comparisons:
+        print()
+        print(block.format("case", "stage", "baseline", "seconds", "ratio"))
+        for case, stage, baseline_seconds, seconds, ratio, is_regression in comparisons:
+            line = block.format(
+                case, stage, f"{baseline_seconds:.3f}", f"{seconds:.3f}", f"{ratio:.2f}"
+            )
+            print(f"{line}  REGRESSION" if is_regression else line)
+
+
+def parse_grid(value):
+    """
+    Parse a "people x days" list, ie "50x28,400x365"
+    """
+    try:
+        return [
+            tuple(int(item) for item in case.split("x")) for case in value.split(",")
+        ]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid grid {value}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="bench.py",
+        description="Time JSON parse, db store, capacity and grid drawing on synthetic schedules\n"
+        "across a scaling grid, save results to a JSON file and compare them to a baseline\n",
+    )
+    parser.add_argument(
+        "--grid",
+        type=parse_grid,
+        default=DEFAULT_GRID,
+        help="comma separated list of peoplexdays cases, ie 50x28,400x365",
+    )
+    parser.add_argument("--shifts", type=int, default=12)
+    parser.add_argument("--labels", type=int, default=1)
+    parser.add_argument("--coverage-density", type=float, default=0.5)
+    parser.add_argument("--preallocations", type=int, default=2)
+    parser.add_argument("--exclusions", type=int, default=10)
+    parser.add_argument("--exclusion-fan-out", type=int, default=10)
+    parser.add_argument(
+        "-o", "--output", default="bench_results.json", help="results file"
+    )
+    parser.add_argument("--baseline", help="baseline results file to compare to")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="accepted slowdown ratio before a stage is reported as a regression",
+    )
+
+    parsed_args = parser.parse_args()
+
+    bench_results = run(
+        parsed_args.grid,
+        shifts=parsed_args.shifts,
+        labels=parsed_args.labels,
+        coverage_density=parsed_args.coverage_density,
+        preallocations=parsed_args.preallocations,
+        exclusions=parsed_args.exclusions,
+        exclusion_fan_out=parsed_args.exclusion_fan_out,
+    )
+    with open(parsed_args.output, "w") as fp:
+        json.dump(bench_results, fp, indent=2)
+
+    bench_comparisons = []
+    if parsed_args.baseline:
+        with open(parsed_args.baseline) as fp:
+            bench_comparisons = compare(
+                bench_results, json.load(fp), parsed_args.tolerance
+            )
+    print_results(bench_results, bench_comparisons)
+
+    if any(comparison[-1] for comparison in bench_comparisons):
+        sys.exit(1)
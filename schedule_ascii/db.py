@@ -1,158 +1,722 @@
 import os
+import json
+import time
 import logging
 import sqlite3
+import contextlib
 
 LOG = logging.getLogger(__name__)
 
+# default number of rows sent per executemany call
+DEFAULT_BATCH_SIZE = 5000
+
+# count of prepared statements kept by the sqlite connection, statements are looked up by SQL text
+DEFAULT_STATEMENT_CACHE_SIZE = 256
+
+# count of rows fetched at once from streamed results, see DBAdapter.execute
+STREAM_FETCH_SIZE = 1000
+
+# tuned settings for a throwaway derived db: no fsync, rollback journal and temp tables in memory, 64MiB page cache
+FAST_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -65536,
+    "temp_store": "MEMORY",
+}
+
+# bump when tables layout or stored data changes, invalidates cached db files
+SCHEMA_VERSION = 4
+
+# tables storing person & shift ids as integer keys, with their columns.
+# Rows are stored in <table>_data tables and read through <table> views
+KEYED_TABLES = {
+    "task": ("id", "person_id", "shift_id", "day"),
+    "coverage": ("id", "min_value", "max_value", "shift_id", "day", "pool_id"),
+    "preallocation": ("id", "shift_id", "person_id", "type", "day"),
+    "exclusion_person": ("rule_id", "person_id"),
+    "exclusion_shift": ("rule_id", "shift_id"),
+    "pool_person": ("pool_id", "person_id"),
+    "shift_label": ("shift_id", "label"),
+}
+
+# id columns replaced by keys, with their lookup table prefix
+KEY_COLUMNS = {"person_id": "person", "shift_id": "shift"}
+
 
 class DBAdapter:
     """
     Singleton class that handles database
     """
 
-    def __init__(self, db_filename):
+    def __init__(
+        self,
+        db_filename,
+        batch_size=DEFAULT_BATCH_SIZE,
+        reset=True,
+        profiler=None,
+        statement_cache_size=DEFAULT_STATEMENT_CACHE_SIZE,
+        in_memory=False,
+        pragmas=None,
+        auditor=None,
+    ):
+        """
+        :param db_filename: sqlite file path
+        :param batch_size: number of rows per executemany call when bulk inserting
+        :param reset: delete any existing sqlite file, set to False to reuse a cached db
+        :param profiler: optional profiling.Profiler, statements are timed and counted when set
+        :param statement_cache_size: count of prepared statements reused by the connection
+        :param in_memory: work on a :memory: db, db_filename is only written by snapshot.
+            If reset is False, existing db_filename content is loaded to memory
+        :param pragmas: dict of PRAGMA settings applied on connection, ie FAST_PRAGMAS
+        :param auditor: optional audit.QueryPlanAuditor, statements are explained before they run when set
+        """
+        self.db_filename = db_filename
+        self.batch_size = batch_size
+        self.profiler = profiler
+        self.statement_cache_size = statement_cache_size
+        self.in_memory = in_memory
+        self.pragmas = pragmas or {}
+        self.auditor = auditor
+
+        # delete any existing sqlite file, in memory db files are overwritten by snapshot
+        if reset and not in_memory:
+            self.delete_file()
+
+        # init sqlite connector and cursor
+        self.connect(load_file=not reset)
+
+    def connect(self, load_file=False):
+        """
+        Open sqlite connection and cursor, prepared statements are cached by the connection
+        :param load_file: for in memory db, load existing db file content
+        :return:
+        """
+        if self.in_memory:
+            self.con = sqlite3.connect(
+                ":memory:", cached_statements=self.statement_cache_size
+            )
+            if load_file and os.path.exists(self.db_filename):
+                with contextlib.closing(sqlite3.connect(self.db_filename)) as file_con:
+                    file_con.backup(self.con)
+        else:
+            self.con = sqlite3.connect(
+                self.db_filename, cached_statements=self.statement_cache_size
+            )
+        self.cur = self.con.cursor()
+        # person & shift id: key, loaded on first insert, see key
+        self.keys = None
+        for name, value in self.pragmas.items():
+            self.execute(f"PRAGMA {name}={value}")
+
+    def snapshot(self, db_filename=None):
+        """
+        Write db content to a file using sqlite online backup API, existing file content is replaced
+        :param db_filename: target file, defaults to db_filename
+        :return:
+        """
+        db_filename = db_filename or self.db_filename
+        if not self.in_memory and os.path.abspath(db_filename) == os.path.abspath(
+            self.db_filename
+        ):
+            return
+        self.commit()
+        LOG.info(f"snapshot db to {db_filename}")
+        with contextlib.closing(sqlite3.connect(db_filename)) as file_con:
+            self.con.backup(file_con)
+
+    def execute(self, request, params=(), many=False, fetch=False, stream=False):
+        """
+        Execute a statement, all statements go through this method so that they can be profiled and audited
+        :param request: SQL statement
+        :param params: bound parameters, or list of parameter rows if many is set
+        :param many: use executemany
+        :param fetch: fetch all result rows, so that fetching is included in profiled time
+        :param stream: iterate result rows as they are fetched, fetching is included in profiled time
+            and the statement is recorded once rows are exhausted or the iterator is closed
+        :return: cursor, list of rows if fetch is set, or rows iterator if stream is set
+        """
+        execute = self.cur.executemany if many else self.cur.execute
+        if self.auditor is not None and not many:
+            self.auditor.audit(self.con, request, params)
+        if self.profiler is None:
+            cursor = execute(request, params)
+            return cursor.fetchall() if fetch else cursor
+        start = time.perf_counter()
+        if stream:
+            cursor = execute(request, params)
+            return self._timed_rows(request, cursor, time.perf_counter() - start)
+        try:
+            cursor = execute(request, params)
+            return cursor.fetchall() if fetch else cursor
+        finally:
+            self.profiler.record(
+                request, time.perf_counter() - start, len(params) if many else 1
+            )
+
+    def _timed_rows(self, request, cursor, seconds):
+        """
+        Yield cursor rows, fetch time is added to seconds and recorded when done
+        """
+        try:
+            while True:
+                start = time.perf_counter()
+                rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+                seconds += time.perf_counter() - start
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            self.profiler.record(request, seconds)
+
+    def span(self, name):
+        """
+        Return a profiler timing span, or a no-op context if profiling is off
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.span(name)
 
-        # delete any existing sqlite file
+    def close(self):
+        """
+        Commit pending changes and close sqlite connection
+        """
+        self.commit()
+        self.con.close()
+
+    def delete_file(self):
         try:
-            os.remove(db_filename)
-            LOG.info(f"file {db_filename} deleted")
+            os.remove(self.db_filename)
+            LOG.info(f"file {self.db_filename} deleted")
         except FileNotFoundError:
             pass
 
-        # init sqlite connector and cursor
-        self.con = sqlite3.connect(db_filename)
-        self.cur = self.con.cursor()
+    def reset(self):
+        """
+        Delete sqlite file (file backed db) and reconnect to a new empty db
+        :return:
+        """
+        self.con.close()
+        if not self.in_memory:
+            self.delete_file()
+        self.connect()
+
+    def is_cached(self, source_hash):
+        """
+        Check whether db content was built from a source with the given hash using current schema version
+        :param source_hash: hash of the source JSON file
+        :return:
+        """
+        if not self.select(
+            "sqlite_master", ["name"], "type='table' AND name=?", ("meta",)
+        ):
+            return False
+        meta = dict(self.select("meta", ["key", "value"]))
+        return (
+            meta.get("source_hash") == source_hash
+            and meta.get("schema_version") == SCHEMA_VERSION
+        )
 
-    def init_tables(self):
+    def store_cache_key(self, source_hash):
         """
-        Create db tables
+        Store source hash and schema version, to be checked by is_cached on later runs
+        :param source_hash: hash of the source JSON file
         :return:
         """
-        # base resources
-        self.cur.execute(
-            "CREATE TABLE schedule(id INTEGER PRIMARY KEY, start_day, time_span_days)"
+        self.execute("CREATE TABLE IF NOT EXISTS meta(key VARCHAR PRIMARY KEY, value)")
+        self.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+            [("source_hash", source_hash), ("schema_version", SCHEMA_VERSION)],
+            many=True,
+        )
+        self.commit()
+
+    def init_tables(self, indexes=True):
+        """
+        Create db tables.
+        Person and shift ids are stored once in person_key & shift_key lookup tables, other tables
+        reference them by integer key. Tables listed in KEYED_TABLES are stored as <table>_data
+        and read through a <table> view with the original columns, see bulk_insert
+        :param indexes: create indexes as well, set to False when bulk loading and call create_indexes once data is in
+        :return:
+        """
+        # id lookup tables, people and shifts may be referenced without their own row
+        self.execute(
+            "CREATE TABLE person_key(key INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE)"
+        )
+        self.execute(
+            "CREATE TABLE shift_key(key INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE)"
+        )
+
+        # base resources, rowid keeps insertion order
+        self.execute(
+            "CREATE TABLE schedule(id INTEGER PRIMARY KEY, start_day TEXT, time_span_days INTEGER)"
+        )
+        self.execute(
+            "CREATE TABLE person(key INTEGER NOT NULL UNIQUE, id TEXT NOT NULL UNIQUE, activity_rate, night_count, weekend_count, target_hours, holiday_hours, effective_hours, debt_hours, FOREIGN KEY (key) REFERENCES person_key(key))"
         )
-        self.cur.execute(
-            "CREATE TABLE person(id VARCHAR PRIMARY KEY, activity_rate, night_count, weekend_count, target_hours, holiday_hours, effective_hours, debt_hours)"
+        self.execute(
+            "CREATE TABLE shift(key INTEGER NOT NULL UNIQUE, id TEXT NOT NULL UNIQUE, display_name TEXT, ascii_display TEXT, duration, start_time TEXT, end_time TEXT, FOREIGN KEY (key) REFERENCES shift_key(key))"
         )
-        self.cur.execute(
-            "CREATE TABLE shift(id VARCHAR PRIMARY KEY, display_name, ascii_display, duration, start_time, end_time)"
+        # tasks are clustered by person and day, the order tasks grid and diff read them in
+        self.execute(
+            "CREATE TABLE task_data(id INTEGER NOT NULL, person_key INTEGER NOT NULL, shift_key INTEGER NOT NULL, day INTEGER NOT NULL, PRIMARY KEY (person_key, day, id), FOREIGN KEY (shift_key) REFERENCES shift_key(key), FOREIGN KEY (person_key) REFERENCES person_key(key)) WITHOUT ROWID"
         )
-        self.cur.execute(
-            "CREATE TABLE task(id INTEGER PRIMARY KEY, person_id, shift_id, day, FOREIGN KEY (shift_id) REFERENCES shift(id), FOREIGN KEY (person_id) REFERENCES person(id))"
+        # min & max values may be ints or floats and are left untyped so that they are read back as given
+        self.execute(
+            "CREATE TABLE coverage_data(id INTEGER PRIMARY KEY, min_value, max_value, shift_key INTEGER NOT NULL, day INTEGER NOT NULL, pool_id INTEGER NOT NULL, FOREIGN KEY (shift_key) REFERENCES shift_key(key), FOREIGN KEY (pool_id) REFERENCES people_pool(id))"
         )
-        self.cur.execute(
-            "CREATE TABLE coverage(id INTEGER PRIMARY KEY, min_value, max_value, shift_id, day, FOREIGN KEY (shift_id) REFERENCES shift(id))"
+        # distinct coverage people lists, shared by all coverages having the same list
+        self.execute("CREATE TABLE people_pool(id INTEGER PRIMARY KEY)")
+        self.execute(
+            "CREATE TABLE preallocation_data(id INTEGER PRIMARY KEY, shift_key INTEGER NOT NULL, person_key INTEGER NOT NULL, type INTEGER, day INTEGER NOT NULL, FOREIGN KEY (shift_key) REFERENCES shift_key(key), FOREIGN KEY (person_key) REFERENCES person_key(key))"
         )
-        self.cur.execute(
-            "CREATE TABLE preallocation(id INTEGER PRIMARY KEY, shift_id, person_id, type, day, FOREIGN KEY (shift_id) REFERENCES shift(id), FOREIGN KEY (person_id) REFERENCES person(id))"
+        # day exclusion rules: people x shifts x days of a rule are excluded, see exclusion view
+        self.execute("CREATE TABLE exclusion_rule(id INTEGER PRIMARY KEY)")
+        self.execute(
+            "CREATE TABLE exclusion_person_data(rule_id INTEGER NOT NULL, person_key INTEGER NOT NULL, FOREIGN KEY (rule_id) REFERENCES exclusion_rule(id), FOREIGN KEY (person_key) REFERENCES person_key(key))"
         )
-        self.cur.execute(
-            "CREATE TABLE exclusion(id INTEGER PRIMARY KEY, shift_id, person_id, day, FOREIGN KEY (shift_id) REFERENCES shift(id), FOREIGN KEY (person_id) REFERENCES person(id))"
+        self.execute(
+            "CREATE TABLE exclusion_shift_data(rule_id INTEGER NOT NULL, shift_key INTEGER NOT NULL, FOREIGN KEY (rule_id) REFERENCES exclusion_rule(id), FOREIGN KEY (shift_key) REFERENCES shift_key(key))"
         )
-        self.cur.execute(
+        self.execute(
+            "CREATE TABLE exclusion_day(rule_id INTEGER NOT NULL, day INTEGER NOT NULL, FOREIGN KEY (rule_id) REFERENCES exclusion_rule(id))"
+        )
+        self.execute(
             """
-            CREATE TABLE shift_label(shift_id VARCHAR,
-              label,
-              FOREIGN KEY (shift_id) REFERENCES shift(id))
+            CREATE TABLE shift_label_data(shift_key INTEGER NOT NULL,
+              label TEXT,
+              FOREIGN KEY (shift_key) REFERENCES shift_key(key))
             """
         )
-        self.cur.execute(
+        self.execute(
             """
-            CREATE TABLE task_label(task_id INTEGER,
-              label,
-              FOREIGN KEY (task_id) REFERENCES task(id))
+            CREATE TABLE task_label(task_id INTEGER NOT NULL,
+              label TEXT,
+              FOREIGN KEY (task_id) REFERENCES task_data(id))
             """
         )
         # Liaison tables
-        self.cur.execute(
+        self.execute(
             """
-            CREATE TABLE coverage_person(id INTEGER PRIMARY KEY,
-              coverage_id,
-              person_id,
-              FOREIGN KEY (coverage_id) REFERENCES coverage(id),
-              FOREIGN KEY (person_id) REFERENCES person(id))
+            CREATE TABLE pool_person_data(pool_id INTEGER NOT NULL,
+              person_key INTEGER NOT NULL,
+              FOREIGN KEY (pool_id) REFERENCES people_pool(id),
+              FOREIGN KEY (person_key) REFERENCES person_key(key))
             """
         )
 
-        # indexes
-        self.cur.execute(
-            "CREATE INDEX preallocation_idx ON preallocation(person_id, day)"
+        # views with person & shift ids
+        for table, columns in KEYED_TABLES.items():
+            self.create_keyed_view(table, columns)
+        self.execute(
+            """
+            CREATE VIEW exclusion(rule_id, shift_id, person_id, day) AS
+            SELECT exclusion_person.rule_id, exclusion_shift.shift_id, exclusion_person.person_id, exclusion_day.day
+            FROM exclusion_person
+            INNER JOIN exclusion_shift ON exclusion_shift.rule_id=exclusion_person.rule_id
+            INNER JOIN exclusion_day ON exclusion_day.rule_id=exclusion_person.rule_id
+            """
         )
-        self.cur.execute("CREATE INDEX task_idx ON task(person_id, day)")
-        self.cur.execute("CREATE INDEX coverage_idx ON coverage(shift_id, day)")
-        self.cur.execute(
-            "CREATE INDEX exclusion_idx ON exclusion(person_id, day, shift_id)"
+        self.execute(
+            """
+            CREATE VIEW coverage_person(coverage_id, person_id) AS
+            SELECT coverage_data.id, person_key.id FROM coverage_data
+            INNER JOIN pool_person_data ON pool_person_data.pool_id=coverage_data.pool_id
+            INNER JOIN person_key ON person_key.key=pool_person_data.person_key
+            """
         )
-        self.cur.execute(
-            "CREATE INDEX coverage_person_idx ON coverage_person(coverage_id, person_id)"
+
+        if indexes:
+            self.create_indexes()
+
+    def create_keyed_view(self, table, columns):
+        """
+        Create view of a <table>_data table, person & shift keys are replaced by their ids
+        :param table: view name
+        :param columns: view columns, in <table>_data columns order
+        :return:
+        """
+        # tables are not aliased so that query plans name them, each lookup table is joined once at most
+        data_table = f"{table}_data"
+        selected = []
+        joins = []
+        for column in columns:
+            kind = KEY_COLUMNS.get(column)
+            if kind is None:
+                selected.append(f"{data_table}.{column}")
+                continue
+            selected.append(f"{kind}_key.id")
+            joins.append(
+                f"INNER JOIN {kind}_key ON {kind}_key.key={data_table}.{kind}_key"
+            )
+        self.execute(
+            f"""
+            CREATE VIEW {table}({', '.join(columns)}) AS
+            SELECT {', '.join(selected)} FROM {data_table}
+            {' '.join(joins)}
+            """
         )
 
-    def select(self, table, columns, where_close=None):
+    def create_indexes(self):
+        """
+        Create db indexes, existing ones are left untouched.
+        Indexes include the columns read by drawer queries so that these queries do not read table rows
+        :return:
+        """
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS preallocation_idx ON preallocation_data(person_key, day, type, shift_key)"
+        )
+        self.execute("CREATE INDEX IF NOT EXISTS task_id_idx ON task_data(id)")
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS task_label_idx ON task_label(task_id, label)"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS shift_label_idx ON shift_label_data(shift_key, label)"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS coverage_idx ON coverage_data(shift_key, day, pool_id, min_value)"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS exclusion_person_idx ON exclusion_person_data(person_key, rule_id)"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS exclusion_shift_idx ON exclusion_shift_data(rule_id, shift_key)"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS exclusion_day_idx ON exclusion_day(rule_id, day)"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS pool_person_idx ON pool_person_data(pool_id, person_key)"
+        )
+
+    def select(self, table, columns, where_close=None, params=()):
+        """
+        Select columns of a table
+        :param table: table name
+        :param columns: list of columns
+        :param where_close: optional WHERE clause, values are given as ? placeholders
+        :param params: values bound to where_close placeholders
+        :return: list of rows
+        """
         request = f"""
             SELECT {','.join(columns)} FROM {table}
         """
-        LOG.debug(f"{request} WHERE {where_close}")
+        LOG.debug(f"{request} WHERE {where_close} {params}")
         if where_close:
             request = f"{request} WHERE {where_close}"
 
-        return self.cur.execute(request).fetchall()
+        return self.execute(request, params, fetch=True)
 
-    def select_person_nights(self):
+    def refresh_person_aggregates(self, person_ids=None):
         """
-        Count number of nights for each person
+        Refresh night_count, weekend_count and effective_hours of people with a single set based UPDATE,
+        aggregates are computed by grouped subqueries restricted to the refreshed people
+        :param person_ids: list of people to refresh, defaults to all people
+        :return:
         """
+        person_where = ""
+        params = ()
+        if person_ids is not None:
+            person_where = "WHERE id IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(list(person_ids)),)
         request = f"""
-            SELECT person_id, count(*) FROM task INNER JOIN shift on task.shift_id=shift.id FULL JOIN shift_label ON
-            shift.id=shift_label.shift_id WHERE label='night' group by person_id
+            WITH target(key) AS (SELECT key FROM person {person_where}),
+            nights(person_key, night_count) AS (
+                SELECT person_key, count(*) FROM task_data INNER JOIN shift ON task_data.shift_key=shift.key
+                INNER JOIN shift_label_data ON shift.key=shift_label_data.shift_key
+                WHERE label='night' AND person_key IN target GROUP BY person_key
+            ),
+            weekends(person_key, weekend_count) AS (
+                SELECT person_key, count(*) FROM task_data INNER JOIN task_label ON task_label.task_id=task_data.id
+                WHERE label='weekend' AND person_key IN target GROUP BY person_key
+            ),
+            hours(person_key, effective_hours) AS (
+                SELECT person_key, sum(duration) FROM task_data INNER JOIN shift ON shift.key=task_data.shift_key
+                WHERE person_key IN target GROUP BY person_key
+            )
+            UPDATE person SET
+                night_count=coalesce(nights.night_count, 0),
+                weekend_count=coalesce(weekends.weekend_count, 0),
+                effective_hours=coalesce(hours.effective_hours, 0)
+            FROM target
+            LEFT JOIN nights ON nights.person_key=target.key
+            LEFT JOIN weekends ON weekends.person_key=target.key
+            LEFT JOIN hours ON hours.person_key=target.key
+            WHERE person.key=target.key
         """
         LOG.debug(request)
-        return self.cur.execute(request).fetchall()
+        return self.execute(request, params)
 
-    def select_person_weekends(self):
+    def select_coverage_needs(self, first_day, last_day):
         """
-        Count number of weekends for each person
+        Sum minimal coverage for each shift and day, from first_day included to last_day excluded.
+        Coverages are range scanned for each shift using coverage_idx (CROSS JOIN forces join order)
         """
         request = f"""
-            SELECT person_id, count(*) FROM task INNER JOIN task_label ON task_label.task_id=task.id where label='weekend' GROUP BY person_id
+            SELECT shift.id, coverage_data.day, sum(coverage_data.min_value) FROM shift
+            CROSS JOIN coverage_data ON coverage_data.shift_key=shift.key
+            AND coverage_data.day >= ? AND coverage_data.day < ?
+            GROUP BY shift.key, coverage_data.day
         """
         LOG.debug(request)
-        return self.cur.execute(request).fetchall()
+        return self.execute(request, (first_day, last_day), fetch=True)
 
-    def select_person_effective_hours(self):
+    def select_coverage_people(self, first_day, last_day):
         """
-        Sum effective hours for each person
+        List people of each coverage people list, with coverage shift and day,
+        from first_day included to last_day excluded.
+        Coverages reference a shared people pool, pool people are read using pool_person_idx
         """
         request = f"""
-            SELECT person_id, sum(duration) FROM task INNER JOIN shift ON shift.id=task.shift_id GROUP BY person_id
+            SELECT shift.id, coverage_data.day, person_key.id FROM shift
+            CROSS JOIN coverage_data ON coverage_data.shift_key=shift.key
+            AND coverage_data.day >= ? AND coverage_data.day < ?
+            CROSS JOIN pool_person_data ON pool_person_data.pool_id=coverage_data.pool_id
+            CROSS JOIN person_key ON person_key.key=pool_person_data.person_key
         """
         LOG.debug(request)
-        return self.cur.execute(request).fetchall()
+        return self.execute(request, (first_day, last_day), fetch=True)
+
+    # people available for a coverage shift and day: part of the coverage people list,
+    # not preallocated on another shift or not working and not excluded.
+    # Exclusion rules of each person are looked up using exclusion_person_idx, then rule day and shift
+    AVAILABLE_PEOPLE = """
+        FROM shift
+        CROSS JOIN coverage_data ON coverage_data.shift_key=shift.key
+        AND coverage_data.day >= ? AND coverage_data.day < ?
+        CROSS JOIN pool_person_data ON pool_person_data.pool_id=coverage_data.pool_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM preallocation_data
+            WHERE preallocation_data.person_key=pool_person_data.person_key
+            AND preallocation_data.day=coverage_data.day
+            AND (preallocation_data.type!=2 OR preallocation_data.shift_key!=coverage_data.shift_key)
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM exclusion_person_data
+            CROSS JOIN exclusion_day ON exclusion_day.rule_id=exclusion_person_data.rule_id
+            AND exclusion_day.day=coverage_data.day
+            CROSS JOIN exclusion_shift_data ON exclusion_shift_data.rule_id=exclusion_person_data.rule_id
+            AND exclusion_shift_data.shift_key=coverage_data.shift_key
+            WHERE exclusion_person_data.person_key=pool_person_data.person_key
+        )
+    """
+
+    def select_capacities(self, first_day, last_day):
+        """
+        Count people available for each shift and day, from first_day included to last_day excluded,
+        a person listed by several coverages of a shift and day is counted once
+        """
+        request = f"""
+            SELECT shift.id, coverage_data.day, count(DISTINCT pool_person_data.person_key)
+            {self.AVAILABLE_PEOPLE}
+            GROUP BY shift.key, coverage_data.day
+        """
+        LOG.debug(request)
+        return self.execute(request, (first_day, last_day), fetch=True)
+
+    def select_total_capacities(self, first_day, last_day):
+        """
+        Count people available for at least 1 shift on each day, from first_day included to last_day excluded.
+        Days without available people are not listed
+        """
+        request = f"""
+            SELECT coverage_data.day, count(DISTINCT pool_person_data.person_key)
+            {self.AVAILABLE_PEOPLE}
+            GROUP BY coverage_data.day
+        """
+        LOG.debug(request)
+        return self.execute(request, (first_day, last_day), fetch=True)
+
+    def select_exclusion_rules(self, first_day, last_day):
+        """
+        List day exclusion rules having days from first_day included to last_day excluded
+        :return: list of (shift ids, person ids, days) of each rule, days are restricted to the given ones
+        """
+        rules = {}
+        for rule_id, day in self.select(
+            "exclusion_day",
+            ["rule_id", "day"],
+            "day >= ? AND day < ?",
+            (first_day, last_day),
+        ):
+            rules.setdefault(rule_id, ([], [], []))[2].append(day)
+        for rule_id, shift_id in self.select(
+            "exclusion_shift", ["rule_id", "shift_id"]
+        ):
+            if rule_id in rules:
+                rules[rule_id][0].append(shift_id)
+        for rule_id, person_id in self.select(
+            "exclusion_person", ["rule_id", "person_id"]
+        ):
+            if rule_id in rules:
+                rules[rule_id][1].append(person_id)
+        return list(rules.values())
 
     def select_person_tasks(self, person_id):
         """
-        Count number of weekends for each person
+        List tasks display and day of a person
+        """
+
+        request = f"""
+            SELECT shift.ascii_display, task_data.day FROM person_key
+            CROSS JOIN task_data ON task_data.person_key=person_key.key
+            INNER JOIN shift ON shift.key=task_data.shift_key
+            WHERE person_key.id=?
+        """
+        LOG.debug(request)
+        return self.execute(request, (person_id,), fetch=True)
+
+    def select_tasks_grid(self, first_day, last_day):
+        """
+        List all people tasks display and day, from first_day included to last_day excluded,
+        ordered by person (person table order) then day. Tasks are range scanned for each person in task_data order.
+        People without task get a single (person_id, None, None) row
         """
+        request = f"""
+            SELECT person.id, task_data.day, shift.ascii_display FROM person
+            LEFT JOIN task_data ON task_data.person_key=person.key
+            AND task_data.day >= ? AND task_data.day < ?
+            LEFT JOIN shift ON shift.key=task_data.shift_key
+            ORDER BY person.rowid, task_data.day, task_data.id
+        """
+        LOG.debug(request)
+        return self.execute(request, (first_day, last_day), stream=True)
 
+    def select_task_keys(self, first_day, last_day):
+        """
+        List (person_id, day, shift_id) of tasks, from first_day included to last_day excluded,
+        sorted by person id, day and task id. People are read in person_key id index order, then
+        their tasks in task_data order, so no sort is needed
+        """
         request = f"""
-            SELECT ascii_display, day FROM task INNER JOIN shift ON shift.id=task.shift_id where person_id='{person_id}'
+            SELECT person_key.id, task_data.day, shift_key.id FROM person_key
+            CROSS JOIN task_data ON task_data.person_key=person_key.key
+            AND task_data.day >= ? AND task_data.day < ?
+            INNER JOIN shift_key ON shift_key.key=task_data.shift_key
+            ORDER BY person_key.id, task_data.day, task_data.id
         """
         LOG.debug(request)
-        return self.cur.execute(request).fetchall()
+        return self.execute(request, (first_day, last_day), stream=True)
 
     def insert(self, table, values):
+        self.bulk_insert([(table, values)])
+
+    def insert_many(self, table, rows):
+        """
+        Insert rows to a table using parameterized executemany, batch_size rows at a time
+        :param table: table name
+        :param rows: iterable of tuples, all of the same size
+        :return: count of inserted rows
+        """
+        return self.bulk_insert((table, row) for row in rows).get(table, 0)
+
+    def bulk_insert(self, table_rows):
+        """
+        Insert rows to several tables, rows are buffered per table and flushed batch_size rows at a time.
+        Rows have the columns of public tables, person & shift ids are replaced by their keys
+        :param table_rows: iterable of (table, row) tuples
+        :return: count of inserted rows per table
+        """
+        counts = {}
+        batches = {}
+        for table, row in table_rows:
+            batch = batches.setdefault(table, [])
+            batch.append(self.encode(table, row))
+            if len(batch) >= self.batch_size:
+                counts[table] = counts.get(table, 0) + self._execute_batch(table, batch)
+                batches[table] = []
+        for table, batch in batches.items():
+            if batch:
+                counts[table] = counts.get(table, 0) + self._execute_batch(table, batch)
+        return counts
+
+    def encode(self, table, row):
+        """
+        Return row as stored: person & shift rows get their key first, ids of KEYED_TABLES rows are
+        replaced by keys
+        """
+        if table in ("person", "shift"):
+            return (self.key(table, row[0]), *row)
+        columns = KEYED_TABLES.get(table)
+        if columns is None:
+            return row
+        return tuple(
+            self.key(KEY_COLUMNS[column], value) if column in KEY_COLUMNS else value
+            for column, value in zip(columns, row)
+        )
+
+    def key(self, kind, value):
+        """
+        Return key of a person or shift id, a key is added to the lookup table on first use
+        :param kind: "person" or "shift"
+        :param value: id
+        :return:
+        """
+        if self.keys is None:
+            self.keys = {
+                name: dict(self.select(f"{name}_key", ["id", "key"]))
+                for name in ("person", "shift")
+            }
+        keys = self.keys[kind]
+        key = keys.get(value)
+        if key is None:
+            key = keys[value] = len(keys) + 1
+            self.execute(f"INSERT INTO {kind}_key VALUES (?, ?)", (key, value))
+        return key
+
+    def _execute_batch(self, table, batch):
+        if table in KEYED_TABLES:
+            table = f"{table}_data"
         request = f"""
-            INSERT INTO {table} values {str(values)}
+            INSERT INTO {table} VALUES ({','.join('?' * len(batch[0]))})
             """
-        LOG.debug(request)
-        return self.cur.execute(request)
+        LOG.debug(f"{request} x {len(batch)}")
+        self.execute(request, batch, many=True)
+        return len(batch)
+
+    def update(self, table, where_close, set_close, params=()):
+        """
+        Update rows of a table
+        :param table: table name
+        :param where_close: WHERE clause, values are given as ? placeholders
+        :param set_close: SET clause, values are given as ? placeholders
+        :param params: values bound to set_close then where_close placeholders
+        :return:
+        """
+        request = f"""
+            UPDATE {table} SET {set_close} WHERE {where_close}
+            """
+        LOG.debug(f"{request} {params}")
+        return self.execute(request, params, fetch=True)
 
-    def update(self, table, where_close, set_close):
+    def delete(self, table, where_close, params=()):
+        """
+        Delete rows of a table
+        :param table: table name, rows of KEYED_TABLES are deleted from their <table>_data table
+            so that where_close may not use person_id & shift_id columns
+        :param where_close: WHERE clause, values are given as ? placeholders
+        :param params: values bound to where_close placeholders
+        :return:
+        """
+        if table in KEYED_TABLES:
+            table = f"{table}_data"
+        request = f"""
+            DELETE FROM {table} WHERE {where_close}
+            """
+        LOG.debug(f"{request} {params}")
+        return self.execute(request, params, fetch=True)
+
+    def begin(self):
+        """
+        Open an explicit transaction, no-op if one is already active
+        """
+        if self.con.in_transaction:
+            return
         request = f"""
-            UPDATE {table} SET {set_close} WHERE {where_close} 
+            BEGIN
             """
         LOG.debug(request)
-        return self.cur.execute(request).fetchall()
+        self.execute(request)
 
     def commit(self):
         request = f"""
@@ -160,7 +724,7 @@ class DBAdapter:
             """
         LOG.debug(request)
         try:
-            self.cur.execute(request)
+            self.execute(request)
         except sqlite3.OperationalError:
             # avoid crash if no transaction is active
             pass
@@ -170,4 +734,6 @@ class DBAdapter:
             ROLLBACK
             """
         LOG.debug(request)
-        self.cur.execute(request).fetchall()
+        self.execute(request, fetch=True)
+        # keys added by the transaction are rolled back too
+        self.keys = None
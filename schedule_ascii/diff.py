@@ -0,0 +1,590 @@
+import sys
+import datetime
+import operator
+import argparse
+import logging
+import collections
+
+from schedule_ascii.asr import load_db, parse_days
+from schedule_ascii.drawer import (
+    BaseDrawer,
+    ScheduleDrawer,
+    CapacityDrawer,
+    PERSON_COLUMNS,
+    people_stats,
+    consecutive_runs,
+)
+from schedule_ascii.model import ScheduleModel, NO_TASK
+from schedule_ascii.snapshot import ScheduleSnapshot
+
+LOG = logging.getLogger(__name__)
+
+
+def merge(old_items, new_items):
+    """
+    Sorted merge of 2 iterables of (key, value) sorted by key with unique keys,
+    yield (key, old value, new value) of keys whose values differ, missing values are None
+    """
+    old_iter, new_iter = iter(old_items), iter(new_items)
+    old_item, new_item = next(old_iter, None), next(new_iter, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+            yield old_item[0], old_item[1], None
+            old_item = next(old_iter, None)
+        elif old_item is None or new_item[0] < old_item[0]:
+            yield new_item[0], None, new_item[1]
+            new_item = next(new_iter, None)
+        else:
+            if old_item[1] != new_item[1]:
+                yield old_item[0], old_item[1], new_item[1]
+            old_item, new_item = next(old_iter, None), next(new_iter, None)
+
+
+def task_cells(task_keys):
+    """
+    Yield ((person_id, day), shift_id) of the last task of each day, from select_task_keys rows
+    """
+    previous = None
+    for person_id, day, shift_id in task_keys:
+        if previous is not None and previous[0] != (person_id, day):
+            yield previous
+        previous = ((person_id, day), shift_id)
+    if previous is not None:
+        yield previous
+
+
+def grid_rows(schedule_model, first_day, last_day):
+    """
+    Yield (person_id, tasks grid row) of a ScheduleModel, sorted by person id
+    """
+    time_span_days = schedule_model.time_span_days
+    for person_id in sorted(schedule_model.person_index):
+        offset = schedule_model.person_index[person_id] * time_span_days
+        yield person_id, schedule_model.grid[offset + first_day : offset + last_day]
+
+
+def schedule_task_cells(db_adapter, first_day, last_day, day_offset):
+    """
+    Yield ((person_id, compared day), shift_id) of the last task of each day of a schedule,
+    from compared first_day included to last_day excluded, sorted by person id and day.
+    Days outside of the schedule time span are not part of it
+    :param day_offset: offset of schedule days on compared days
+    """
+    time_span_days = db_adapter.select("schedule", ["time_span_days"])[0][0]
+    for (person_id, day), shift_id in task_cells(
+        db_adapter.select_task_keys(
+            max(first_day - day_offset, 0), min(last_day - day_offset, time_span_days)
+        )
+    ):
+        yield (person_id, day + day_offset), shift_id
+
+
+def task_changes(old_adapter, new_adapter, first_day, last_day, day_offsets=(0, 0)):
+    """
+    List changed tasks cells, from first_day included to last_day excluded.
+    Models with the same shifts, time span and day offset are merged by person first, comparing whole
+    grid rows, so that only rows of changed people are merged by day
+    :param day_offsets: (old, new) offsets of each schedule days on compared days, see DiffDrawer.draw
+    :return: list of ((person_id, day), old shift_id, new shift_id), sorted by person id and day
+    """
+    if not (
+        isinstance(old_adapter, ScheduleModel)
+        and isinstance(new_adapter, ScheduleModel)
+        and old_adapter.shift_ids == new_adapter.shift_ids
+        and old_adapter.time_span_days == new_adapter.time_span_days
+        and day_offsets[0] == day_offsets[1]
+    ):
+        return list(
+            merge(
+                schedule_task_cells(old_adapter, first_day, last_day, day_offsets[0]),
+                schedule_task_cells(new_adapter, first_day, last_day, day_offsets[1]),
+            )
+        )
+
+    day_offset = day_offsets[1]
+    first_day = max(first_day - day_offset, 0)
+    last_day = min(last_day - day_offset, new_adapter.time_span_days)
+    shift_ids = new_adapter.shift_ids
+    changes = []
+    for person_id, old_row, new_row in merge(
+        grid_rows(old_adapter, first_day, last_day),
+        grid_rows(new_adapter, first_day, last_day),
+    ):
+        old_row = old_row or [NO_TASK] * (last_day - first_day)
+        new_row = new_row or [NO_TASK] * (last_day - first_day)
+        for day, old_shift_idx, new_shift_idx in zip(
+            range(first_day, last_day), old_row, new_row
+        ):
+            if old_shift_idx != new_shift_idx:
+                changes.append(
+                    (
+                        (person_id, day + day_offset),
+                        shift_ids[old_shift_idx] if old_shift_idx != NO_TASK else None,
+                        shift_ids[new_shift_idx] if new_shift_idx != NO_TASK else None,
+                    )
+                )
+    return changes
+
+
+def capacity_inputs(db_adapter, first_day, last_day, day_offset=0):
+    """
+    Return needs & capacity inputs of each day, from first_day included to last_day excluded:
+    coverages of existing shifts with their people, preallocations and exclusion rules.
+    Needs & capacity of a day only depend on its inputs
+    :param day_offset: offset of schedule days on compared days, first_day and last_day are compared days
+    :return: {(compared day, kind, id): Counter of input rows}
+    """
+    first_day, last_day = first_day - day_offset, last_day - day_offset
+    pools = collections.defaultdict(set)
+    for pool_id, person_id in db_adapter.select(
+        "pool_person", ["pool_id", "person_id"]
+    ):
+        pools[pool_id].add(person_id)
+    shift_ids = {shift[0] for shift in db_adapter.select("shift", ["id"])}
+    days_where = "day >= ? AND day < ?"
+
+    inputs = collections.defaultdict(collections.Counter)
+    for shift_id, day, min_value, pool_id in db_adapter.select(
+        "coverage",
+        ["shift_id", "day", "min_value", "pool_id"],
+        days_where,
+        (first_day, last_day),
+    ):
+        if shift_id in shift_ids:
+            people = frozenset(pools.get(pool_id, ()))
+            inputs[(day + day_offset, "coverage", shift_id)][(min_value, people)] += 1
+    for person_id, day, shift_id, preallocation_type in db_adapter.select(
+        "preallocation",
+        ["person_id", "day", "shift_id", "type"],
+        days_where,
+        (first_day, last_day),
+    ):
+        inputs[(day + day_offset, "preallocation", person_id)][
+            (shift_id, preallocation_type)
+        ] += 1
+    for rule_shift_ids, rule_person_ids, rule_days in db_adapter.select_exclusion_rules(
+        first_day, last_day
+    ):
+        rule = (frozenset(rule_shift_ids), frozenset(rule_person_ids))
+        for day in rule_days:
+            inputs[(day + day_offset, "exclusion", None)][rule] += 1
+    return inputs
+
+
+def changed_input_days(
+    old_adapter, new_adapter, first_day, last_day, day_offsets=(0, 0)
+):
+    """
+    List days whose needs & capacity inputs changed, from first_day included to last_day excluded
+    :param day_offsets: (old, new) offsets of each schedule days on compared days, see DiffDrawer.draw
+    """
+    old_inputs = capacity_inputs(old_adapter, first_day, last_day, day_offsets[0])
+    new_inputs = capacity_inputs(new_adapter, first_day, last_day, day_offsets[1])
+    return sorted(
+        {
+            key[0]
+            for key in old_inputs.keys() | new_inputs.keys()
+            if old_inputs.get(key) != new_inputs.get(key)
+        }
+    )
+
+
+def capacity_backend(db_adapter, backend):
+    if isinstance(db_adapter, ScheduleSnapshot):
+        return CapacityDrawer.SNAPSHOT_BACKEND
+    return backend
+
+
+class DiffDrawer(BaseDrawer):
+    """
+    Draw changes between 2 loaded schedules: changed tasks cells, needs & capacity deltas,
+    changed people aggregates and analytics deltas. Only changed people and days are drawn
+    """
+
+    def __init__(self, old_adapter, new_adapter, backend="sql", **kwargs):
+        """
+        :param old_adapter: DBAdapter, ScheduleModel or ScheduleSnapshot of the old schedule
+        :param new_adapter: same for the new schedule
+        :param backend: capacity computation backend, see CapacityDrawer
+        :param kwargs: BaseDrawer options
+        """
+        super().__init__(new_adapter, **kwargs)
+        self.old_adapter = old_adapter
+        self.backend = backend
+        self.cell_width = 4
+
+    def time_spans(self):
+        return [
+            db_adapter.select("schedule", ["start_day", "time_span_days"])[0]
+            for db_adapter in (self.old_adapter, self.db_adapter)
+        ]
+
+    def draw(self, day_range=None):
+        """
+        Draw all changes, days of both schedules are matched by date
+        :param day_range: range of days to compare, counted from the earliest start day, defaults to all days
+        :return:
+        """
+        (old_start_day, old_span), (new_start_day, new_span) = self.time_spans()
+        self.draw_list(["", "old", "new"])
+        self.draw_list(["start day", old_start_day, new_start_day])
+        self.draw_list(["num of days", old_span, new_span])
+        self.draw_sep(104)
+
+        # days are matched by date, counted from the earliest start day
+        old_start_date = datetime.date.fromisoformat(old_start_day)
+        new_start_date = datetime.date.fromisoformat(new_start_day)
+        start_date = min(old_start_date, new_start_date)
+        day_offsets = (
+            (old_start_date - start_date).days,
+            (new_start_date - start_date).days,
+        )
+        if old_start_date != new_start_date:
+            LOG.warning(
+                f"start days differ, days are matched by date from {start_date}"
+            )
+            self.write_line(f"days are counted from {start_date}")
+        old_days = range(day_offsets[0], day_offsets[0] + old_span)
+        new_days = range(day_offsets[1], day_offsets[1] + new_span)
+
+        days = range(max(old_days.stop, new_days.stop))
+        if day_range is not None:
+            days = days[
+                max(day_range.start, 0) : max(min(day_range.stop, len(days)), 0)
+            ]
+
+        with self.db_adapter.span("diff_tasks"):
+            self.draw_task_changes(
+                start_date, *self.days_bounds(list(days)), day_offsets
+            )
+        with self.db_adapter.span("diff_capacity"):
+            self.draw_capacity_changes(
+                start_date,
+                [day for day in days if day in old_days and day in new_days],
+                day_offsets,
+            )
+        with self.db_adapter.span("diff_people"):
+            self.draw_people_changes()
+        self.flush()
+
+    def draw_days_header(self, start_date, days):
+        is_we = []
+        for day in days:
+            iso_day = start_date + datetime.timedelta(days=day)
+            is_we.append("X" if iso_day.weekday() in [5, 6] else "")
+        self.draw_indented_list([""] + days, width=self.cell_width)
+        self.draw_indented_list([""] + is_we, width=self.cell_width)
+        self.draw_sep(len(days) * self.cell_width + self.block_width)
+
+    def shift_displays(self, db_adapter):
+        return dict(db_adapter.select("shift", ["id", "ascii_display"]))
+
+    def draw_task_changes(self, start_date, first_day, last_day, day_offsets=(0, 0)):
+        """
+        Draw old and new tasks of changed people on changed days, old and new displays are
+        the ones of each schedule, both legends are drawn if they differ
+        :param day_offsets: (old, new) offsets of each schedule days on compared days
+        """
+        changes = task_changes(
+            self.old_adapter, self.db_adapter, first_day, last_day, day_offsets
+        )
+        people = list(dict.fromkeys(person_id for (person_id, _), _, _ in changes))
+        days = sorted({day for (_, day), _, _ in changes})
+        self.write_line(
+            f"changed tasks: {len(changes)} cells, {len(people)} people, {len(days)} days"
+        )
+        self.draw_sep(120)
+        if not changes:
+            return
+
+        old_displays = self.shift_displays(self.old_adapter)
+        new_displays = self.shift_displays(self.db_adapter)
+        for label, displays in [("old", old_displays), ("new", new_displays)]:
+            if label == "new" and displays == old_displays:
+                break
+            self.write_line(
+                f"{label} shifts: "
+                + " ".join(
+                    f"{shift_id}={display}" for shift_id, display in displays.items()
+                )
+            )
+        self.draw_days_header(start_date, days)
+
+        day_index = {day: i for i, day in enumerate(days)}
+        first_width = self.block_width - 2
+        for i in range(len(changes)):
+            (person_id, day), _, _ = changes[i]
+            if i and changes[i - 1][0][0] == person_id:
+                continue
+            old_line = [" "] * len(days)
+            new_line = [" "] * len(days)
+            for (change_person_id, day), old_shift_id, new_shift_id in changes[i:]:
+                if change_person_id != person_id:
+                    break
+                old_line[day_index[day]] = old_displays.get(old_shift_id, " ")
+                new_line[day_index[day]] = new_displays.get(new_shift_id, " ")
+            label = person_id[:first_width]
+            self.draw_indented_list([f"{label} -"] + old_line, width=self.cell_width)
+            self.draw_indented_list([f"{label} +"] + new_line, width=self.cell_width)
+        self.draw_sep(len(days) * self.cell_width + self.block_width)
+
+    def compute_capacity(self, db_adapter, days, day_offset=0):
+        """
+        Compute needs & capacity of a schedule for the given sorted compared days, see
+        CapacityDrawer.compute_capacity
+        :param day_offset: offset of schedule days on compared days
+        """
+        capacity_drawer = CapacityDrawer(
+            db_adapter, backend=capacity_backend(db_adapter, self.backend)
+        )
+        needs, capacities, total_capacities = {}, {}, {}
+        for run_days in consecutive_runs([day - day_offset for day in days]):
+            run_needs, run_capacities, run_total_capacities = (
+                capacity_drawer.compute_capacity(run_days)
+            )
+            for values, run_values in [
+                (needs, run_needs),
+                (capacities, run_capacities),
+            ]:
+                for (shift_id, day), value in run_values.items():
+                    values[(shift_id, day + day_offset)] = value
+            for day, value in run_total_capacities.items():
+                total_capacities[day + day_offset] = value
+        return needs, capacities, total_capacities
+
+    def draw_capacity_changes(self, start_date, days, day_offsets=(0, 0)):
+        """
+        Draw needs and capacity deltas (new - old) of changed shifts on changed days.
+        Only days whose coverages, preallocations or exclusion rules changed are computed, snapshots
+        have no such rows but precomputed matrices, all days of snapshots are compared
+        :param days: compared days covered by both schedules
+        :param day_offsets: (old, new) offsets of each schedule days on compared days
+        """
+        if not days:
+            candidate_days = []
+        elif isinstance(self.old_adapter, ScheduleSnapshot) or isinstance(
+            self.db_adapter, ScheduleSnapshot
+        ):
+            candidate_days = days
+        else:
+            candidate_days = changed_input_days(
+                self.old_adapter,
+                self.db_adapter,
+                *self.days_bounds(days),
+                day_offsets,
+            )
+        old_needs, old_capacities, old_totals = self.compute_capacity(
+            self.old_adapter, candidate_days, day_offsets[0]
+        )
+        new_needs, new_capacities, new_totals = self.compute_capacity(
+            self.db_adapter, candidate_days, day_offsets[1]
+        )
+
+        # new schedule shifts order, then removed shifts
+        shift_order = list(
+            dict.fromkeys(
+                [shift[0] for shift in self.db_adapter.select("shift", ["id"])]
+                + [shift[0] for shift in self.old_adapter.select("shift", ["id"])]
+            )
+        )
+        shift_ids = [
+            shift_id
+            for shift_id in shift_order
+            if any(
+                (shift_id, day) in values
+                for values in (new_needs, new_capacities, old_needs, old_capacities)
+                for day in candidate_days
+            )
+        ]
+        deltas = []
+        for shift_id in shift_ids:
+            for label, old, new in [
+                ("needs", old_needs, new_needs),
+                ("capacity", old_capacities, new_capacities),
+            ]:
+                line = {
+                    day: new.get((shift_id, day), 0) - old.get((shift_id, day), 0)
+                    for day in candidate_days
+                }
+                deltas.append((f"{shift_id} {label}", line))
+        deltas.append(
+            (
+                "total capacity",
+                {day: new_totals[day] - old_totals[day] for day in candidate_days},
+            )
+        )
+        changed_days = sorted(
+            {day for _, line in deltas for day, delta in line.items() if delta}
+        )
+        self.write_line(f"changed capacity: {len(changed_days)} days")
+        self.draw_sep(120)
+        if not changed_days:
+            return
+
+        self.draw_days_header(start_date, changed_days)
+        for label, line in deltas:
+            if any(line[day] for day in changed_days):
+                self.draw_indented_list(
+                    [label]
+                    + [f"{line[day]:+g}" if line[day] else "" for day in changed_days],
+                    width=self.cell_width,
+                )
+        self.draw_sep(len(changed_days) * self.cell_width + self.block_width)
+
+    def draw_people_changes(self):
+        """
+        Draw aggregates of people whose aggregates changed, then analytics deltas
+        """
+        by_id = operator.itemgetter(0)
+        old_people = sorted(
+            self.old_adapter.select("person", PERSON_COLUMNS), key=by_id
+        )
+        new_people = sorted(self.db_adapter.select("person", PERSON_COLUMNS), key=by_id)
+        changes = list(
+            merge(
+                [(row[0], row[1:]) for row in old_people],
+                [(row[0], row[1:]) for row in new_people],
+            )
+        )
+        self.write_line(f"changed people: {len(changes)}")
+        self.draw_sep(120)
+        if changes:
+            self.draw_indented_list(
+                ["person id", "Tg(h)", "Wo(h)", "Diff(h)", "Nc", "Wc"],
+                first_width=30,
+                width=15,
+            )
+            for person_id, old_row, new_row in changes:
+                for sign, row in [("-", old_row), ("+", new_row)]:
+                    if row is None:
+                        continue
+                    (
+                        _,
+                        night_count,
+                        weekend_count,
+                        target_hours,
+                        _,
+                        effective_hours,
+                        _,
+                    ) = row
+                    self.draw_indented_list(
+                        [
+                            f"{person_id[:27]} {sign}",
+                            round(target_hours, 1),
+                            round(effective_hours, 1),
+                            round(effective_hours - target_hours, 1),
+                            night_count,
+                            weekend_count,
+                        ],
+                        first_width=30,
+                        width=15,
+                    )
+            self.draw_sep(120)
+
+        old_metrics = analytics_metrics(old_people)
+        new_metrics = analytics_metrics(new_people)
+        self.draw_indented_list(
+            ["Analytics", "old", "new", "delta"], first_width=30, width=10
+        )
+        for label, old_value in old_metrics.items():
+            new_value = new_metrics[label]
+            self.draw_indented_list(
+                [label, old_value, new_value, f"{round(new_value - old_value, 1):+g}"],
+                first_width=30,
+                width=10,
+            )
+        self.draw_sep(120)
+
+
+def analytics_metrics(people_data):
+    """
+    Return raw analytics metrics drawn by ScheduleDrawer.draw_analytics
+    """
+    hours_stats, night_stats, weekend_stats = people_stats(people_data)
+    metrics = {
+        "hours std dev (h)": hours_stats.standard_deviation(operator.itemgetter(0)),
+        "hours score (%)": hours_stats.hours_score()[2],
+    }
+    for label, stats in [("night", night_stats), ("weekend", weekend_stats)]:
+        metrics[f"{label} count std dev"] = stats.standard_deviation()
+        metrics[f"{label} count score (%)"] = stats.fairness_score()[1]
+    return metrics
+
+
+def do_diff(
+    old_json_file_path,
+    new_json_file_path,
+    capacity_backend="sql",
+    stream=None,
+    day_range=None,
+    profiler=None,
+    **load_options,
+):
+    """
+    Load 2 JSON files and draw their differences
+    :param old_json_file_path:
+    :param new_json_file_path:
+    :param capacity_backend: "sql" or "numpy", see CapacityDrawer
+    :param stream: text stream the diff is written to, defaults to sys.stdout
+    :param day_range: range of days to compare, defaults to all days
+    :param profiler: optional profiling.Profiler
+    :param load_options: load_db keyword arguments
+    :return:
+    """
+    db_adapters = []
+    for json_file_path in (old_json_file_path, new_json_file_path):
+        db_adapter = load_db(json_file_path, profiler=profiler, **load_options)
+        # old and new ascii displays are drawn, they must be set
+        ScheduleDrawer(db_adapter).init_shift_ascii_display()
+        db_adapters.append(db_adapter)
+    DiffDrawer(*db_adapters, backend=capacity_backend, stream=stream).draw(day_range)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="diff.py",
+        description="Draw changed tasks, needs & capacity and people aggregates between 2 schedules\n",
+    )
+    parser.add_argument("old_json_file_path", help="old schedule JSON file")
+    parser.add_argument("new_json_file_path", help="new schedule JSON file")
+    parser.add_argument(
+        "--days",
+        type=parse_days,
+        help="only compare days window start:end (end excluded), ie 0:28, "
+        "days are counted from the earliest start day",
+    )
+    parser.add_argument(
+        "--capacity-backend",
+        choices=CapacityDrawer.BACKENDS,
+        default="sql",
+        help="capacity computation backend, numpy backend requires numpy",
+    )
+    parser.add_argument(
+        "--model",
+        action="store_true",
+        help="load schedules to in process compact models, no sqlite file is written",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="use or write binary snapshots next to JSON files",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse sqlite files when JSON content and schema version did not change",
+    )
+
+    parsed_args = parser.parse_args()
+
+    do_diff(
+        parsed_args.old_json_file_path,
+        parsed_args.new_json_file_path,
+        capacity_backend=parsed_args.capacity_backend,
+        stream=sys.stdout,
+        day_range=parsed_args.days,
+        model=parsed_args.model,
+        snapshot=parsed_args.snapshot,
+        cache=parsed_args.cache,
+    )
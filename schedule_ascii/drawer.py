@@ -1,8 +1,70 @@
+import sys
 import datetime
-from schedule_ascii.analytics import standard_deviation, hours_score, fairness_score
+import operator
+import itertools
+import functools
+from schedule_ascii import vectorized
+from schedule_ascii.analytics import StatsAccumulator
 
 SHIFT_DISPLAY_SEQ = "ABCDEFGHIJKLMNOPQRTSUVWXYZabcdefghijklmnopqrstuvwxyz1234567890"
 
+PERSON_COLUMNS = [
+    "id",
+    "activity_rate",
+    "night_count",
+    "weekend_count",
+    "target_hours",
+    "holiday_hours",
+    "effective_hours",
+    "debt_hours",
+]
+
+# count of buffered chars before lines are written to the output stream
+DEFAULT_BUFFER_SIZE = 1 << 16
+
+
+@functools.lru_cache(maxsize=256)
+def line_template(first_width, width, count):
+    """
+    Return a format template of 1 block of first_width chars followed by count - 1 blocks of width chars
+    """
+    if not count:
+        return ""
+    return f"{{:<{first_width}}}" + f"{{:<{width}}}" * (count - 1)
+
+
+def people_stats(people_data):
+    """
+    Accumulate hours, night count and weekend count statistics in a single pass over people
+    :param people_data: person rows, with PERSON_COLUMNS columns
+    :return: tuple of StatsAccumulator: hours (delta, target), night count, weekend count
+    """
+    return StatsAccumulator.many(
+        people_data,
+        [
+            # (delta, target)
+            lambda person_data: (
+                int(abs(person_data[4] - person_data[6])),
+                int(person_data[4]),
+            ),
+            operator.itemgetter(2),  # night count
+            operator.itemgetter(3),  # weekend count
+        ],
+    )
+
+
+def consecutive_runs(days):
+    """
+    Split sorted days to lists of consecutive days, as expected by CapacityDrawer.compute_capacity
+    """
+    runs = []
+    for day in days:
+        if runs and runs[-1][-1] == day - 1:
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    return runs
+
 
 class BColors:
     HEADER = "\033[95m"
@@ -18,10 +80,19 @@ class BColors:
 
 class BaseDrawer:
 
-    def __init__(self, db_adapter):
+    def __init__(self, db_adapter, stream=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        :param db_adapter:
+        :param stream: text stream lines are written to, defaults to sys.stdout
+        :param buffer_size: count of chars buffered before being written to stream
+        """
         self.block_width = 30
         self.day_width = 3
         self.db_adapter = db_adapter
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.lines = []
+        self.buffered_size = 0
 
     def init_shift_ascii_display(self):
         """
@@ -92,19 +163,13 @@ class BaseDrawer:
             "9",
             "0",
         ]
-        holiday_shift = self.db_adapter.select("shift", ["id"], "id='HOL'")
-        if holiday_shift:
-            self.db_adapter.update(
-                "shift", f"id='{holiday_shift[0][0]}'", "ascii_display='|'"
-            )
-        off_shift = self.db_adapter.select("shift", ["id"], "id='OFF'")
-        if off_shift:
+        for shift_id, ascii_display in [("HOL", "|"), ("OFF", "-")]:
             self.db_adapter.update(
-                "shift", f"id='{off_shift[0][0]}'", "ascii_display='-'"
+                "shift", "id=?", "ascii_display=?", (ascii_display, shift_id)
             )
 
         # find closer display using first shift id letter
-        for shift in self.db_adapter.select("shift", ["id"], "ascii_display=''"):
+        for shift in self.db_adapter.select("shift", ["id"], "ascii_display=?", ("",)):
             ascii_display = None
             char = shift[0][0]
             if char in shift_display_seq:
@@ -119,21 +184,40 @@ class BaseDrawer:
                         break
             if ascii_display:
                 self.db_adapter.update(
-                    "shift", f"id='{shift[0]}'", f"ascii_display='{ascii_display}'"
+                    "shift", "id=?", "ascii_display=?", (ascii_display, shift[0])
                 )
 
         # for all shifts without ascii display, assign one of the remaining display sequence items
-        for shift in self.db_adapter.select("shift", ["id"], "ascii_display=''"):
+        for shift in self.db_adapter.select("shift", ["id"], "ascii_display=?", ("",)):
             ascii_display = shift_display_seq.pop(0)
             self.db_adapter.update(
-                "shift", f"id='{shift[0]}'", f"ascii_display='{ascii_display}'"
+                "shift", "id=?", "ascii_display=?", (ascii_display, shift[0])
             )
 
+    def write_line(self, line):
+        """
+        Buffer a line, buffer is written to stream once buffer_size is reached
+        """
+        self.lines.append(line)
+        self.buffered_size += len(line) + 1
+        if self.buffered_size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered lines to stream
+        """
+        if self.lines:
+            stream = self.stream if self.stream is not None else sys.stdout
+            stream.write("\n".join(self.lines) + "\n")
+            self.lines = []
+            self.buffered_size = 0
+
     def draw_sep(self, size=100):
         """
         Draw a separator
         """
-        print(f"{'-'*size}")
+        self.write_line("-" * size)
 
     def draw_list(self, labels, block_width=None):
         """
@@ -141,10 +225,8 @@ class BaseDrawer:
         """
         if block_width is None:
             block_width = self.block_width
-        line = ""
-        for label in labels:
-            line += f"{label:<{block_width}}"
-        print(f"{line}")
+        template = line_template(block_width, block_width, len(labels))
+        self.write_line(template.format(*labels))
 
     def draw_indented_list(self, labels, first_width=None, width=None):
         """
@@ -155,10 +237,33 @@ class BaseDrawer:
             first_width = self.block_width
         if width is None:
             width = self.day_width
-        line = f"{labels[0][:first_width]:<{first_width}}"
-        for label in labels[1:]:
-            line += f"{label:<{width}}"
-        print(f"{line}")
+        template = line_template(first_width, width, len(labels))
+        self.write_line(template.format(labels[0][:first_width], *labels[1:]))
+
+    def select_days(self, day_range=None):
+        """
+        Return schedule start date and list of days to draw
+        :param day_range: range of days to draw, clipped to schedule time span, defaults to all days
+        :return:
+        """
+        start_day, time_span_days = self.db_adapter.select(
+            "schedule", ["start_day", "time_span_days"]
+        )[0]
+        days = range(time_span_days)
+        if day_range is not None:
+            days = days[
+                max(day_range.start, 0) : max(min(day_range.stop, time_span_days), 0)
+            ]
+        return datetime.date.fromisoformat(start_day), list(days)
+
+    @staticmethod
+    def days_bounds(days):
+        """
+        Return (first day, last day + 1) of a list of consecutive days
+        """
+        if not days:
+            return 0, 0
+        return days[0], days[-1] + 1
 
     def draw_schedule(self):
         """
@@ -224,19 +329,7 @@ class BaseDrawer:
             first_width=30,
             width=15,
         )
-        people_data = self.db_adapter.select(
-            "person",
-            [
-                "id",
-                "activity_rate",
-                "night_count",
-                "weekend_count",
-                "target_hours",
-                "holiday_hours",
-                "effective_hours",
-                "debt_hours",
-            ],
-        )
+        people_data = self.db_adapter.select("person", PERSON_COLUMNS)
         for person_data in people_data:
             (
                 person_id,
@@ -271,12 +364,13 @@ class ScheduleDrawer(BaseDrawer):
     Schedule ASCII printer
     """
 
-    def __init__(self, db_adapter):
-        self.block_width = 30
-        self.day_width = 3
-        self.db_adapter = db_adapter
-
-    def draw(self):
+    def draw(self, day_range=None):
+        """
+        Draw schedule, shifts, people, tasks and analytics
+        :param day_range: range of days of the tasks grid, defaults to all days.
+            Analytics are always computed on the whole schedule
+        :return:
+        """
         self.draw_sep(104)
 
         # draw schedule
@@ -288,28 +382,22 @@ class ScheduleDrawer(BaseDrawer):
         # draw people
         self.draw_people()
 
-        #############
-        # draw tasks
-        #############
-        people_data = self.db_adapter.select(
-            "person",
-            [
-                "id",
-                "activity_rate",
-                "night_count",
-                "weekend_count",
-                "target_hours",
-                "holiday_hours",
-                "effective_hours",
-                "debt_hours",
-            ],
-        )
-        start_day, time_span_days = self.db_adapter.select(
-            "schedule", ["start_day", "time_span_days"]
-        )[0]
+        with self.db_adapter.span("grid"):
+            self.draw_tasks(day_range)
+
+        with self.db_adapter.span("analytics"):
+            self.draw_analytics()
+
+        self.flush()
+
+    def draw_tasks(self, day_range=None):
+        """
+        Draw people tasks grid
+        :param day_range: range of days to draw, defaults to all days
+        :return:
+        """
         # days
-        days = list(range(time_span_days))
-        start_date = datetime.date.fromisoformat(start_day)
+        start_date, days = self.select_days(day_range)
         is_we = []
         for day in days:
             iso_day = start_date + datetime.timedelta(days=day)
@@ -321,38 +409,48 @@ class ScheduleDrawer(BaseDrawer):
         self.draw_indented_list([""] + is_we)
         self.draw_sep(len(days) * self.day_width + self.block_width)
         # tasks
-        for person_data in people_data:
-            tasks = self.db_adapter.select_person_tasks(person_data[0])  # 0: person id
-            task_items = {}
-            for display, day in tasks:
-                task_items[day] = display
-            labels = [person_data[0]]
+        for person_id, task_items in self.task_rows(days):
+            labels = [person_id]
             for day in days:
                 labels.append(task_items.get(day, " "))
             self.draw_indented_list(labels)
         self.draw_sep(120)
 
-        #############
-        # analytics
-        #############
+    def task_rows(self, days):
+        """
+        Yield (person_id, {day: task display}) of each person, in person table order
+        :param days: list of consecutive days
+        """
+        for person_id, tasks in itertools.groupby(
+            self.db_adapter.select_tasks_grid(*self.days_bounds(days)),
+            key=operator.itemgetter(0),
+        ):
+            task_items = {}
+            for _, day, display in tasks:
+                if display is not None:
+                    task_items[day] = display
+            yield person_id, task_items
+
+    def draw_analytics(self):
+        """
+        Draw people hours, night count and weekend count statistics
+        :return:
+        """
+        people_data = self.db_adapter.select("person", PERSON_COLUMNS)
+        hours_stats, night_stats, weekend_stats = people_stats(people_data)
+
         # people hours
         legend = ["Hours", "raw", "wo extremes"]
         self.draw_indented_list(legend, first_width=15, width=10)
-        raw_values = [
-            (int(abs(person_data[4] - person_data[6])), int(person_data[4]))
-            for person_data in people_data
-        ]  # [(delta, target), ...]
-        min_value = min(raw_values)
-        max_value = max(raw_values)
-        wo_extremes_values = [
-            value for value in raw_values if value not in [min_value, max_value]
-        ]
-        min_wo_extremes_value = (
-            min(wo_extremes_values) if wo_extremes_values else min_value
-        )
-        max_wo_extremes_value = (
-            max(wo_extremes_values) if wo_extremes_values else max_value
-        )
+        wo_extremes_stats = hours_stats.wo_extremes()
+        min_value = hours_stats.min
+        max_value = hours_stats.max
+        if wo_extremes_stats.histogram:
+            min_wo_extremes_value = wo_extremes_stats.min
+            max_wo_extremes_value = wo_extremes_stats.max
+        else:
+            min_wo_extremes_value = min_value
+            max_wo_extremes_value = max_value
         self.draw_indented_list(
             ["delta min (h)", min_value[0], min_wo_extremes_value[0]],
             first_width=15,
@@ -367,18 +465,17 @@ class ScheduleDrawer(BaseDrawer):
             first_width=15,
             width=10,
         )
-        raw_std = standard_deviation([raw_value[0] for raw_value in raw_values])
-        wo_extremes_std = standard_deviation(
-            [wo_extremes_value[0] for wo_extremes_value in wo_extremes_values]
-        )
+        delta = operator.itemgetter(0)
+        raw_std = hours_stats.standard_deviation(delta)
+        wo_extremes_std = wo_extremes_stats.standard_deviation(delta)
         self.draw_indented_list(
             ["std dev (h)", raw_std, wo_extremes_std], first_width=15, width=10
         )
-        raw_hours_total_delta, raw_hours_total_target, raw_hours_score = hours_score(
-            raw_values
+        raw_hours_total_delta, raw_hours_total_target, raw_hours_score = (
+            hours_stats.hours_score()
         )
-        wo_hours_total_delta, wo_hours_total_target, wo_hours_score = hours_score(
-            wo_extremes_values
+        wo_hours_total_delta, wo_hours_total_target, wo_hours_score = (
+            wo_extremes_stats.hours_score()
         )
         self.draw_indented_list(
             [
@@ -410,22 +507,21 @@ class ScheduleDrawer(BaseDrawer):
         self.draw_sep(120)
 
         # fairnesses
-        for index in [2, 3]:  # 2: night count, 3: weekend count
-            label = "Night count" if index == 2 else "Weekend count"
+        for label, stats in [
+            ("Night count", night_stats),
+            ("Weekend count", weekend_stats),
+        ]:
             legend = [label, "raw", "wo extremes"]
             self.draw_indented_list(legend, first_width=15, width=10)
-            raw_values = [person_data[index] for person_data in people_data]
-            min_value = min(raw_values)
-            max_value = max(raw_values)
-            wo_extremes_values = [
-                value for value in raw_values if value not in [min_value, max_value]
-            ]
-            min_wo_extremes_value = (
-                min(wo_extremes_values) if wo_extremes_values else min_value
-            )
-            max_wo_extremes_value = (
-                max(wo_extremes_values) if wo_extremes_values else max_value
-            )
+            wo_extremes_stats = stats.wo_extremes()
+            min_value = stats.min
+            max_value = stats.max
+            if wo_extremes_stats.histogram:
+                min_wo_extremes_value = wo_extremes_stats.min
+                max_wo_extremes_value = wo_extremes_stats.max
+            else:
+                min_wo_extremes_value = min_value
+                max_wo_extremes_value = max_value
             self.draw_indented_list(
                 ["min", min_value, min_wo_extremes_value], first_width=15, width=10
             )
@@ -438,15 +534,15 @@ class ScheduleDrawer(BaseDrawer):
                 first_width=15,
                 width=10,
             )
-            raw_std = standard_deviation(raw_values)
-            wo_extremes_std = standard_deviation(wo_extremes_values)
+            raw_std = stats.standard_deviation()
+            wo_extremes_std = wo_extremes_stats.standard_deviation()
             self.draw_indented_list(
                 ["std dev", raw_std, wo_extremes_std], first_width=15, width=10
             )
 
-            raw_fairness_delta_total, raw_fairness_score = fairness_score(raw_values)
-            wo_fairness_delta_total, wo_fairness_score = fairness_score(
-                wo_extremes_values
+            raw_fairness_delta_total, raw_fairness_score = stats.fairness_score()
+            wo_fairness_delta_total, wo_fairness_score = (
+                wo_extremes_stats.fairness_score()
             )
             self.draw_indented_list(
                 [
@@ -477,6 +573,22 @@ class CapacityDrawer(BaseDrawer):
     For each shift for each day, draw 1 line with required minimal coverage and 1 line with count of available people
     """
 
+    BACKENDS = ["sql", "numpy"]
+    # used to draw a snapshot.ScheduleSnapshot, not a user choice
+    SNAPSHOT_BACKEND = "snapshot"
+
+    def __init__(self, db_adapter, backend="sql", **kwargs):
+        """
+        :param db_adapter:
+        :param backend: capacity computation backend, "sql" (set based queries), "numpy" (vectorized arrays)
+            or "snapshot" (precomputed matrices of a snapshot.ScheduleSnapshot)
+        :param kwargs: BaseDrawer options
+        """
+        super().__init__(db_adapter, **kwargs)
+        if backend not in self.BACKENDS + [self.SNAPSHOT_BACKEND]:
+            raise ValueError(f"unknown capacity backend {backend}")
+        self.backend = backend
+
     @classmethod
     def colorize(cls, needs_line, capacity_line):
         """
@@ -501,13 +613,49 @@ class CapacityDrawer(BaseDrawer):
                         f"{BColors.WARNING}{capacity_value}{BColors.ENDC}"
                     )
 
-    def draw(self):
-        start_day, time_span_days = self.db_adapter.select(
-            "schedule", ["start_day", "time_span_days"]
-        )[0]
+    def compute_capacity(self, days):
+        """
+        Compute needs and capacity of all shifts for the given days, using set based queries
+        :param days: list of consecutive days
+        :return: tuple of
+            - needs: {(shift_id, day): minimal coverage}
+            - capacities: {(shift_id, day): count of available people}
+            - total_capacities: {day: count of people available for at least 1 shift}
+        """
+        if self.backend == self.SNAPSHOT_BACKEND:
+            return self.db_adapter.compute_capacity(days)
+
+        days_bounds = self.days_bounds(days)
+        shift_ids = [shift[0] for shift in self.db_adapter.select("shift", ["id"])]
+        if self.backend == "numpy":
+            return vectorized.compute_capacity(
+                self.db_adapter, shift_ids, days, days_bounds
+            )
+
+        needs = {
+            (shift_id, day): needs_count
+            for shift_id, day, needs_count in self.db_adapter.select_coverage_needs(
+                *days_bounds
+            )
+        }
+        capacities = {
+            (shift_id, day): capacity
+            for shift_id, day, capacity in self.db_adapter.select_capacities(
+                *days_bounds
+            )
+        }
+        total_capacities = dict.fromkeys(days, 0)
+        total_capacities.update(self.db_adapter.select_total_capacities(*days_bounds))
+        return needs, capacities, total_capacities
+
+    def draw(self, day_range=None):
+        """
+        Draw needs and capacity of each shift for each day
+        :param day_range: range of days to draw, defaults to all days
+        :return:
+        """
         # days
-        days = list(range(time_span_days))
-        start_date = datetime.date.fromisoformat(start_day)
+        start_date, days = self.select_days(day_range)
 
         # weekend line data
         is_we = []
@@ -524,8 +672,8 @@ class CapacityDrawer(BaseDrawer):
         self.draw_sep(len(days) * self.day_width + self.block_width)
 
         # needs & capacities
+        needs, capacities, total_capacities = self.compute_capacity(days)
         total_needs_data = [0] * len(days)
-        total_capacity_people = [[]] * len(days)
 
         for shift_data in self.db_adapter.select(
             "shift",
@@ -546,53 +694,10 @@ class CapacityDrawer(BaseDrawer):
             capacities_data = [f"{shift_id} capacity"]
 
             for i, day in enumerate(days):
-                # estimate minimal coverage needed for this shift for this day
-                needs_count = sum(
-                    [
-                        value[0]
-                        for value in self.db_adapter.select(
-                            "coverage",
-                            ["min_value"],
-                            f"shift_id='{shift_id}' AND day={day}",
-                        )
-                    ]
-                )
+                needs_count = needs.get((shift_id, day), 0)
                 needs_data.append(needs_count)
                 total_needs_data[i] += needs_count
-
-                # estimate count of available person to cover for this shift for this day
-                statement = f"""
-                SELECT person_id from coverage_person
-                INNER JOIN coverage on coverage_person.coverage_id=coverage.id
-                WHERE coverage.shift_id='{shift_id}'
-                AND day={day}
-                GROUP BY person_id
-                """
-                capacity = 0
-                for person_data in self.db_adapter.cur.execute(statement).fetchall():
-                    # check if person is available for this day
-                    person_id = person_data[0]
-
-                    # ignore person if preallocated on another shift or not working
-                    is_preallocated = self.db_adapter.select(
-                        "preallocation",
-                        ["id"],
-                        f"person_id='{person_id}' and day={day} and (type!=2 or shift_id!='{shift_id}')",
-                    )
-
-                    # ignore person if excluded for this day and shift
-                    is_excluded = self.db_adapter.select(
-                        "exclusion",
-                        ["id"],
-                        f"person_id='{person_id}' and day={day} and shift_id='{shift_id}'",
-                    )
-
-                    if not is_preallocated and not is_excluded:
-                        capacity += 1
-                        if person_id not in total_capacity_people[day]:
-                            total_capacity_people[day].append(person_id)
-
-                capacities_data.append(capacity)
+                capacities_data.append(capacities.get((shift_id, day), 0))
 
             if sum(needs_data[1:]) or sum(capacities_data[1:]):
                 # ignore line if no data
@@ -605,7 +710,7 @@ class CapacityDrawer(BaseDrawer):
         #        self.colorize(total_needs_data, total_capacity_people)
         self.draw_indented_list(["total needs"] + total_needs_data)
         self.draw_indented_list(
-            ["total capacity"]
-            + [len(people_capacity) for people_capacity in total_capacity_people]
+            ["total capacity"] + [total_capacities[day] for day in days]
         )
         self.draw_sep(len(days) * self.day_width + self.block_width)
+        self.flush()
@@ -0,0 +1,629 @@
+"""
+Compact in process schedule model, an alternative to DBAdapter for runs that only render.
+Person and shift ids are interned to small ints, tasks are kept in array backed columns
+and in a person x day array('h') grid of shift indexes, preallocations and exclusions
+are kept as int bitsets of days. The model implements the part of the DBAdapter interface
+used by JSONParser.store and the drawers.
+"""
+
+import re
+import array
+import operator
+import contextlib
+
+# grid cell of a day without task
+NO_TASK = -1
+
+WHERE_TERM = re.compile(r"^\s*(\w+)\s*(=|!=|>=|<=|<|>)\s*\?\s*$")
+
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+
+class Person:
+    __slots__ = (
+        "idx",
+        "id",
+        "activity_rate",
+        "night_count",
+        "weekend_count",
+        "target_hours",
+        "holiday_hours",
+        "effective_hours",
+        "debt_hours",
+    )
+
+    COLUMNS = __slots__[1:]
+
+    def __init__(self, idx, *values):
+        self.idx = idx
+        for name, value in zip(self.COLUMNS, values):
+            setattr(self, name, value)
+
+
+class Shift:
+    __slots__ = (
+        "idx",
+        "id",
+        "display_name",
+        "ascii_display",
+        "duration",
+        "start_time",
+        "end_time",
+    )
+
+    COLUMNS = __slots__[1:]
+
+    def __init__(self, idx, *values):
+        self.idx = idx
+        for name, value in zip(self.COLUMNS, values):
+            setattr(self, name, value)
+
+
+class Coverage:
+    __slots__ = (
+        "id",
+        "min_value",
+        "max_value",
+        "shift_idx",
+        "day",
+        "pool_id",
+        "people",
+    )
+
+    def __init__(self, id, min_value, max_value, shift_idx, day, pool_id, people):
+        self.id = id
+        self.min_value = min_value
+        self.max_value = max_value
+        self.shift_idx = shift_idx
+        self.day = day
+        self.pool_id = pool_id
+        # interned person indexes, shared by coverages of the same people pool
+        self.people = people
+
+
+class ScheduleModel:
+    """
+    In memory schedule tables, filled by JSONParser.store through bulk_insert
+    """
+
+    # columns of tables supported by select
+    TABLES = {
+        "schedule": ("id", "start_day", "time_span_days"),
+        "person": Person.COLUMNS,
+        "shift": Shift.COLUMNS,
+        "task": ("id", "person_id", "shift_id", "day"),
+        "shift_label": ("shift_id", "label"),
+        "coverage": ("id", "min_value", "max_value", "shift_id", "day", "pool_id"),
+        "pool_person": ("pool_id", "person_id"),
+        "preallocation": ("id", "shift_id", "person_id", "type", "day"),
+        "exclusion": ("shift_id", "person_id", "day"),
+    }
+
+    def __init__(self, profiler=None):
+        """
+        :param profiler: optional profiling.Profiler, only spans are recorded
+        """
+        self.profiler = profiler
+        self.schedule = None
+
+        # interned ids, people and shifts may be referenced before (or without) their own row
+        self.person_ids = []
+        self.person_index = {}
+        self.shift_ids = []
+        self.shift_index = {}
+
+        # person and shift tables, in insertion order
+        self.people = []
+        self.shifts = []
+        self.shift_labels = {}
+        # ids of people and shifts rows, ids are unique as db primary keys
+        self.loaded_ids = {"person": set(), "shift": set()}
+
+        # task columns, indexed by task id
+        self.task_person = array.array("i")
+        self.task_shift = array.array("h")
+        self.task_day = array.array("i")
+        self.task_weekend = bytearray()
+        # person x day grid of the shift index of the last task of each day
+        self.grid = array.array("h")
+
+        # pool id: interned person indexes of a distinct coverage people list
+        self.pools = {}
+        self.coverages = {}
+        self.preallocations = []
+        # person index: days with a preallocation
+        self.preallocated = {}
+        # person index: days with a preallocation blocking all shifts
+        self.preallocation_conflicts = {}
+        # (shift index, person index): days with a preallocation on this shift
+        self.preallocated_shift = {}
+        # (person index, day): shift index of a preallocation on a single shift
+        self.preallocation_shift = {}
+        # exclusion rule id: [shift indexes, person indexes, days bitset]
+        self.exclusion_rules = {}
+        # (shift index, person index): excluded days, expanded from rules on first use
+        self._exclusions = None
+
+    @property
+    def time_span_days(self):
+        return self.schedule[2] if self.schedule else 0
+
+    def span(self, name):
+        """
+        Return a profiler timing span, or a no-op context if profiling is off
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.span(name)
+
+    def intern_person(self, person_id):
+        idx = self.person_index.get(person_id)
+        if idx is None:
+            idx = self.person_index[person_id] = len(self.person_ids)
+            self.person_ids.append(person_id)
+            self.grid.extend(array.array("h", [NO_TASK]) * self.time_span_days)
+        return idx
+
+    def intern_shift(self, shift_id):
+        idx = self.shift_index.get(shift_id)
+        if idx is None:
+            idx = self.shift_index[shift_id] = len(self.shift_ids)
+            self.shift_ids.append(shift_id)
+        return idx
+
+    # DBAdapter transaction & schema methods, nothing to do for an in memory model
+
+    def init_tables(self, indexes=True):
+        pass
+
+    def create_indexes(self):
+        pass
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def insert(self, table, values):
+        self.bulk_insert([(table, values)])
+
+    def insert_many(self, table, rows):
+        return self.bulk_insert((table, row) for row in rows).get(table, 0)
+
+    def bulk_insert(self, table_rows):
+        """
+        Load (table, row) tuples, rows have DBAdapter tables layout, see JSONParser.rows
+        :param table_rows: iterable of (table, row) tuples
+        :return: count of inserted rows per table
+        """
+        counts = {}
+        for table, row in table_rows:
+            getattr(self, f"_insert_{table}")(*row)
+            counts[table] = counts.get(table, 0) + 1
+        return counts
+
+    def _insert_schedule(self, schedule_id, start_day, time_span_days):
+        if self.person_ids:
+            raise ValueError("schedule must be loaded before people references")
+        self.schedule = (schedule_id, start_day, time_span_days)
+
+    def _insert_person(self, person_id, *values):
+        if person_id in self.loaded_ids["person"]:
+            raise ValueError(f"duplicate person {person_id}")
+        self.loaded_ids["person"].add(person_id)
+        self.people.append(Person(self.intern_person(person_id), person_id, *values))
+
+    def _insert_shift(self, shift_id, *values):
+        if shift_id in self.loaded_ids["shift"]:
+            raise ValueError(f"duplicate shift {shift_id}")
+        self.loaded_ids["shift"].add(shift_id)
+        self.shifts.append(Shift(self.intern_shift(shift_id), shift_id, *values))
+
+    def _insert_shift_label(self, shift_id, label):
+        self.shift_labels.setdefault(self.intern_shift(shift_id), []).append(label)
+
+    def _insert_task(self, task_id, person_id, shift_id, day):
+        if task_id != len(self.task_day):
+            raise ValueError(f"unexpected task id {task_id}")
+        person_idx = self.intern_person(person_id)
+        shift_idx = self.intern_shift(shift_id)
+        self.task_person.append(person_idx)
+        self.task_shift.append(shift_idx)
+        self.task_day.append(day)
+        self.task_weekend.append(0)
+        if 0 <= day < self.time_span_days:
+            self.grid[person_idx * self.time_span_days + day] = shift_idx
+
+    def _insert_task_label(self, task_id, label):
+        # weekend is the only task label used by aggregates
+        if label == "weekend":
+            self.task_weekend[task_id] = 1
+
+    def _insert_people_pool(self, pool_id):
+        self.pools[pool_id] = array.array("i")
+
+    def _insert_pool_person(self, pool_id, person_id):
+        self.pools[pool_id].append(self.intern_person(person_id))
+
+    def _insert_coverage(
+        self, coverage_id, min_value, max_value, shift_id, day, pool_id
+    ):
+        self.coverages[coverage_id] = Coverage(
+            coverage_id,
+            min_value,
+            max_value,
+            self.intern_shift(shift_id),
+            day,
+            pool_id,
+            self.pools[pool_id],
+        )
+
+    def _insert_preallocation(
+        self, preallocation_id, shift_id, person_id, preallocation_type, day
+    ):
+        self.preallocations.append(
+            (preallocation_id, shift_id, person_id, preallocation_type, day)
+        )
+        if day < 0:
+            # days before schedule start are never drawn
+            return
+        person_idx = self.intern_person(person_id)
+        shift_idx = self.intern_shift(shift_id)
+        bit = 1 << day
+        self.preallocated[person_idx] = self.preallocated.get(person_idx, 0) | bit
+        # same rule as DBAdapter.AVAILABLE_PEOPLE: a preallocation blocks all shifts
+        # but its own one if of type 2, a person preallocated on 2 shifts a day is not available
+        if preallocation_type is not None and preallocation_type != 2:
+            conflict = True
+        else:
+            own_shift_idx = self.preallocation_shift.setdefault(
+                (person_idx, day), shift_idx
+            )
+            conflict = own_shift_idx != shift_idx
+            key = (shift_idx, person_idx)
+            self.preallocated_shift[key] = self.preallocated_shift.get(key, 0) | bit
+        if conflict:
+            self.preallocation_conflicts[person_idx] = (
+                self.preallocation_conflicts.get(person_idx, 0) | bit
+            )
+
+    def _insert_exclusion_rule(self, rule_id):
+        self.exclusion_rules[rule_id] = [[], [], 0]
+        self._exclusions = None
+
+    def _insert_exclusion_person(self, rule_id, person_id):
+        self.exclusion_rules[rule_id][1].append(self.intern_person(person_id))
+        self._exclusions = None
+
+    def _insert_exclusion_shift(self, rule_id, shift_id):
+        self.exclusion_rules[rule_id][0].append(self.intern_shift(shift_id))
+        self._exclusions = None
+
+    def _insert_exclusion_day(self, rule_id, day):
+        if day < 0:
+            return
+        self.exclusion_rules[rule_id][2] |= 1 << day
+        self._exclusions = None
+
+    @property
+    def exclusions(self):
+        """
+        Excluded days of each (shift index, person index), expanded from exclusion rules
+        """
+        if self._exclusions is None:
+            self._exclusions = {}
+            for shift_idxs, person_idxs, days in self.exclusion_rules.values():
+                if not days:
+                    continue
+                for shift_idx in shift_idxs:
+                    for person_idx in person_idxs:
+                        key = (shift_idx, person_idx)
+                        self._exclusions[key] = self._exclusions.get(key, 0) | days
+        return self._exclusions
+
+    def refresh_person_aggregates(self, person_ids=None):
+        """
+        Refresh night_count, weekend_count and effective_hours of people, see DBAdapter.refresh_person_aggregates
+        :param person_ids: list of people to refresh, defaults to all people
+        :return:
+        """
+        durations = [None] * len(self.shift_ids)
+        for shift in self.shifts:
+            durations[shift.idx] = shift.duration
+        night_weights = [0] * len(self.shift_ids)
+        for shift_idx, labels in self.shift_labels.items():
+            night_weights[shift_idx] = labels.count("night")
+
+        count = len(self.person_ids)
+        night_counts = [0] * count
+        weekend_counts = [0] * count
+        effective_hours = [0] * count
+        for person_idx, shift_idx, is_weekend in zip(
+            self.task_person, self.task_shift, self.task_weekend
+        ):
+            weekend_counts[person_idx] += is_weekend
+            duration = durations[shift_idx]
+            if duration is not None:
+                night_counts[person_idx] += night_weights[shift_idx]
+                effective_hours[person_idx] += duration
+
+        targets = None if person_ids is None else set(person_ids)
+        for person in self.people:
+            if targets is None or person.id in targets:
+                person.night_count = night_counts[person.idx]
+                person.weekend_count = weekend_counts[person.idx]
+                person.effective_hours = effective_hours[person.idx]
+
+    def rows(self, table):
+        """
+        Yield rows of a table, with DBAdapter columns
+        """
+        if table == "schedule":
+            if self.schedule:
+                yield self.schedule
+        elif table in ("person", "shift"):
+            getter = operator.attrgetter(*self.TABLES[table])
+            for item in self.people if table == "person" else self.shifts:
+                yield getter(item)
+        elif table == "task":
+            for task_id, (person_idx, shift_idx, day) in enumerate(
+                zip(self.task_person, self.task_shift, self.task_day)
+            ):
+                yield task_id, self.person_ids[person_idx], self.shift_ids[
+                    shift_idx
+                ], day
+        elif table == "shift_label":
+            for shift_idx, labels in self.shift_labels.items():
+                for label in labels:
+                    yield self.shift_ids[shift_idx], label
+        elif table == "coverage":
+            for coverage in self.coverages.values():
+                yield (
+                    coverage.id,
+                    coverage.min_value,
+                    coverage.max_value,
+                    self.shift_ids[coverage.shift_idx],
+                    coverage.day,
+                    coverage.pool_id,
+                )
+        elif table == "pool_person":
+            for pool_id, people in self.pools.items():
+                for idx in people:
+                    yield pool_id, self.person_ids[idx]
+        elif table == "preallocation":
+            yield from self.preallocations
+        elif table == "exclusion":
+            for (shift_idx, person_idx), days in self.exclusions.items():
+                for day in iter_bits(days):
+                    yield self.shift_ids[shift_idx], self.person_ids[person_idx], day
+        else:
+            raise NotImplementedError(f"table {table} is not part of schedule model")
+
+    def where(self, table, where_close, params):
+        """
+        Return a row predicate of a WHERE clause, only "column op ?" terms joined by AND are supported
+        """
+        columns = self.TABLES[table]
+        checks = []
+        terms = re.split(r"\s+AND\s+", where_close, flags=re.I) if where_close else []
+        if len(terms) != len(params):
+            raise ValueError(f"expected {len(terms)} params, got {len(params)}")
+        for term, value in zip(terms, params):
+            match = WHERE_TERM.match(term)
+            if match is None or match.group(1) not in columns:
+                raise NotImplementedError(f"unsupported where clause {where_close}")
+            checks.append(
+                (columns.index(match.group(1)), OPERATORS[match.group(2)], value)
+            )
+        return lambda row: all(op(row[i], value) for i, op, value in checks)
+
+    def select(self, table, columns, where_close=None, params=()):
+        """
+        Select columns of a table, see DBAdapter.select
+        :return: list of rows
+        """
+        if table not in self.TABLES:
+            raise NotImplementedError(f"table {table} is not part of schedule model")
+        table_columns = self.TABLES[table]
+        indexes = [table_columns.index(column) for column in columns]
+        predicate = self.where(table, where_close, params)
+        return [
+            tuple(row[i] for i in indexes) for row in self.rows(table) if predicate(row)
+        ]
+
+    def update(self, table, where_close, set_close, params=()):
+        """
+        Update person or shift rows, see DBAdapter.update
+        :return:
+        """
+        if table not in ("person", "shift"):
+            raise NotImplementedError(f"table {table} is read only")
+        assignments = [term.split("=") for term in set_close.split(",")]
+        if any(len(term) != 2 or term[1].strip() != "?" for term in assignments):
+            raise NotImplementedError(f"unsupported set clause {set_close}")
+        names = [name.strip() for name, _ in assignments]
+        values = params[: len(names)]
+        predicate = self.where(table, where_close, params[len(names) :])
+        getter = operator.attrgetter(*self.TABLES[table])
+        for item in self.people if table == "person" else self.shifts:
+            if predicate(getter(item)):
+                for name, value in zip(names, values):
+                    setattr(item, name, value)
+        return []
+
+    def shift_rows(self):
+        """
+        Return shift row of each interned shift index, None for shifts without row
+        """
+        shift_rows = [None] * len(self.shift_ids)
+        for shift in self.shifts:
+            shift_rows[shift.idx] = shift
+        return shift_rows
+
+    def select_coverage_needs(self, first_day, last_day):
+        """
+        Sum minimal coverage for each shift and day, from first_day included to last_day excluded
+        """
+        shift_rows = self.shift_rows()
+        needs = {}
+        for coverage in self.coverages.values():
+            if (
+                first_day <= coverage.day < last_day
+                and shift_rows[coverage.shift_idx] is not None
+            ):
+                key = (shift_rows[coverage.shift_idx].id, coverage.day)
+                needs[key] = needs.get(key, 0) + coverage.min_value
+        return [(shift_id, day, value) for (shift_id, day), value in needs.items()]
+
+    def select_coverage_people(self, first_day, last_day):
+        """
+        List people of each coverage people list, with coverage shift and day,
+        from first_day included to last_day excluded
+        """
+        shift_rows = self.shift_rows()
+        return [
+            (shift_rows[coverage.shift_idx].id, coverage.day, self.person_ids[idx])
+            for coverage in self.coverages.values()
+            if first_day <= coverage.day < last_day
+            and shift_rows[coverage.shift_idx] is not None
+            for idx in coverage.people
+        ]
+
+    def iter_available_people(self, first_day, last_day):
+        """
+        Yield (shift row, day, person index) of people available for each shift and day,
+        from first_day included to last_day excluded: part of a coverage people list,
+        not preallocated on another shift or not working and not excluded
+        """
+        shift_rows = self.shift_rows()
+        pools = {}
+        for coverage in self.coverages.values():
+            if (
+                first_day <= coverage.day < last_day
+                and shift_rows[coverage.shift_idx] is not None
+            ):
+                pools.setdefault((coverage.shift_idx, coverage.day), set()).update(
+                    coverage.people
+                )
+
+        exclusions = self.exclusions
+        for (shift_idx, day), pool in pools.items():
+            bit = 1 << day
+            for person_idx in pool:
+                if self.preallocated.get(person_idx, 0) & bit and (
+                    self.preallocation_conflicts.get(person_idx, 0) & bit
+                    or not self.preallocated_shift.get((shift_idx, person_idx), 0) & bit
+                ):
+                    continue
+                if exclusions.get((shift_idx, person_idx), 0) & bit:
+                    continue
+                yield shift_rows[shift_idx], day, person_idx
+
+    def select_capacities(self, first_day, last_day):
+        """
+        Count people available for each shift and day, from first_day included to last_day excluded
+        """
+        capacities = {}
+        for shift, day, _ in self.iter_available_people(first_day, last_day):
+            key = (shift.id, day)
+            capacities[key] = capacities.get(key, 0) + 1
+        return [(shift_id, day, value) for (shift_id, day), value in capacities.items()]
+
+    def select_total_capacities(self, first_day, last_day):
+        """
+        Count people available for at least 1 shift on each day, from first_day included to last_day excluded
+        """
+        available_people = {}
+        for _, day, person_idx in self.iter_available_people(first_day, last_day):
+            available_people.setdefault(day, set()).add(person_idx)
+        return [(day, len(people)) for day, people in available_people.items()]
+
+    def select_exclusion_rules(self, first_day, last_day):
+        """
+        List day exclusion rules having days from first_day included to last_day excluded,
+        see DBAdapter.select_exclusion_rules
+        """
+        mask = ((1 << max(last_day, 0)) - 1) ^ ((1 << max(first_day, 0)) - 1)
+        return [
+            (
+                [self.shift_ids[idx] for idx in shift_idxs],
+                [self.person_ids[idx] for idx in person_idxs],
+                list(iter_bits(days & mask)),
+            )
+            for shift_idxs, person_idxs, days in self.exclusion_rules.values()
+            if days & mask
+        ]
+
+    def select_person_tasks(self, person_id):
+        """
+        List tasks display and day of a person
+        """
+        person_idx = self.person_index.get(person_id)
+        shift_rows = self.shift_rows()
+        return [
+            (shift_rows[shift_idx].ascii_display, day)
+            for task_person, shift_idx, day in zip(
+                self.task_person, self.task_shift, self.task_day
+            )
+            if task_person == person_idx and shift_rows[shift_idx] is not None
+        ]
+
+    def select_tasks_grid(self, first_day, last_day):
+        """
+        Yield people tasks display and day, from first_day included to last_day excluded,
+        see DBAdapter.select_tasks_grid. Only the last task of a day is listed
+        """
+        shift_rows = self.shift_rows()
+        displays = [shift and shift.ascii_display for shift in shift_rows]
+        time_span_days = self.time_span_days
+        first_day = max(first_day, 0)
+        last_day = min(last_day, time_span_days)
+        for person in self.people:
+            offset = person.idx * time_span_days
+            has_task = False
+            for day in range(first_day, last_day):
+                shift_idx = self.grid[offset + day]
+                if shift_idx != NO_TASK:
+                    has_task = True
+                    yield person.id, day, displays[shift_idx]
+            if not has_task:
+                yield person.id, None, None
+
+    def select_task_keys(self, first_day, last_day):
+        """
+        Yield (person_id, day, shift_id) of the last task of each day, from first_day included
+        to last_day excluded, sorted by person id and day
+        """
+        time_span_days = self.time_span_days
+        first_day = max(first_day, 0)
+        last_day = min(last_day, time_span_days)
+        for person_id in sorted(self.person_index):
+            offset = self.person_index[person_id] * time_span_days
+            for day in range(first_day, last_day):
+                shift_idx = self.grid[offset + day]
+                if shift_idx != NO_TASK:
+                    yield person_id, day, self.shift_ids[shift_idx]
+
+
+def iter_bits(value):
+    """
+    Yield indexes of set bits of an int bitset, lowest first
+    """
+    while value:
+        low_bit = value & -value
+        yield low_bit.bit_length() - 1
+        value ^= low_bit
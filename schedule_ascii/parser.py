@@ -1,22 +1,174 @@
 from os import path
+import re
 import json
+import hashlib
 import logging
 import datetime
 
 
 LOG = logging.getLogger(__name__)
 
+# size of chunks read from file by the streaming reader
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# top level arrays stored to db, in storage order
+SECTIONS = [
+    "people",
+    "shifts",
+    "tasks",
+    "coverages",
+    "preallocations",
+    "day_exclusions",
+]
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# chars a complete top level number can be followed by
+NUMBER_END = set(",]} \t\n\r")
+
+
+def file_hash(file_path):
+    """
+    Return sha256 hex digest of a file content, file is read by chunks
+    :param file_path:
+    :return:
+    """
+    with open(file_path, "rb") as fp:
+        return hashlib.file_digest(fp, "sha256").hexdigest()
+
+
+def store_rows(db_adapter, table_rows):
+    """
+    Store (table, row) tuples, rows are bulk inserted within a single transaction
+    and indexes are created once data is loaded, then people aggregates are computed
+    :param db_adapter:
+    :param table_rows: iterable of (table, row) tuples, see JSONParser.rows
+    :return:
+    """
+    with db_adapter.span("insert"):
+        db_adapter.begin()
+        try:
+            db_adapter.bulk_insert(table_rows)
+            db_adapter.create_indexes()
+        except Exception:
+            db_adapter.rollback()
+            raise
+        db_adapter.commit()
+
+    # store people aggregated data
+    with db_adapter.span("aggregates"):
+        db_adapter.refresh_person_aggregates()
+        db_adapter.commit()
+
+
+class JSONStreamReader:
+    """
+    Incremental reader of a JSON document made of a top level object.
+    Iterating yields (key, value) tuples in file order, array values are decoded and yielded
+    one element at a time, so only the current element is held in memory.
+    """
+
+    def __init__(self, fp, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._decode()
+            self._expect(":")
+            if self._peek() == "[":
+                self.pos += 1
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self._decode()
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                yield key, self._decode()
+            if self._expect(",}") == "}":
+                return
+
+    def _fill(self):
+        """
+        Drop consumed buffer data and read next chunk
+        :return: False when end of file is reached
+        """
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        if not chunk:
+            self.eof = True
+        return not self.eof
+
+    def _peek(self):
+        """
+        Skip whitespaces and return next char, empty string at end of file
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(
+                f"Expecting one of {chars!r}", self.buffer, self.pos
+            )
+        self.pos += 1
+        return char
+
+    def _decode(self):
+        """
+        Decode next JSON value, reading more data until it is complete
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number is complete once followed by a delimiter, ie "1." of a cut "1.5" decodes as 1
+            if (
+                isinstance(value, (int, float))
+                and not isinstance(value, bool)
+                and (end == len(self.buffer) or self.buffer[end] not in NUMBER_END)
+                and self._fill()
+            ):
+                continue
+            self.pos = end
+            return value
+
 
 class JSONParser:
     """
     parse json data and store to an sqlite DB file
     """
 
-    def __init__(self, json_file_path):
+    def __init__(self, json_file_path, streaming=False):
         self.json_file_path = path.abspath(json_file_path)
+        self.streaming = streaming
 
-        # load data file
-        self.json_data = json.load(open(self.json_file_path))
+        # load data file, in streaming mode data is read while storing
+        self.json_data = None
+        if not streaming:
+            with open(self.json_file_path) as fp:
+                self.json_data = json.load(fp)
 
     def store(self, db_adapter):
         """
@@ -26,131 +178,142 @@ class JSONParser:
         shift_label(shift_id, label)
         task_label(task_id, label)
 
-        Store json data to db tables
+        Store json data to db tables, see store_rows
         :return:
         """
+        store_rows(db_adapter, self.rows())
 
-        db_adapter.insert(
-            "schedule",
-            (
-                0,
-                self.json_data["schedule"]["start_day"],
-                self.json_data["schedule"]["num_of_days"],
-            ),
-        )
-        schedule_start = datetime.date.fromisoformat(
-            self.json_data["schedule"]["start_day"]
-        )
-
-        for person_data in self.json_data["people"]:
-            db_adapter.insert(
-                "person",
-                (
-                    person_data["id"],
-                    person_data["activity_rate"],
-                    0,
-                    0,
-                    person_data.get("work_target_minutes", 0) / 60,
-                    0,
-                    0,
-                    0,
-                ),
-            )
-
-        for shift_data in self.json_data["shifts"]:
-            db_adapter.insert(
-                "shift",
-                (
-                    shift_data["id"],
-                    shift_data["display_name"],
-                    "",
-                    shift_data["effective_duration"] / 3600,
-                    shift_data["start_time"],
-                    shift_data["end_time"],
-                ),
-            )
-            for label in shift_data.get("labels", []):
-                db_adapter.insert("shift_label", (shift_data["id"], label))
-
-        for i, task_data in enumerate(self.json_data["tasks"]):
-            task_date = datetime.date.fromisoformat(task_data["day"])
-            task_date_int = (task_date - schedule_start).days
-            db_adapter.insert(
-                "task",
-                (
-                    i,
-                    task_data["person"],
-                    task_data["shift"],
-                    task_date_int,
-                ),
-            )
-            if task_date.weekday() in [5, 6] and task_data["shift"] not in [
-                "HOL",
-                "OFF",
-            ]:
-                db_adapter.insert(
-                    "task_label",
-                    (i, "weekend"),
-                )
+    def items(self):
+        """
+        Yield ("schedule", schedule_data) first, then (section, element) for each element
+        of SECTIONS arrays.
+        In streaming mode the file is read once, elements of sections written before the schedule
+        key are held until it is read. Files starting with the schedule key hold no element
+        :return:
+        """
+        if not self.streaming:
+            yield "schedule", self.json_data["schedule"]
+            for section in SECTIONS:
+                for element in self.json_data[section]:
+                    yield section, element
+            return
 
-        coverage_person_id = 0
-        for i, coverage_data in enumerate(self.json_data["coverages"]):
-            db_adapter.insert(
-                "coverage",
-                (
-                    i,
-                    coverage_data["min_value"],
-                    coverage_data["max_value"],
-                    coverage_data["shift"],
-                    coverage_data["day"],
-                ),
-            )
-            for person in coverage_data["people"]:
-                db_adapter.insert(
-                    "coverage_person",
-                    (coverage_person_id, i, person),
-                )
-                coverage_person_id += 1
-
-        for i, preallocation_data in enumerate(self.json_data["preallocations"]):
-            db_adapter.insert(
-                "preallocation",
-                (
-                    i,
-                    preallocation_data["shift"] if preallocation_data["shift"] else "",
-                    preallocation_data["person"],
-                    preallocation_data["type"],
-                    preallocation_data["day"],
-                ),
-            )
+        # elements read before schedule, None once schedule is yielded
+        held_items = []
+        with open(self.json_file_path) as fp:
+            for key, value in JSONStreamReader(fp):
+                if key == "schedule":
+                    yield "schedule", value
+                    yield from held_items
+                    held_items = None
+                elif key in SECTIONS:
+                    if held_items is None:
+                        yield key, value
+                    else:
+                        held_items.append((key, value))
+        if held_items is not None:
+            raise KeyError("schedule")
 
+    def rows(self):
+        """
+        Yield (table, row) tuples for all json data
+        :return:
+        """
+        schedule_start = None
+        task_id = 0
+        coverage_id = 0
+        # people list: pool id, each distinct coverage people list is stored once
+        pools = {}
+        preallocation_id = 0
         exclusion_id = 0
-        for exclusion_data in self.json_data["day_exclusions"]:
-            for person_id in exclusion_data["people"]:
-                for shift_id in exclusion_data["shifts"]:
-                    for day in exclusion_data["days"]:
-                        db_adapter.insert(
-                            "exclusion",
-                            (exclusion_id, shift_id, person_id, day),
-                        )
-                        exclusion_id += 1
 
-        db_adapter.commit()
+        for section, data in self.items():
+            if section == "schedule":
+                yield "schedule", (0, data["start_day"], data["num_of_days"])
+                schedule_start = datetime.date.fromisoformat(data["start_day"])
 
-        # store people aggregated data
-        for person_id, night_count in db_adapter.select_person_nights():
-            db_adapter.update(
-                "person", f"id='{person_id}'", f"night_count={night_count}"
-            )
+            elif section == "people":
+                yield (
+                    "person",
+                    (
+                        data["id"],
+                        data["activity_rate"],
+                        0,
+                        0,
+                        data.get("work_target_minutes", 0) / 60,
+                        0,
+                        0,
+                        0,
+                    ),
+                )
 
-        for person_id, weekend_count in db_adapter.select_person_weekends():
-            db_adapter.update(
-                "person", f"id='{person_id}'", f"weekend_count={weekend_count}"
-            )
+            elif section == "shifts":
+                yield (
+                    "shift",
+                    (
+                        data["id"],
+                        data["display_name"],
+                        "",
+                        data["effective_duration"] / 3600,
+                        data["start_time"],
+                        data["end_time"],
+                    ),
+                )
+                for label in data.get("labels", []):
+                    yield "shift_label", (data["id"], label)
 
-        for person_id, effective_hours in db_adapter.select_person_effective_hours():
-            db_adapter.update(
-                "person", f"id='{person_id}'", f"effective_hours={effective_hours}"
-            )
+            elif section == "tasks":
+                task_date = datetime.date.fromisoformat(data["day"])
+                task_date_int = (task_date - schedule_start).days
+                yield "task", (task_id, data["person"], data["shift"], task_date_int)
+                if task_date.weekday() in [5, 6] and data["shift"] not in [
+                    "HOL",
+                    "OFF",
+                ]:
+                    yield "task_label", (task_id, "weekend")
+                task_id += 1
 
-        db_adapter.commit()
+            elif section == "coverages":
+                people = tuple(data["people"])
+                pool_id = pools.get(people)
+                if pool_id is None:
+                    pool_id = pools[people] = len(pools)
+                    yield "people_pool", (pool_id,)
+                    for person in people:
+                        yield "pool_person", (pool_id, person)
+                yield (
+                    "coverage",
+                    (
+                        coverage_id,
+                        data["min_value"],
+                        data["max_value"],
+                        data["shift"],
+                        data["day"],
+                        pool_id,
+                    ),
+                )
+                coverage_id += 1
+
+            elif section == "preallocations":
+                yield (
+                    "preallocation",
+                    (
+                        preallocation_id,
+                        data["shift"] if data["shift"] else "",
+                        data["person"],
+                        data["type"],
+                        data["day"],
+                    ),
+                )
+                preallocation_id += 1
+
+            elif section == "day_exclusions":
+                # rules are stored as is, people x shifts x days are not expanded
+                yield "exclusion_rule", (exclusion_id,)
+                for person_id in data["people"]:
+                    yield "exclusion_person", (exclusion_id, person_id)
+                for shift_id in data["shifts"]:
+                    yield "exclusion_shift", (exclusion_id, shift_id)
+                for day in data["days"]:
+                    yield "exclusion_day", (exclusion_id, day)
+                exclusion_id += 1
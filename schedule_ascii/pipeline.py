@@ -0,0 +1,191 @@
+"""
+Pipelined execution: JSON rows are produced by a parser thread and handed over through a bounded
+queue while earlier rows are written to the db, then capacity and schedule are rendered at the
+same time, each on its own read connection, and written in asr.draw order.
+sqlite releases the GIL while running statements, so that stages overlap.
+"""
+
+import io
+import sys
+import queue
+import logging
+import threading
+import concurrent.futures
+
+from schedule_ascii.db import DBAdapter, DEFAULT_BATCH_SIZE
+from schedule_ascii.parser import JSONParser
+from schedule_ascii.drawer import ScheduleDrawer, CapacityDrawer
+from schedule_ascii.profiling import Profiler
+
+LOG = logging.getLogger(__name__)
+
+# count of row batches buffered between parser thread and db writer
+DEFAULT_QUEUE_SIZE = 8
+
+# seconds between checks of a stopped consumer when the queue is full
+PUT_TIMEOUT = 0.1
+
+_DONE = object()
+
+
+class RowProducer:
+    """
+    Parse a JSON file in a background thread, rows are handed over in batches through a bounded queue
+    so that parsing runs at most queue_size batches ahead of the consumer
+    """
+
+    def __init__(
+        self,
+        json_file_path,
+        streaming=False,
+        batch_size=DEFAULT_BATCH_SIZE,
+        queue_size=DEFAULT_QUEUE_SIZE,
+    ):
+        """
+        :param json_file_path:
+        :param streaming: read JSON file one array element at a time
+        :param batch_size: count of rows per queued batch
+        :param queue_size: count of batches buffered
+        """
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.produce,
+            args=(json_file_path, streaming, batch_size),
+            name="json-parser",
+            daemon=True,
+        )
+        self.thread.start()
+
+    def produce(self, json_file_path, streaming, batch_size):
+        try:
+            batch = []
+            for table_row in JSONParser(json_file_path, streaming=streaming).rows():
+                batch.append(table_row)
+                if len(batch) >= batch_size:
+                    self.put(batch)
+                    batch = []
+            if batch:
+                self.put(batch)
+            self.put(_DONE)
+        except Exception as err:
+            # raised again by the consumer
+            self.put(err)
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=PUT_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def rows(self):
+        """
+        Yield (table, row) tuples in JSONParser.rows order, parser errors are raised in the consumer thread.
+        The parser thread is stopped when the consumer stops iterating
+        """
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield from item
+        finally:
+            self.stopped.set()
+
+
+def render_capacity(
+    db_filename, capacity_backend, day_range, pragmas, profiler=None, auditor=None
+):
+    """
+    Draw capacity to a string, on a new read connection
+    :param profiler: optional Profiler of this thread, see draw_parallel
+    :param auditor: optional audit.QueryPlanAuditor
+    """
+    db_adapter = DBAdapter(
+        db_filename, reset=False, pragmas=pragmas, profiler=profiler, auditor=auditor
+    )
+    try:
+        output = io.StringIO()
+        with db_adapter.span("capacity"):
+            CapacityDrawer(db_adapter, backend=capacity_backend, stream=output).draw(
+                day_range
+            )
+        return output.getvalue()
+    finally:
+        db_adapter.close()
+
+
+def render_schedule(db_filename, day_range, pragmas, profiler=None, auditor=None):
+    """
+    Draw shifts display and schedule to a string, on a new read connection
+    :param profiler: optional Profiler of this thread, see draw_parallel
+    :param auditor: optional audit.QueryPlanAuditor
+    """
+    db_adapter = DBAdapter(
+        db_filename, reset=False, pragmas=pragmas, profiler=profiler, auditor=auditor
+    )
+    try:
+        output = io.StringIO()
+        schedule_drawer = ScheduleDrawer(db_adapter, stream=output)
+        for shift in db_adapter.select("shift", ["id", "ascii_display"]):
+            schedule_drawer.write_line(f"{shift[0]} {shift[1]}")
+        with db_adapter.span("schedule"):
+            schedule_drawer.draw(day_range)
+        return output.getvalue()
+    finally:
+        db_adapter.close()
+
+
+def draw_parallel(
+    db_adapter, capacity_backend="sql", stream=None, day_range=None, pragmas=None
+):
+    """
+    Same report as asr.draw, capacity and schedule are rendered at the same time on their own
+    read connection to the db file. Shift ascii displays are initialized and committed first.
+    Each reader records to its own Profiler, merged to the db_adapter profiler once rendered. Readers
+    share the db_adapter auditor, which must not create indexes while another connection reads
+    :param db_adapter: DBAdapter of a file backed db
+    :param capacity_backend: "sql" or "numpy", see CapacityDrawer
+    :param stream: text stream the report is written to, defaults to sys.stdout
+    :param day_range: range of days drawn by capacity & tasks grid, defaults to all days
+    :param pragmas: dict of PRAGMA settings of read connections
+    :return:
+    """
+    with db_adapter.span("init_shift_ascii_display"):
+        ScheduleDrawer(db_adapter).init_shift_ascii_display()
+        db_adapter.commit()
+
+    profilers = (
+        [Profiler(), Profiler()] if db_adapter.profiler is not None else [None, None]
+    )
+    with db_adapter.span("render"):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            capacity = executor.submit(
+                render_capacity,
+                db_adapter.db_filename,
+                capacity_backend,
+                day_range,
+                pragmas,
+                profilers[0],
+                db_adapter.auditor,
+            )
+            schedule = executor.submit(
+                render_schedule,
+                db_adapter.db_filename,
+                day_range,
+                pragmas,
+                profilers[1],
+                db_adapter.auditor,
+            )
+            outputs = [capacity.result(), schedule.result()]
+        for profiler in profilers:
+            if profiler is not None:
+                db_adapter.profiler.merge(profiler)
+
+    stream = stream if stream is not None else sys.stdout
+    for output in outputs:
+        stream.write(output)
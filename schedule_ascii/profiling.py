@@ -0,0 +1,127 @@
+import re
+import json
+import time
+import contextlib
+
+STATEMENT_KINDS = ["select", "insert", "update", "delete", "create"]
+TRANSACTION_KINDS = ["begin", "commit", "rollback"]
+
+
+class Profiler:
+    """
+    Collect named timing spans and per statement counters, opt-in:
+    DBAdapter and do_draw only record when a profiler is given
+    """
+
+    def __init__(self):
+        self.spans = []
+        # normalized statement: [kind, count, rows, seconds, max_seconds]
+        self.statements = {}
+        self.depth = 0
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """
+        Time a named block of code
+        """
+        span = {"name": name, "depth": self.depth, "seconds": None}
+        self.spans.append(span)
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span["seconds"] = time.perf_counter() - start
+            self.depth -= 1
+
+    def record(self, request, seconds, rows=1):
+        """
+        Record a statement execution
+        :param request: SQL statement
+        :param seconds: execution time
+        :param rows: count of parameter rows, for executemany
+        """
+        statement = " ".join(request.split())
+        stats = self.statements.get(statement)
+        if stats is None:
+            stats = self.statements[statement] = [statement_kind(statement), 0, 0, 0, 0]
+        stats[1] += 1
+        stats[2] += rows
+        stats[3] += seconds
+        stats[4] = max(stats[4], seconds)
+
+    def merge(self, other):
+        """
+        Add spans and statement counters of another profiler, ie of a profiler used by another thread.
+        Spans are nested in the currently open span
+        :param other: Profiler
+        """
+        for span in other.spans:
+            self.spans.append(dict(span, depth=span["depth"] + self.depth))
+        for statement, (
+            kind,
+            count,
+            rows,
+            seconds,
+            max_seconds,
+        ) in other.statements.items():
+            stats = self.statements.get(statement)
+            if stats is None:
+                stats = self.statements[statement] = [kind, 0, 0, 0, 0]
+            stats[1] += count
+            stats[2] += rows
+            stats[3] += seconds
+            stats[4] = max(stats[4], max_seconds)
+
+    def slowest(self, top=10):
+        """
+        Return top statements sorted by cumulative time
+        """
+        statements = sorted(
+            self.statements.items(), key=lambda item: item[1][3], reverse=True
+        )
+        return [
+            {
+                "statement": statement,
+                "kind": kind,
+                "count": count,
+                "rows": rows,
+                "seconds": seconds,
+                "max_seconds": max_seconds,
+            }
+            for statement, (kind, count, rows, seconds, max_seconds) in statements[:top]
+        ]
+
+    def report(self, top=10):
+        """
+        Return a JSON serializable report of spans, counters by statement kind and slowest statements
+        """
+        kinds = {}
+        for kind, count, rows, seconds, _ in self.statements.values():
+            kind_stats = kinds.setdefault(kind, {"count": 0, "rows": 0, "seconds": 0})
+            kind_stats["count"] += count
+            kind_stats["rows"] += rows
+            kind_stats["seconds"] += seconds
+        return {
+            "spans": self.spans,
+            "statements": kinds,
+            "distinct_statements": len(self.statements),
+            "slowest": self.slowest(top),
+        }
+
+    def write(self, fp, top=10):
+        json.dump(self.report(top), fp, indent=2)
+        fp.write("\n")
+
+
+def statement_kind(statement):
+    """
+    Return statement kind, statements starting with a WITH clause get the kind of their main statement
+    """
+    kind = statement.split(" ", 1)[0].lower()
+    if kind == "with":
+        match = re.search(r"\)\s*(SELECT|INSERT|UPDATE|DELETE)\s", statement, re.I)
+        kind = match.group(1).lower() if match else "select"
+    if kind in TRANSACTION_KINDS:
+        return "transaction"
+    return kind if kind in STATEMENT_KINDS else "other"
@@ -0,0 +1,310 @@
+import io
+import os
+import asyncio
+import logging
+import argparse
+import collections
+import urllib.parse
+import concurrent.futures
+from http import HTTPStatus
+
+from schedule_ascii.asr import load_db, draw, parse_days
+from schedule_ascii.db import FAST_PRAGMAS
+from schedule_ascii.parser import file_hash
+from schedule_ascii.drawer import ScheduleDrawer, CapacityDrawer
+
+logging.basicConfig()
+LOG = logging.getLogger(__name__)
+
+# count of schedules kept loaded
+DEFAULT_MAX_ENTRIES = 8
+
+REPORTS = ["capacity", "grid", "analytics", "report"]
+
+
+class ScheduleEntry:
+    """
+    Loaded schedule, stat and hash of its source JSON file are kept to detect changes
+    """
+
+    def __init__(self, json_file_path, db_adapter, stat, source_hash):
+        self.json_file_path = json_file_path
+        self.db_adapter = db_adapter
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.source_hash = source_hash
+
+    def is_stale(self, stat):
+        """
+        Check whether source JSON file changed, the file is hashed only if its mtime or size changed
+        so that touched but unchanged files are not reloaded
+        :param stat: os.stat_result of the source JSON file
+        :return:
+        """
+        if stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size:
+            return False
+        source_hash = file_hash(self.json_file_path)
+        if source_hash != self.source_hash:
+            return True
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        return False
+
+
+class ScheduleCache:
+    """
+    Size bounded LRU of schedules loaded to in memory dbs or ScheduleModel, keyed by JSON file path.
+    Not thread safe, sqlite connections must be used from the thread that opened them
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, **load_options):
+        """
+        :param max_entries: count of schedules kept loaded, least recently used ones are closed
+        :param load_options: load_db keyword arguments
+        """
+        self.max_entries = max_entries
+        self.load_options = load_options
+        self.entries = collections.OrderedDict()
+
+    def get(self, json_file_path):
+        """
+        Return loaded db of a JSON file, the file is (re)loaded if not cached or if it changed
+        :param json_file_path:
+        :return: DBAdapter
+        """
+        stat = os.stat(json_file_path)
+        entry = self.entries.get(json_file_path)
+        if entry is not None and entry.is_stale(stat):
+            LOG.info(f"{json_file_path} changed, reloading")
+            self.evict(json_file_path)
+            entry = None
+        if entry is None:
+            entry = self.load(json_file_path, stat)
+            self.entries[json_file_path] = entry
+            while len(self.entries) > self.max_entries:
+                self.evict(next(iter(self.entries)))
+        else:
+            self.entries.move_to_end(json_file_path)
+        return entry.db_adapter
+
+    def load(self, json_file_path, stat):
+        LOG.info(f"loading {json_file_path}")
+        source_hash = file_hash(json_file_path)
+        db_adapter = load_db(
+            json_file_path, in_memory=True, persist=False, **self.load_options
+        )
+        ScheduleDrawer(db_adapter).init_shift_ascii_display()
+        return ScheduleEntry(json_file_path, db_adapter, stat, source_hash)
+
+    def evict(self, json_file_path):
+        entry = self.entries.pop(json_file_path)
+        entry.db_adapter.close()
+
+    def clear(self):
+        for json_file_path in list(self.entries):
+            self.evict(json_file_path)
+
+
+def render(db_adapter, report, day_range=None, capacity_backend="sql"):
+    """
+    Draw a report of a loaded db to a string
+    :param db_adapter:
+    :param report: one of REPORTS, "report" is the full asr report
+    :param day_range: range of days drawn by capacity & tasks grid, defaults to all days
+    :param capacity_backend: "sql" or "numpy", see CapacityDrawer
+    :return:
+    """
+    output = io.StringIO()
+    if report == "capacity":
+        CapacityDrawer(db_adapter, backend=capacity_backend, stream=output).draw(
+            day_range
+        )
+    elif report == "grid":
+        schedule_drawer = ScheduleDrawer(db_adapter, stream=output)
+        schedule_drawer.draw_tasks(day_range)
+        schedule_drawer.flush()
+    elif report == "analytics":
+        schedule_drawer = ScheduleDrawer(db_adapter, stream=output)
+        schedule_drawer.draw_analytics()
+        schedule_drawer.flush()
+    elif report == "report":
+        draw(
+            db_adapter,
+            capacity_backend=capacity_backend,
+            stream=output,
+            day_range=day_range,
+        )
+    else:
+        raise ValueError(f"unknown report {report}")
+    return output.getvalue()
+
+
+class RenderService:
+    """
+    HTTP service drawing reports of schedules kept loaded in a ScheduleCache, ie
+    GET /capacity?path=schedule.json&days=0:28
+    All db work runs in a single worker thread, asyncio loop only handles connections
+    """
+
+    def __init__(self, root, capacity_backend="sql", **cache_options):
+        """
+        :param root: directory JSON file paths are relative to, paths outside of it are refused
+        :param capacity_backend: "sql" or "numpy", see CapacityDrawer
+        :param cache_options: ScheduleCache keyword arguments
+        """
+        self.root = os.path.realpath(root)
+        self.capacity_backend = capacity_backend
+        self.cache = ScheduleCache(**cache_options)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def resolve(self, path):
+        json_file_path = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, json_file_path]) != self.root:
+            raise PermissionError(f"{path} is outside of served directory")
+        return json_file_path
+
+    def render(self, report, path, day_range):
+        return render(
+            self.cache.get(self.resolve(path)),
+            report,
+            day_range=day_range,
+            capacity_backend=self.capacity_backend,
+        )
+
+    async def respond(self, method, target):
+        """
+        Route a request
+        :return: tuple of (HTTPStatus, body)
+        """
+        if method != "GET":
+            return HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed\n"
+        url = urllib.parse.urlsplit(target)
+        report = url.path.strip("/")
+        if report not in REPORTS:
+            return HTTPStatus.NOT_FOUND, f"unknown report {url.path}\n"
+        query = urllib.parse.parse_qs(url.query)
+        if "path" not in query:
+            return HTTPStatus.BAD_REQUEST, "missing path parameter\n"
+        try:
+            day_range = parse_days(query["days"][0]) if "days" in query else None
+        except argparse.ArgumentTypeError as err:
+            return HTTPStatus.BAD_REQUEST, f"{err}\n"
+
+        loop = asyncio.get_running_loop()
+        try:
+            body = await loop.run_in_executor(
+                self.executor, self.render, report, query["path"][0], day_range
+            )
+        except PermissionError as err:
+            return HTTPStatus.FORBIDDEN, f"{err}\n"
+        except FileNotFoundError as err:
+            return HTTPStatus.NOT_FOUND, f"{err}\n"
+        except Exception:
+            LOG.exception(f"failed to render {target}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, "render failed\n"
+        return HTTPStatus.OK, body
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            # skip headers, requests have no body
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.split()
+            if len(parts) != 3:
+                status, body = HTTPStatus.BAD_REQUEST, "malformed request\n"
+            else:
+                status, body = await self.respond(parts[0], parts[1])
+            content = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                "Content-Type: text/plain; charset=utf-8\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+            )
+            writer.write(content)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8000, unix_path=None):
+        """
+        Serve requests until cancelled, on a unix socket if unix_path is set
+        """
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle, host=host, port=port)
+        LOG.warning(
+            f"serving {self.root} on "
+            + ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        )
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            # close cached connections from the thread that opened them
+            self.executor.submit(self.cache.clear).result()
+            self.executor.shutdown()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="service.py",
+        description="Serve capacity, grid and analytics reports over HTTP, recently used schedules\n"
+        "are kept loaded in memory and reloaded when their JSON file changes\n"
+        "ie GET /capacity?path=schedule.json&days=0:28, reports: " + ", ".join(REPORTS),
+    )
+    parser.add_argument(
+        "--root",
+        default=".",
+        help="directory JSON file paths are relative to, files outside of it are not served",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix", metavar="PATH", help="serve on a unix socket")
+    parser.add_argument(
+        "--max-entries",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help="count of schedules kept loaded",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="read JSON files one array element at a time instead of loading them at once",
+    )
+    parser.add_argument(
+        "--capacity-backend",
+        choices=CapacityDrawer.BACKENDS,
+        default="sql",
+        help="capacity computation backend, numpy backend requires numpy",
+    )
+    parser.add_argument(
+        "--model",
+        action="store_true",
+        help="keep schedules loaded as compact in process models instead of in memory sqlite dbs",
+    )
+    parser.add_argument(
+        "--fast-pragmas",
+        action="store_true",
+        help="keep journal & temp tables in memory",
+    )
+
+    parsed_args = parser.parse_args()
+
+    service = RenderService(
+        parsed_args.root,
+        capacity_backend=parsed_args.capacity_backend,
+        max_entries=parsed_args.max_entries,
+        streaming=parsed_args.stream,
+        pragmas=FAST_PRAGMAS if parsed_args.fast_pragmas else None,
+        model=parsed_args.model,
+    )
+    try:
+        asyncio.run(service.serve(parsed_args.host, parsed_args.port, parsed_args.unix))
+    except KeyboardInterrupt:
+        pass
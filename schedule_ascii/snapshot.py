@@ -0,0 +1,308 @@
+"""
+Binary schedule snapshot, written next to the sqlite file and memory mapped by later runs.
+
+Layout, all numbers little endian:
+    header: magic, format version, source JSON hash, time span in days, sections count
+    sections directory: (name, typecode, offset, length in bytes) for each section
+    sections, 8 bytes aligned:
+        - string tables ("s", NUL terminated utf-8): person & shift columns, schedule start day
+        - numeric columns ("q" int64 or "d" float64): person & shift columns,
+          "d" columns mixing ints and floats have a "<name>.int" flags section ("b")
+        - string and numeric columns having null values have a "<name>.null" flags section ("b"),
+          null values are stored as an empty string or 0
+        - grid ("h"): person x day shift indexes of the last task of each day, -1 if none
+        - needs ("q" or "d"), capacity & total_capacity ("q"): shift x day coverage matrices
+
+Grid and matrices are exposed as memoryviews of the mapping, nothing is copied so
+pages are shared by concurrent readers.
+"""
+
+import os
+import sys
+import mmap
+import array
+import struct
+import logging
+
+from schedule_ascii.model import ScheduleModel, Person, Shift, NO_TASK
+from schedule_ascii.drawer import ScheduleDrawer, CapacityDrawer
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b"SCHEDSNP"
+
+# bump when snapshot layout changes, invalidates existing snapshots
+FORMAT_VERSION = 2
+
+HEADER = struct.Struct("<8sH64sII")
+SECTION = struct.Struct("<32sc7xQQ")
+ALIGNMENT = 8
+
+# string columns, other columns are numeric
+PERSON_STRINGS = ["id"]
+SHIFT_STRINGS = ["id", "display_name", "ascii_display", "start_time", "end_time"]
+
+
+def snapshot_file_path(json_file_path):
+    """
+    Return snapshot file path stored next to the JSON file
+    """
+    return json_file_path[:-5] + ".snap"
+
+
+def pack_null_flags(name, values):
+    """
+    Return null flags section of a column, none if it has no null value
+    """
+    is_null = [value is None for value in values]
+    return [(f"{name}.null", "b", array.array("b", is_null))] if any(is_null) else []
+
+
+def pack_strings(name, values):
+    """
+    Return string table section, each string is NUL terminated. Other values are stored as text,
+    as sqlite TEXT columns do, ie an int id 5 is read back as "5"
+    """
+    values = list(values)
+    data = b"".join(
+        ("" if value is None else str(value)).encode() + b"\0" for value in values
+    )
+    return [(name, "s", data)] + pack_null_flags(name, values)
+
+
+def pack_numbers(name, values):
+    """
+    Return sections of a numeric column: int64 if all values are ints, float64 otherwise.
+    Columns mixing ints and floats get an extra int flags section so that values are
+    read back with their type, ie an int 0 is still drawn as 0 and not 0.0
+    :raise ValueError: if a value is neither a number nor null
+    """
+    values = list(values)
+    null_flags = pack_null_flags(name, values)
+    numbers = [0 if value is None else value for value in values]
+    for value in numbers:
+        if not isinstance(value, (int, float)):
+            raise ValueError(f"{name} value {value!r} is not a number")
+    is_int = [isinstance(value, int) for value in values if value is not None]
+    if all(is_int):
+        return [(name, "q", array.array("q", numbers))] + null_flags
+    sections = [(name, "d", array.array("d", numbers))]
+    if any(is_int):
+        sections.append(
+            (
+                f"{name}.int",
+                "b",
+                array.array("b", [isinstance(value, int) for value in numbers]),
+            )
+        )
+    return sections + null_flags
+
+
+def write_snapshot(snapshot_path, db_adapter, source_hash):
+    """
+    Write snapshot of a loaded db, shift ascii displays are initialized if not done yet.
+    File is written to a temporary path then renamed, so that readers never see a partial file
+    :param snapshot_path:
+    :param db_adapter: DBAdapter or ScheduleModel
+    :param source_hash: hash of the source JSON file, checked by open_snapshot
+    :return:
+    """
+    schedule_drawer = ScheduleDrawer(db_adapter)
+    schedule_drawer.init_shift_ascii_display()
+    start_day, time_span_days = db_adapter.select(
+        "schedule", ["start_day", "time_span_days"]
+    )[0]
+    days = list(range(time_span_days))
+
+    sections = pack_strings("start_day", [start_day])
+    people = db_adapter.select("person", Person.COLUMNS)
+    shifts = db_adapter.select("shift", Shift.COLUMNS)
+    for prefix, rows, columns, strings in [
+        ("person", people, Person.COLUMNS, PERSON_STRINGS),
+        ("shift", shifts, Shift.COLUMNS, SHIFT_STRINGS),
+    ]:
+        for i, column in enumerate(columns):
+            pack = pack_strings if column in strings else pack_numbers
+            sections.extend(pack(f"{prefix}_{column}", [row[i] for row in rows]))
+
+    # grid, tasks are listed in id order so that the last task of a day wins
+    person_index = {row[0]: i for i, row in enumerate(people)}
+    shift_index = {row[0]: i for i, row in enumerate(shifts)}
+    grid = array.array("h", [NO_TASK]) * (len(people) * time_span_days)
+    for person_id, shift_id, day in db_adapter.select(
+        "task", ["person_id", "shift_id", "day"]
+    ):
+        if (
+            person_id in person_index
+            and shift_id in shift_index
+            and 0 <= day < time_span_days
+        ):
+            grid[person_index[person_id] * time_span_days + day] = shift_index[shift_id]
+    sections.append(("grid", "h", grid))
+
+    needs, capacities, total_capacities = CapacityDrawer(db_adapter).compute_capacity(
+        days
+    )
+    cells = [(shift[0], day) for shift in shifts for day in days]
+    sections.extend(pack_numbers("needs", [needs.get(cell, 0) for cell in cells]))
+    sections.extend(
+        pack_numbers("capacity", [capacities.get(cell, 0) for cell in cells])
+    )
+    sections.extend(
+        pack_numbers("total_capacity", [total_capacities[day] for day in days])
+    )
+
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(
+            HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                source_hash.encode(),
+                time_span_days,
+                len(sections),
+            )
+        )
+        offset = align(HEADER.size + SECTION.size * len(sections))
+        directory = []
+        for name, typecode, data in sections:
+            if isinstance(data, array.array) and sys.byteorder != "little":
+                data = array.array(typecode, data)
+                data.byteswap()
+            data = bytes(data)
+            directory.append((name, typecode, offset, data))
+            offset = align(offset + len(data))
+        for name, typecode, offset, data in directory:
+            fp.write(SECTION.pack(name.encode(), typecode.encode(), offset, len(data)))
+        for name, typecode, offset, data in directory:
+            fp.write(b"\0" * (offset - fp.tell()))
+            fp.write(data)
+    os.replace(tmp_path, snapshot_path)
+    LOG.info(f"snapshot written to {snapshot_path}")
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def open_snapshot(snapshot_path, source_hash, profiler=None):
+    """
+    Open a snapshot if it exists and was written from a source with the given hash
+    :return: ScheduleSnapshot or None
+    """
+    try:
+        with open(snapshot_path, "rb") as fp:
+            header = fp.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, version, snapshot_hash, _, _ = HEADER.unpack(header)
+    if (
+        magic != MAGIC
+        or version != FORMAT_VERSION
+        or snapshot_hash.decode() != source_hash
+    ):
+        LOG.info(f"snapshot {snapshot_path} is stale")
+        return None
+    return ScheduleSnapshot(snapshot_path, profiler=profiler)
+
+
+class ScheduleSnapshot(ScheduleModel):
+    """
+    Read only schedule model of a memory mapped snapshot, draws schedule, shifts, people,
+    tasks grid, analytics and capacity (with the "snapshot" capacity backend).
+    Person and shift tables are decoded on open, grid and coverage matrices stay mapped
+    """
+
+    def __init__(self, snapshot_path, profiler=None):
+        super().__init__(profiler=profiler)
+        self.snapshot_path = snapshot_path
+        self.views = []
+        with open(snapshot_path, "rb") as fp:
+            self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.mm)
+        self.views.append(buffer)
+
+        _, _, _, time_span_days, count = HEADER.unpack_from(buffer)
+        self.sections = {}
+        for i in range(count):
+            name, typecode, offset, length = SECTION.unpack_from(
+                buffer, HEADER.size + i * SECTION.size
+            )
+            section = buffer[offset : offset + length]
+            self.views.append(section)
+            typecode = typecode.decode()
+            if typecode == "s":
+                value = bytes(section).decode().split("\0")[:-1]
+            elif sys.byteorder == "little":
+                value = section.cast(typecode)
+                self.views.append(value)
+            else:
+                value = array.array(typecode, section)
+                value.byteswap()
+            self.sections[name.rstrip(b"\0").decode()] = value
+        for name in [name for name in self.sections if name.endswith(".int")]:
+            flags = self.sections.pop(name)
+            values = self.sections[name[:-4]]
+            self.sections[name[:-4]] = [
+                int(value) if flag else value for value, flag in zip(values, flags)
+            ]
+        for name in [name for name in self.sections if name.endswith(".null")]:
+            flags = self.sections.pop(name)
+            values = self.sections[name[:-5]]
+            self.sections[name[:-5]] = [
+                None if flag else value for value, flag in zip(values, flags)
+            ]
+
+        self.schedule = (0, self.sections["start_day"][0], time_span_days)
+        self.person_ids = self.sections["person_id"]
+        self.person_index = {
+            person_id: i for i, person_id in enumerate(self.person_ids)
+        }
+        self.people = [
+            Person(i, *values)
+            for i, values in enumerate(
+                zip(*[self.sections[f"person_{column}"] for column in Person.COLUMNS])
+            )
+        ]
+        self.shift_ids = self.sections["shift_id"]
+        self.shift_index = {shift_id: i for i, shift_id in enumerate(self.shift_ids)}
+        self.shifts = [
+            Shift(i, *values)
+            for i, values in enumerate(
+                zip(*[self.sections[f"shift_{column}"] for column in Shift.COLUMNS])
+            )
+        ]
+        self.grid = self.sections["grid"]
+
+    def bulk_insert(self, table_rows):
+        raise NotImplementedError("snapshot is read only")
+
+    def compute_capacity(self, days):
+        """
+        Same as CapacityDrawer.compute_capacity, from stored coverage matrices
+        """
+        time_span_days = self.time_span_days
+        needs_matrix = self.sections["needs"]
+        capacity_matrix = self.sections["capacity"]
+        needs = {}
+        capacities = {}
+        for shift_idx, shift_id in enumerate(self.shift_ids):
+            offset = shift_idx * time_span_days
+            for day in days:
+                needs[(shift_id, day)] = needs_matrix[offset + day]
+                capacities[(shift_id, day)] = capacity_matrix[offset + day]
+        total_capacity = self.sections["total_capacity"]
+        return needs, capacities, {day: total_capacity[day] for day in days}
+
+    def close(self):
+        """
+        Release grid and matrices views, then unmap the file
+        """
+        self.grid = None
+        self.sections = {}
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.mm.close()
@@ -0,0 +1,193 @@
+import json
+import random
+import argparse
+import datetime
+
+LABELS = ["night", "day", "long", "oncall", "training", "admin"]
+
+
+def generate_schedule(
+    people=50,
+    days=28,
+    shifts=6,
+    labels=1,
+    coverage_density=0.5,
+    preallocations=2,
+    exclusions=5,
+    exclusion_fan_out=5,
+    start_day="2024-01-01",
+    seed=0,
+):
+    """
+    Generate a valid schedule JSON document, same parameters and seed give the same document
+    :param people: count of people
+    :param days: schedule time span in days
+    :param shifts: count of working shifts, HOL and OFF shifts are added
+    :param labels: count of labels per shift, shifts starting from 20:00 are labelled "night".
+        Generic "label-<n>" labels are added beyond LABELS
+    :param coverage_density: ratio of people part of each coverage people list
+    :param preallocations: count of preallocations per person
+    :param exclusions: count of day exclusion rules
+    :param exclusion_fan_out: count of people and of days of each day exclusion rule
+    :param start_day: schedule first day, iso format
+    :param seed: random seed
+    :return: schedule dict
+    """
+    rand = random.Random(seed)
+    start_date = datetime.date.fromisoformat(start_day)
+
+    people_data = [
+        {
+            "id": f"person-{i:05d}",
+            "activity_rate": rand.choice([50, 60, 80, 100]),
+            "work_target_minutes": rand.randint(days * 2, days * 6) * 60,
+        }
+        for i in range(people)
+    ]
+    people_ids = [person_data["id"] for person_data in people_data]
+
+    shifts_data = []
+    for i in range(shifts):
+        start_hour = rand.choice([6, 7, 8, 13, 14, 20, 21, 22])
+        duration = rand.choice([4, 6, 8, 10, 12])
+        label_names = LABELS[1:] + [
+            f"label-{n}" for n in range(len(LABELS) - 1, labels)
+        ]
+        shift_labels = rand.sample(label_names, labels)
+        if start_hour >= 20:
+            shift_labels = (["night"] + shift_labels)[:labels]
+        shifts_data.append(
+            {
+                "id": f"S{i:02d}",
+                "display_name": f"shift {i}",
+                "effective_duration": duration * 3600,
+                "start_time": f"{start_hour:02d}:00",
+                "end_time": f"{(start_hour + duration) % 24:02d}:00",
+                "labels": shift_labels,
+            }
+        )
+    for shift_id, display_name in [("OFF", "day off"), ("HOL", "holiday")]:
+        shifts_data.append(
+            {
+                "id": shift_id,
+                "display_name": display_name,
+                "effective_duration": 0,
+                "start_time": "00:00",
+                "end_time": "00:00",
+            }
+        )
+    working_shift_ids = [shift_data["id"] for shift_data in shifts_data[:shifts]]
+    shift_ids = [shift_data["id"] for shift_data in shifts_data]
+
+    tasks = []
+    for person_data in people_data:
+        for day in range(days):
+            if rand.random() * 100 < person_data["activity_rate"]:
+                tasks.append(
+                    {
+                        "person": person_data["id"],
+                        "shift": rand.choice(shift_ids),
+                        "day": (start_date + datetime.timedelta(days=day)).isoformat(),
+                    }
+                )
+
+    # people lists are shared by all coverages of a shift, as solver exports do
+    pool_size = max(1, int(people * coverage_density)) if people else 0
+    coverages = []
+    for shift_id in working_shift_ids:
+        pool = rand.sample(people_ids, pool_size)
+        for day in range(days):
+            coverages.append(
+                {
+                    "min_value": rand.randint(0, 3),
+                    "max_value": rand.randint(3, 6),
+                    "shift": shift_id,
+                    "day": day,
+                    "people": pool,
+                }
+            )
+
+    preallocations_data = []
+    if days:
+        for person_id in people_ids:
+            for _ in range(preallocations):
+                preallocation_type = rand.choice([1, 2])
+                preallocations_data.append(
+                    {
+                        "shift": (
+                            rand.choice(working_shift_ids)
+                            if preallocation_type == 2 and working_shift_ids
+                            else None
+                        ),
+                        "person": person_id,
+                        "type": preallocation_type,
+                        "day": rand.randrange(days),
+                    }
+                )
+
+    day_exclusions = []
+    if working_shift_ids:
+        for _ in range(exclusions):
+            day_exclusions.append(
+                {
+                    "people": rand.sample(people_ids, min(exclusion_fan_out, people)),
+                    "shifts": rand.sample(working_shift_ids, 1),
+                    "days": sorted(
+                        rand.sample(range(days), min(exclusion_fan_out, days))
+                    ),
+                }
+            )
+
+    return {
+        "schedule": {"start_day": start_day, "num_of_days": days},
+        "people": people_data,
+        "shifts": shifts_data,
+        "tasks": tasks,
+        "coverages": coverages,
+        "preallocations": preallocations_data,
+        "day_exclusions": day_exclusions,
+    }
+
+
+def write_schedule(json_file_path, **kwargs):
+    """
+    Generate a schedule and write it to a JSON file
+    :param json_file_path:
+    :param kwargs: generate_schedule parameters
+    :return:
+    """
+    with open(json_file_path, "w") as fp:
+        json.dump(generate_schedule(**kwargs), fp)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="synth.py",
+        description="Generate a synthetic schedule JSON file",
+    )
+    parser.add_argument("json_file_path", help="output file")
+    parser.add_argument("--people", type=int, default=50)
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--shifts", type=int, default=6)
+    parser.add_argument("--labels", type=int, default=1)
+    parser.add_argument("--coverage-density", type=float, default=0.5)
+    parser.add_argument("--preallocations", type=int, default=2)
+    parser.add_argument("--exclusions", type=int, default=5)
+    parser.add_argument("--exclusion-fan-out", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+
+    parsed_args = parser.parse_args()
+
+    write_schedule(
+        parsed_args.json_file_path,
+        people=parsed_args.people,
+        days=parsed_args.days,
+        shifts=parsed_args.shifts,
+        labels=parsed_args.labels,
+        coverage_density=parsed_args.coverage_density,
+        preallocations=parsed_args.preallocations,
+        exclusions=parsed_args.exclusions,
+        exclusion_fan_out=parsed_args.exclusion_fan_out,
+        seed=parsed_args.seed,
+    )
@@ -0,0 +1,135 @@
+"""
+Vectorized capacity computation: coverage people, preallocations and exclusions are loaded
+to boolean arrays indexed by (shift, person, day) and needs & capacities come from array reductions.
+numpy is an optional dependency, only required when this backend is selected.
+"""
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def compute_capacity(db_adapter, shift_ids, days, days_bounds):
+    """
+    Same as CapacityDrawer.compute_capacity, using numpy arrays
+    :param db_adapter:
+    :param shift_ids: list of shift ids
+    :param days: list of consecutive days
+    :param days_bounds: (first day, last day + 1)
+    :return: tuple of needs {(shift_id, day): value}, capacities {(shift_id, day): value}, total capacities {day: value}
+    """
+    if np is None:
+        raise ImportError("numpy is required by the numpy capacity backend")
+
+    days_where = "day >= ? AND day < ?"
+
+    shift_index = {shift_id: i for i, shift_id in enumerate(shift_ids)}
+    day_index = {day: i for i, day in enumerate(days)}
+    person_index = {}
+    for (person_id,) in db_adapter.select("person", ["id"]):
+        person_index.setdefault(person_id, len(person_index))
+
+    # people part of a coverage people list (shift, person, day), each distinct people pool
+    # is marked at once for all the (shift, day) cells of its coverages
+    pool_cells = {}
+    for shift_id, day, pool_id in db_adapter.select(
+        "coverage", ["shift_id", "day", "pool_id"], days_where, days_bounds
+    ):
+        if shift_id in shift_index and day in day_index:
+            pool_cells.setdefault(pool_id, []).append(
+                (shift_index[shift_id], day_index[day])
+            )
+    pool_people = {pool_id: [] for pool_id in pool_cells}
+    for pool_id, person_id in db_adapter.select(
+        "pool_person", ["pool_id", "person_id"]
+    ):
+        if pool_id in pool_people:
+            pool_people[pool_id].append(
+                person_index.setdefault(person_id, len(person_index))
+            )
+    shape = (len(shift_index), len(person_index), len(day_index))
+    available = np.zeros(shape, dtype=bool)
+    for pool_id, cells in pool_cells.items():
+        shift_idxs, day_idxs = np.array(cells).T
+        available[
+            shift_idxs[:, None],
+            np.array(pool_people[pool_id], dtype=np.intp),
+            day_idxs[:, None],
+        ] = True
+
+    # needs (shift, day), int and float values are summed apart and a cell is a float as soon as
+    # one of its values is, as sql sum does, ie a cell of int values is drawn as 2 and not 2.0
+    int_coverage = ([], [], [])
+    float_coverage = ([], [], [])
+    for shift_id, day, min_value in db_adapter.select(
+        "coverage", ["shift_id", "day", "min_value"], days_where, days_bounds
+    ):
+        if shift_id in shift_index and day in day_index:
+            target = int_coverage if isinstance(min_value, int) else float_coverage
+            target[0].append(shift_index[shift_id])
+            target[1].append(day_index[day])
+            target[2].append(min_value)
+    int_needs = np.zeros(shape[0::2], dtype=np.int64)
+    np.add.at(int_needs, int_coverage[:2], np.array(int_coverage[2], dtype=np.int64))
+    float_needs = np.zeros(shape[0::2], dtype=np.float64)
+    np.add.at(float_needs, float_coverage[:2], float_coverage[2])
+    is_float = np.zeros(shape[0::2], dtype=bool)
+    is_float[float_coverage[:2]] = True
+
+    # preallocations: a preallocation that is not of type 2 blocks all shifts,
+    # otherwise it blocks all shifts but its own one
+    blocks_all = np.zeros(shape[1:], dtype=bool)
+    blocks_others = np.zeros(shape[1:], dtype=np.int32)
+    blocks_others_own = np.zeros(shape, dtype=np.int16)
+    for shift_id, person_id, preallocation_type, day in db_adapter.select(
+        "preallocation",
+        ["shift_id", "person_id", "type", "day"],
+        days_where,
+        days_bounds,
+    ):
+        if person_id not in person_index or day not in day_index:
+            continue
+        person_idx, day_idx = person_index[person_id], day_index[day]
+        if preallocation_type is not None and preallocation_type != 2:
+            blocks_all[person_idx, day_idx] = True
+        elif shift_id is not None:
+            blocks_others[person_idx, day_idx] += 1
+            if shift_id in shift_index:
+                blocks_others_own[shift_index[shift_id], person_idx, day_idx] += 1
+    available &= ~blocks_all
+    available &= (blocks_others - blocks_others_own) == 0
+
+    # exclusions, each rule excludes the cross product of its shifts, people and days
+    excluded = np.zeros(shape, dtype=bool)
+    for rule_shift_ids, rule_person_ids, rule_days in db_adapter.select_exclusion_rules(
+        *days_bounds
+    ):
+        shift_idxs = [shift_index[i] for i in rule_shift_ids if i in shift_index]
+        person_idxs = [person_index[i] for i in rule_person_ids if i in person_index]
+        day_idxs = [day_index[day] for day in rule_days if day in day_index]
+        excluded[np.ix_(shift_idxs, person_idxs, day_idxs)] = True
+    available &= ~excluded
+
+    capacities = available.sum(axis=1)
+    total_capacities = available.any(axis=0).sum(axis=0)
+
+    needs_by_cell = {}
+    capacities_by_cell = {}
+    for shift_id, shift_idx in shift_index.items():
+        int_needs_row = int_needs[shift_idx].tolist()
+        float_needs_row = float_needs[shift_idx].tolist()
+        is_float_row = is_float[shift_idx].tolist()
+        capacities_row = capacities[shift_idx].tolist()
+        for day, day_idx in day_index.items():
+            needs_by_cell[(shift_id, day)] = (
+                int_needs_row[day_idx] + float_needs_row[day_idx]
+                if is_float_row[day_idx]
+                else int_needs_row[day_idx]
+            )
+            capacities_by_cell[(shift_id, day)] = capacities_row[day_idx]
+    return (
+        needs_by_cell,
+        capacities_by_cell,
+        dict(zip(day_index, total_capacities.tolist())),
+    )
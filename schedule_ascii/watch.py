@@ -0,0 +1,442 @@
+"""
+Watch mode: the db is loaded once, then each time the JSON file changes its rows are diffed
+by content against the loaded ones and only row deltas are applied. Aggregates of people with
+changed tasks, capacity of changed days and grid rows of changed people are recomputed,
+everything else is drawn from cached values.
+The grid draws the last task of a day in file order, inserted rows get new ids, so a change to a day
+having several tasks is applied by a full reload.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import collections
+
+from schedule_ascii.asr import load_db
+from schedule_ascii.parser import JSONParser, file_hash
+from schedule_ascii.drawer import ScheduleDrawer, CapacityDrawer, consecutive_runs
+
+LOG = logging.getLogger(__name__)
+
+# seconds between JSON file stat checks
+DEFAULT_INTERVAL = 0.5
+
+# tables diffed row by row, with their child tables:
+# (parent id column of child rows, child tables), child rows lead with their parent id
+DELTA_TABLES = {
+    "task": ("task_id", ["task_label"]),
+    "coverage": None,
+    "preallocation": None,
+    "exclusion_rule": (
+        "rule_id",
+        ["exclusion_person", "exclusion_shift", "exclusion_day"],
+    ),
+}
+CHILD_TABLES = {
+    child_table
+    for children in DELTA_TABLES.values()
+    if children
+    for child_table in children[1]
+}
+
+# people pool tables, coverages are diffed with their pool people list instead of pool id
+POOL_TABLES = {"people_pool", "pool_person"}
+
+# index of day column of coverage and preallocation rows without id,
+# days of exclusion rules are their exclusion_day child rows
+DAY_COLUMN = {"coverage": 3, "preallocation": 3}
+
+
+def index_rows(table_rows):
+    """
+    Split JSONParser.rows output into rows of tables that require a full reload when changed
+    (schedule, people, shifts) and delta table entries.
+    An entry is (table, row without id, child rows without ids), entries are mapped to the ids
+    of their rows, several ids if the same row is repeated. The pool id of coverage rows
+    is replaced by the pool people list, pool ids depend on the order lists first appear in.
+    Shift ids of tasks sharing a (person, day) are listed in file order
+    :param table_rows: iterable of (table, row)
+    :return: tuple of (list of base rows, {entry: list of ids}, {people list: pool id},
+        {(person_id, day): shift ids} of days having several tasks)
+    """
+    base_rows = []
+    entries = collections.defaultdict(list)
+    pools = {}
+    pool_people = {}
+    task_days = collections.defaultdict(list)
+    parent = None
+    for table, row in table_rows:
+        if table == "task":
+            task_days[(row[1], row[3])].append(row[2])
+        if table in POOL_TABLES:
+            if table == "people_pool":
+                pool_people[row[0]] = []
+            else:
+                pool_people[row[0]].append(row[1])
+            continue
+        if table == "coverage":
+            people = tuple(pool_people[row[-1]])
+            pools.setdefault(people, row[-1])
+            row = (*row[:-1], people)
+        if table in CHILD_TABLES:
+            parent[2].append((table, row[1:]))
+            continue
+        if parent is not None:
+            entries[(parent[0], parent[1], tuple(parent[2]))].append(parent[3])
+            parent = None
+        if table in DELTA_TABLES:
+            parent = (table, row[1:], [], row[0])
+        else:
+            base_rows.append((table, row))
+    if parent is not None:
+        entries[(parent[0], parent[1], tuple(parent[2]))].append(parent[3])
+    shared_days = {
+        key: tuple(shift_ids)
+        for key, shift_ids in task_days.items()
+        if len(shift_ids) > 1
+    }
+    return base_rows, entries, pools, shared_days
+
+
+class CachedCapacityDrawer(CapacityDrawer):
+    """
+    Capacity drawer keeping needs & capacity of each computed day, only invalidated days are recomputed
+    """
+
+    def __init__(self, db_adapter, **kwargs):
+        super().__init__(db_adapter, **kwargs)
+        # day: ({shift_id: needs}, {shift_id: capacity}, total capacity)
+        self.days_cache = {}
+
+    def invalidate(self, days=None):
+        """
+        :param days: days to recompute on next draw, defaults to all days
+        """
+        if days is None:
+            self.days_cache = {}
+        for day in days or ():
+            self.days_cache.pop(day, None)
+
+    def compute_capacity(self, days):
+        missing_days = [day for day in days if day not in self.days_cache]
+        for run_days in consecutive_runs(missing_days):
+            needs, capacities, total_capacities = super().compute_capacity(run_days)
+            for day in run_days:
+                self.days_cache[day] = ({}, {}, total_capacities[day])
+            for (shift_id, day), value in needs.items():
+                self.days_cache[day][0][shift_id] = value
+            for (shift_id, day), value in capacities.items():
+                self.days_cache[day][1][shift_id] = value
+
+        needs, capacities, total_capacities = {}, {}, {}
+        for day in days:
+            day_needs, day_capacities, total_capacities[day] = self.days_cache[day]
+            for shift_id, value in day_needs.items():
+                needs[(shift_id, day)] = value
+            for shift_id, value in day_capacities.items():
+                capacities[(shift_id, day)] = value
+        return needs, capacities, total_capacities
+
+
+class CachedScheduleDrawer(ScheduleDrawer):
+    """
+    Schedule drawer keeping tasks grid rows, only invalidated people rows are queried again
+    """
+
+    def __init__(self, db_adapter, **kwargs):
+        super().__init__(db_adapter, **kwargs)
+        # person_id: {day: display}, in person table order
+        self.rows_cache = None
+
+    def invalidate(self, person_ids=None):
+        """
+        :param person_ids: people whose rows are queried on next draw, defaults to all people
+        """
+        if person_ids is None or self.rows_cache is None:
+            self.rows_cache = None
+            return
+        for person_id in person_ids:
+            if person_id in self.rows_cache:
+                self.rows_cache[person_id] = None
+
+    def task_rows(self, days):
+        if self.rows_cache is None:
+            # all days are cached, drawn days are picked by draw_tasks
+            _, time_span_days = self.db_adapter.select(
+                "schedule", ["start_day", "time_span_days"]
+            )[0]
+            self.rows_cache = dict(super().task_rows(list(range(time_span_days))))
+        for person_id, task_items in self.rows_cache.items():
+            if task_items is None:
+                task_items = self.rows_cache[person_id] = {
+                    day: display
+                    for display, day in self.db_adapter.select_person_tasks(person_id)
+                }
+            yield person_id, task_items
+
+
+class ScheduleWatcher:
+    """
+    Keep a schedule db loaded and apply JSON file changes to it as row deltas
+    """
+
+    def __init__(
+        self,
+        json_file_path,
+        capacity_backend="sql",
+        day_range=None,
+        streaming=False,
+        **load_options,
+    ):
+        """
+        :param json_file_path:
+        :param capacity_backend: "sql" or "numpy", see CapacityDrawer
+        :param day_range: range of days drawn by capacity & tasks grid, defaults to all days
+        :param streaming: read JSON file one array element at a time
+        :param load_options: other load_db keyword arguments
+        """
+        self.json_file_path = json_file_path
+        self.capacity_backend = capacity_backend
+        self.day_range = day_range
+        self.streaming = streaming
+        self.load_options = load_options
+        self.db_adapter = None
+
+    def load(self):
+        """
+        Load JSON file to a new db and index its rows
+        """
+        if self.db_adapter is not None:
+            self.db_adapter.close()
+        self.stat = self.file_stat()
+        self.source_hash = file_hash(self.json_file_path)
+        self.db_adapter = load_db(
+            self.json_file_path, streaming=self.streaming, **self.load_options
+        )
+        self.base_rows, self.entries, self.pools, self.shared_days = index_rows(
+            JSONParser(self.json_file_path, streaming=self.streaming).rows()
+        )
+        self.next_ids = {
+            table: (self.db_adapter.select(table, ["max(id)"])[0][0] or 0) + 1
+            for table in [
+                "task",
+                "coverage",
+                "people_pool",
+                "preallocation",
+                "exclusion_rule",
+            ]
+        }
+        self.capacity_drawer = CachedCapacityDrawer(
+            self.db_adapter, backend=self.capacity_backend
+        )
+        self.schedule_drawer = CachedScheduleDrawer(self.db_adapter)
+        self.schedule_drawer.init_shift_ascii_display()
+
+    def file_stat(self):
+        stat = os.stat(self.json_file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def update(self):
+        """
+        Apply JSON file changes to the db, full reload if schedule, people or shifts changed
+        :return: description of applied changes, None if file content did not change
+        """
+        self.stat = self.file_stat()
+        source_hash = file_hash(self.json_file_path)
+        if source_hash == self.source_hash:
+            return None
+        base_rows, entries, _, shared_days = index_rows(
+            JSONParser(self.json_file_path, streaming=self.streaming).rows()
+        )
+        if base_rows != self.base_rows:
+            self.load()
+            return "schedule, people or shifts changed, full reload"
+        # tasks of a day are drawn in id order, which only matches file order if they did not change
+        if any(
+            self.shared_days.get(key) != shift_ids
+            for key, shift_ids in shared_days.items()
+        ):
+            self.load()
+            return "tasks sharing a day changed, full reload"
+
+        deleted_ids = collections.defaultdict(list)
+        inserted_rows = []
+        person_ids = set()
+        days = set()
+        for entry in set(self.entries) | set(entries):
+            ids = self.entries.get(entry, [])
+            count = len(entries.get(entry, ()))
+            if len(ids) == count:
+                continue
+            table, content, children = entry
+            if table == "task":
+                person_ids.add(content[0])
+            elif table == "exclusion_rule":
+                days.update(
+                    child_content[0]
+                    for child_table, child_content in children
+                    if child_table == "exclusion_day"
+                )
+            else:
+                days.add(content[DAY_COLUMN[table]])
+            if len(ids) > count:
+                deleted_ids[table].extend(ids[count:])
+                del ids[count:]
+            else:
+                for _ in range(count - len(ids)):
+                    row_id = self.next_id(table)
+                    ids.append(row_id)
+                    if table == "coverage":
+                        pool_id = self.pool_id(content[-1], inserted_rows)
+                        inserted_rows.append((table, (row_id, *content[:-1], pool_id)))
+                    else:
+                        inserted_rows.append((table, (row_id, *content)))
+                    for child_table, child_content in children:
+                        inserted_rows.append((child_table, (row_id, *child_content)))
+            if ids:
+                self.entries[entry] = ids
+            else:
+                self.entries.pop(entry, None)
+
+        self.db_adapter.begin()
+        try:
+            for table, ids in deleted_ids.items():
+                self.delete_rows(table, ids)
+            self.db_adapter.bulk_insert(inserted_rows)
+            if "coverage" in deleted_ids:
+                self.delete_unused_pools()
+        except Exception:
+            LOG.exception("failed to apply row deltas")
+            self.db_adapter.rollback()
+            self.load()
+            return "row deltas failed, full reload"
+        self.db_adapter.commit()
+        if person_ids:
+            self.db_adapter.refresh_person_aggregates(person_ids)
+            self.db_adapter.commit()
+        if self.load_options.get("cache") or self.load_options.get("rebuild"):
+            self.db_adapter.store_cache_key(source_hash)
+        self.source_hash = source_hash
+        self.shared_days = shared_days
+
+        self.schedule_drawer.invalidate(person_ids)
+        self.capacity_drawer.invalidate(days)
+        return (
+            f"{sum(len(ids) for ids in deleted_ids.values())} rows deleted, "
+            f"{len(inserted_rows)} rows inserted, "
+            f"{len(person_ids)} people and {len(days)} days recomputed"
+        )
+
+    def next_id(self, table):
+        row_id = self.next_ids[table]
+        self.next_ids[table] += 1
+        return row_id
+
+    def pool_id(self, people, inserted_rows):
+        """
+        Return id of the people pool of a people list, pool rows are added to inserted_rows
+        if the list is new. Pools no coverage references are deleted once deltas are applied
+        """
+        pool_id = self.pools.get(people)
+        if pool_id is None:
+            pool_id = self.pools[people] = self.next_id("people_pool")
+            inserted_rows.append(("people_pool", (pool_id,)))
+            inserted_rows.extend(
+                ("pool_person", (pool_id, person)) for person in people
+            )
+        return pool_id
+
+    def delete_unused_pools(self):
+        """
+        Delete people pools no coverage references anymore, ie once all coverages of a people list are deleted
+        """
+        pool_ids = [
+            pool_id
+            for (pool_id,) in self.db_adapter.select(
+                "people_pool", ["id"], "id NOT IN (SELECT pool_id FROM coverage_data)"
+            )
+        ]
+        if not pool_ids:
+            return
+        ids_param = (json.dumps(pool_ids),)
+        self.db_adapter.delete(
+            "pool_person", "pool_id IN (SELECT value FROM json_each(?))", ids_param
+        )
+        self.db_adapter.delete(
+            "people_pool", "id IN (SELECT value FROM json_each(?))", ids_param
+        )
+        unused_pool_ids = set(pool_ids)
+        self.pools = {
+            people: pool_id
+            for people, pool_id in self.pools.items()
+            if pool_id not in unused_pool_ids
+        }
+
+    def delete_rows(self, table, ids):
+        ids_param = (json.dumps(ids),)
+        children = DELTA_TABLES[table]
+        if children:
+            parent_column, child_tables = children
+            for child_table in child_tables:
+                self.db_adapter.delete(
+                    child_table,
+                    f"{parent_column} IN (SELECT value FROM json_each(?))",
+                    ids_param,
+                )
+        self.db_adapter.delete(
+            table, "id IN (SELECT value FROM json_each(?))", ids_param
+        )
+
+    def draw(self, stream=None):
+        """
+        Draw capacity, shifts display and schedule, same report as asr.draw
+        """
+        self.capacity_drawer.stream = stream
+        self.schedule_drawer.stream = stream
+        with self.db_adapter.span("capacity"):
+            self.capacity_drawer.draw(self.day_range)
+        for shift in self.db_adapter.select("shift", ["id", "ascii_display"]):
+            self.schedule_drawer.write_line(f"{shift[0]} {shift[1]}")
+        with self.db_adapter.span("schedule"):
+            self.schedule_drawer.draw(self.day_range)
+
+    def redraw(self, output=None):
+        """
+        Draw report to output file, replacing its content, or to stdout
+        """
+        if output is None:
+            self.draw(sys.stdout)
+            return
+        with open(output, "w") as fp:
+            self.draw(fp)
+
+    def run(self, output=None, interval=DEFAULT_INTERVAL):
+        """
+        Load and draw, then redraw each time the JSON file changes, until interrupted
+        :param output: report file path, report is written to stdout if not set
+        :param interval: seconds between JSON file stat checks
+        """
+        self.load()
+        self.redraw(output)
+        while True:
+            time.sleep(interval)
+            try:
+                if self.file_stat() == self.stat:
+                    continue
+                start = time.perf_counter()
+                changes = self.update()
+            except FileNotFoundError:
+                continue
+            except (ValueError, KeyError) as err:
+                # partially written or invalid JSON, wait for next change
+                LOG.warning(f"{self.json_file_path} not applied: {err}")
+                continue
+            if changes is None:
+                continue
+            self.redraw(output)
+            sys.stderr.write(
+                f"{self.json_file_path}: {changes}, "
+                f"redrawn in {(time.perf_counter() - start) * 1000:.0f} ms\n"
+            )
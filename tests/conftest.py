@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+
+from schedule_ascii.asr import load_db, draw
+from schedule_ascii.drawer import CapacityDrawer
+
+
+@pytest.fixture
+def write_schedule(tmp_path):
+    """
+    Write a schedule dict to a JSON file of tmp_path, return its path
+    """
+
+    def write(schedule, name="schedule.json"):
+        json_file_path = tmp_path / name
+        json_file_path.parent.mkdir(parents=True, exist_ok=True)
+        json_file_path.write_text(json.dumps(schedule))
+        return str(json_file_path)
+
+    return write
+
+
+@pytest.fixture
+def load_schedule(write_schedule):
+    """
+    Load a schedule dict or JSON file path with load_db, to an in memory db unless other
+    load_db options are given. Loaded adapters are closed on teardown
+    """
+    db_adapters = []
+
+    def load(schedule, **load_options):
+        json_file_path = (
+            schedule if isinstance(schedule, str) else write_schedule(schedule)
+        )
+        load_options = {"in_memory": True, "persist": False, **load_options}
+        db_adapter = load_db(json_file_path, **load_options)
+        db_adapters.append(db_adapter)
+        return db_adapter
+
+    yield load
+    for db_adapter in db_adapters:
+        db_adapter.close()
+
+
+@pytest.fixture
+def draw_report():
+    """
+    Draw the asr report of a loaded db to a string
+    """
+
+    def draw_to_string(db_adapter, **draw_options):
+        output = io.StringIO()
+        draw(db_adapter, stream=output, **draw_options)
+        return output.getvalue()
+
+    return draw_to_string
+
+
+@pytest.fixture
+def draw_capacity():
+    """
+    Draw capacity of a loaded db with a capacity backend to a string
+    """
+
+    def draw_to_string(db_adapter, backend="sql", day_range=None):
+        output = io.StringIO()
+        CapacityDrawer(db_adapter, backend=backend, stream=output).draw(day_range)
+        return output.getvalue()
+
+    return draw_to_string
@@ -0,0 +1,37 @@
+import os
+
+from schedule_ascii.batch import report_names, run
+from schedule_ascii.synth import generate_schedule
+
+
+def test_report_names_keep_directories():
+    assert report_names(["a/s.json", "b/s.json", "b/t.json"]) == [
+        os.path.join("a", "s.txt"),
+        os.path.join("b", "s.txt"),
+        os.path.join("b", "t.txt"),
+    ]
+    assert report_names(["a/s.json", "a/t.json"]) == ["s.txt", "t.txt"]
+
+
+def test_run_reports_same_name_files_and_failures(tmp_path, write_schedule):
+    json_file_paths = [
+        write_schedule(
+            generate_schedule(people=5, days=7, seed=seed), f"{directory}/schedule.json"
+        )
+        for directory, seed in [("a", 0), ("b", 1)]
+    ]
+    bad_json_file_path = tmp_path / "b" / "bad.json"
+    bad_json_file_path.write_text('{"people": [')
+    json_file_paths.append(str(bad_json_file_path))
+
+    output_dir = tmp_path / "reports"
+    summary = run(json_file_paths, workers=2, output_dir=str(output_dir))
+
+    assert [error is None for _, _, error in summary] == [True, True, False]
+    # the whole traceback is kept, up to the frame that failed
+    assert "JSONDecodeError" in summary[2][2]
+    assert "raw_decode" in summary[2][2]
+    reports = [
+        (output_dir / name).read_text() for name in ["a/schedule.txt", "b/schedule.txt"]
+    ]
+    assert all(reports) and reports[0] != reports[1]
@@ -0,0 +1,141 @@
+import datetime
+import importlib.util
+
+import pytest
+
+from schedule_ascii.drawer import CapacityDrawer, ScheduleDrawer
+from schedule_ascii.snapshot import ScheduleSnapshot
+from schedule_ascii.synth import generate_schedule
+
+
+def schedule_with_edge_cases():
+    schedule = generate_schedule(people=15, days=10, seed=7)
+    num_of_days = schedule["schedule"]["num_of_days"]
+    people = [person["id"] for person in schedule["people"]]
+    shifts = [shift["id"] for shift in schedule["shifts"]]
+    coverages = schedule["coverages"]
+    # coverage days out of range
+    coverages.append(
+        dict(coverages[0], day=num_of_days, min_value=4, people=people[:5])
+    )
+    coverages.append(dict(coverages[1], day=-1, min_value=2, people=people[:5]))
+    # pool people missing from people, overlapping people lists of a shift and day
+    coverages.append(
+        dict(coverages[2], min_value=1, people=["ghost-1", "ghost-2", people[0]])
+    )
+    coverages.append(dict(coverages[2], min_value=1, people=people[:3]))
+    # null preallocation types, on the coverage shift and on another one
+    schedule["preallocations"] += [
+        {"shift": coverages[2]["shift"], "person": people[1], "type": None, "day": 3},
+        {"shift": shifts[-1], "person": people[2], "type": None, "day": 4},
+        {"shift": shifts[0], "person": people[3], "type": 2, "day": -1},
+    ]
+    # several tasks of a person on one day, last one in file is drawn
+    tasks = schedule["tasks"]
+    tasks.append(dict(tasks[0], shift=shifts[1]))
+    tasks.append(dict(tasks[0], shift=shifts[2]))
+    return schedule
+
+
+def reference_capacity(schedule):
+    """
+    Needs, capacities and total capacities of each cell, computed from the schedule dict
+    """
+    days = range(schedule["schedule"]["num_of_days"])
+    shifts = {shift["id"] for shift in schedule["shifts"]}
+    needs = {}
+    pools = {}
+    for coverage in schedule["coverages"]:
+        if coverage["shift"] in shifts and coverage["day"] in days:
+            key = (coverage["shift"], coverage["day"])
+            needs[key] = needs.get(key, 0) + coverage["min_value"]
+            pools.setdefault(key, set()).update(coverage["people"])
+
+    def is_available(person_id, shift_id, day):
+        for preallocation in schedule["preallocations"]:
+            if preallocation["person"] == person_id and preallocation["day"] == day:
+                preallocation_type = preallocation["type"]
+                if (preallocation_type is not None and preallocation_type != 2) or (
+                    preallocation["shift"] != shift_id
+                ):
+                    return False
+        return not any(
+            person_id in rule["people"]
+            and shift_id in rule["shifts"]
+            and day in rule["days"]
+            for rule in schedule["day_exclusions"]
+        )
+
+    capacities = {}
+    available_people = {day: set() for day in days}
+    for (shift_id, day), pool in pools.items():
+        for person_id in pool:
+            if is_available(person_id, shift_id, day):
+                capacities[(shift_id, day)] = capacities.get((shift_id, day), 0) + 1
+                available_people[day].add(person_id)
+    total_capacities = {day: len(people) for day, people in available_people.items()}
+    return needs, capacities, total_capacities
+
+
+def reference_grid(schedule, displays):
+    """
+    Task display of each person and day, computed from the schedule dict
+    """
+    start_date = datetime.date.fromisoformat(schedule["schedule"]["start_day"])
+    num_of_days = schedule["schedule"]["num_of_days"]
+    grid = {person["id"]: {} for person in schedule["people"]}
+    for task in schedule["tasks"]:
+        day = (datetime.date.fromisoformat(task["day"]) - start_date).days
+        if task["person"] in grid and 0 <= day < num_of_days:
+            grid[task["person"]][day] = displays[task["shift"]]
+    return list(grid.items())
+
+
+def non_zero(values):
+    return {key: value for key, value in values.items() if value}
+
+
+@pytest.fixture
+def loaded_backends(write_schedule, load_schedule):
+    """
+    Load the edge cases schedule to each db backend, return (schedule, {name: (db_adapter, capacity backend)})
+    """
+    schedule = schedule_with_edge_cases()
+    json_file_path = write_schedule(schedule)
+    sql_db = load_schedule(json_file_path)
+    model = load_schedule(json_file_path, model=True)
+    backends = {"sql": (sql_db, "sql"), "model": (model, "sql")}
+    if importlib.util.find_spec("numpy") is not None:
+        backends["numpy"] = (sql_db, "numpy")
+    # first load writes the snapshot, next one opens it
+    load_schedule(json_file_path, in_memory=False, snapshot=True)
+    schedule_snapshot = load_schedule(json_file_path, in_memory=False, snapshot=True)
+    assert isinstance(schedule_snapshot, ScheduleSnapshot)
+    backends["snapshot"] = (schedule_snapshot, CapacityDrawer.SNAPSHOT_BACKEND)
+    return schedule, backends
+
+
+def test_capacity_backends_match_reference(loaded_backends):
+    schedule, backends = loaded_backends
+    days = list(range(schedule["schedule"]["num_of_days"]))
+    needs, capacities, total_capacities = reference_capacity(schedule)
+    for name, (db_adapter, backend) in backends.items():
+        backend_needs, backend_capacities, backend_total_capacities = CapacityDrawer(
+            db_adapter, backend=backend
+        ).compute_capacity(days)
+        assert non_zero(backend_needs) == non_zero(needs), name
+        assert non_zero(backend_capacities) == non_zero(capacities), name
+        assert backend_total_capacities == total_capacities, name
+
+
+def test_tasks_grid_backends_match_reference(loaded_backends):
+    schedule, backends = loaded_backends
+    days = list(range(schedule["schedule"]["num_of_days"]))
+    for name, (db_adapter, _) in backends.items():
+        schedule_drawer = ScheduleDrawer(db_adapter)
+        if not isinstance(db_adapter, ScheduleSnapshot):
+            schedule_drawer.init_shift_ascii_display()
+        displays = dict(db_adapter.select("shift", ["id", "ascii_display"]))
+        assert list(schedule_drawer.task_rows(days)) == reference_grid(
+            schedule, displays
+        ), name
@@ -0,0 +1,160 @@
+import io
+import copy
+import datetime
+
+import pytest
+
+from schedule_ascii import diff
+from schedule_ascii.drawer import CapacityDrawer, ScheduleDrawer
+from schedule_ascii.synth import generate_schedule
+
+
+def edited_schedules():
+    old = generate_schedule(people=20, days=14, seed=11, exclusions=3)
+    new = copy.deepcopy(old)
+    people = [person["id"] for person in new["people"]]
+    shifts = [shift["id"] for shift in new["shifts"]]
+    coverages = [coverage for coverage in new["coverages"] if coverage["people"]]
+    # needs of day 2, people list of day 4
+    next(c for c in coverages if c["day"] == 2)["min_value"] += 1
+    coverage = next(c for c in coverages if c["day"] == 4)
+    # people lists are shared by coverages
+    coverage["people"] = coverage["people"][:-1]
+    # preallocation on day 5, exclusion rule on day 6
+    person_id = next(c for c in coverages if c["day"] == 5)["people"][0]
+    new["preallocations"].append(
+        {"shift": None, "person": person_id, "type": 1, "day": 5}
+    )
+    new["day_exclusions"].append({"people": people, "shifts": shifts, "days": [6]})
+    return old, new
+
+
+@pytest.fixture
+def load_pair(write_schedule, load_schedule):
+    """
+    Load old and new schedule dicts with load_db options, shift ascii displays are initialized
+    """
+
+    def load(old, new, **load_options):
+        db_adapters = []
+        for name, schedule in [("old.json", old), ("new.json", new)]:
+            db_adapter = load_schedule(write_schedule(schedule, name), **load_options)
+            ScheduleDrawer(db_adapter).init_shift_ascii_display()
+            db_adapters.append(db_adapter)
+        return db_adapters
+
+    return load
+
+
+def capacity_changes(old_adapter, new_adapter):
+    output = io.StringIO()
+    (start_day, old_span), (_, new_span) = diff.DiffDrawer(
+        old_adapter, new_adapter
+    ).time_spans()
+    diff.DiffDrawer(old_adapter, new_adapter, stream=output).draw_capacity_changes(
+        datetime.date.fromisoformat(start_day), list(range(min(old_span, new_span)))
+    )
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("load_options", [{}, {"model": True}])
+def test_changed_input_days_cover_capacity_changes(load_pair, load_options):
+    old_adapter, new_adapter = load_pair(*edited_schedules(), **load_options)
+    days = list(range(14))
+    old_values = CapacityDrawer(old_adapter).compute_capacity(days)
+    new_values = CapacityDrawer(new_adapter).compute_capacity(days)
+    changed_days = {
+        key[1] if isinstance(key, tuple) else key
+        for old, new in zip(old_values, new_values)
+        for key in old.keys() | new.keys()
+        if old.get(key, 0) != new.get(key, 0)
+    }
+    input_days = diff.changed_input_days(old_adapter, new_adapter, 0, 14)
+    assert changed_days
+    assert changed_days <= set(input_days) <= {2, 4, 5, 6}
+
+
+def test_capacity_changes_match_all_days_diff(load_pair, monkeypatch):
+    old_adapter, new_adapter = load_pair(*edited_schedules())
+    drawn = capacity_changes(old_adapter, new_adapter)
+    monkeypatch.setattr(
+        diff,
+        "changed_input_days",
+        lambda old_adapter, new_adapter, first_day, last_day, day_offsets: list(
+            range(first_day, last_day)
+        ),
+    )
+    assert drawn == capacity_changes(old_adapter, new_adapter)
+    assert "changed capacity: 0 days" not in drawn
+
+
+def test_removed_shift_changes_its_coverage_days(load_pair):
+    old, _ = edited_schedules()
+    new = copy.deepcopy(old)
+    removed_shift = new["shifts"].pop()["id"]
+    old_adapter, new_adapter = load_pair(old, new)
+    coverage_days = {
+        coverage["day"]
+        for coverage in old["coverages"]
+        if coverage["shift"] == removed_shift
+    }
+    assert set(diff.changed_input_days(old_adapter, new_adapter, 0, 14)) == (
+        coverage_days
+    )
+
+
+def shifted_schedule(schedule, shift_days):
+    """
+    Same schedule starting shift_days later, inputs days are renumbered, tasks are kept by date
+    """
+    shifted = copy.deepcopy(schedule)
+    start_date = datetime.date.fromisoformat(schedule["schedule"]["start_day"])
+    shifted["schedule"]["start_day"] = (
+        start_date + datetime.timedelta(days=shift_days)
+    ).isoformat()
+    for section in ["coverages", "preallocations"]:
+        shifted[section] = [
+            dict(row, day=row["day"] - shift_days)
+            for row in schedule[section]
+            if row["day"] >= shift_days
+        ]
+    for rule in shifted["day_exclusions"]:
+        rule["days"] = [day - shift_days for day in rule["days"] if day >= shift_days]
+    return shifted
+
+
+@pytest.mark.parametrize("load_options", [{}, {"model": True}])
+def test_days_are_matched_by_date(load_pair, load_options):
+    old = generate_schedule(people=20, days=14, seed=12, exclusions=3)
+    new = shifted_schedule(old, 3)
+    start_date = datetime.date.fromisoformat(old["schedule"]["start_day"])
+    changed_task = next(
+        task
+        for task in new["tasks"]
+        if task["day"] == (start_date + datetime.timedelta(days=5)).isoformat()
+    )
+    old_shift_id = changed_task["shift"]
+    changed_task["shift"] = next(
+        shift["id"]
+        for shift in new["shifts"]
+        if shift["id"] not in (old_shift_id, "HOL", "OFF")
+    )
+    old_adapter, new_adapter = load_pair(old, new, **load_options)
+
+    changes = diff.task_changes(old_adapter, new_adapter, 0, 17, day_offsets=(0, 3))
+    # days 0 to 2 are only part of the old schedule, new tasks of day 14 to 16 are missing
+    assert {day for (_, day), _, new_shift_id in changes if new_shift_id is None} == {
+        0,
+        1,
+        2,
+    }
+    assert [
+        change for change in changes if change[2] is not None and change[1] is not None
+    ] == [((changed_task["person"], 5), old_shift_id, changed_task["shift"])]
+    assert diff.changed_input_days(old_adapter, new_adapter, 3, 14, (0, 3)) == []
+
+    output = io.StringIO()
+    diff.DiffDrawer(old_adapter, new_adapter, stream=output).draw()
+    drawn = output.getvalue()
+    assert f"days are counted from {start_date}" in drawn
+    assert "changed capacity: 0 days" in drawn
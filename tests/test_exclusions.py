@@ -0,0 +1,72 @@
+from schedule_ascii.synth import generate_schedule
+
+
+def schedule_with_exclusions():
+    schedule = generate_schedule(people=20, days=14, seed=8, exclusions=6)
+    people = [person["id"] for person in schedule["people"]]
+    shifts = [shift["id"] for shift in schedule["shifts"]]
+    schedule["day_exclusions"] += [
+        # overlapping rules, repeated people and days, days out of range
+        {"people": people[:4] + people[:2], "shifts": shifts[:2], "days": [0, 0, 13]},
+        {"people": people[2:6], "shifts": shifts[1:3], "days": [-1, 0, 1, 14, 20]},
+        # empty rule
+        {"people": [], "shifts": shifts, "days": [3]},
+    ]
+    return schedule
+
+
+def expand_exclusions(schedule, days):
+    """
+    Cartesian expansion of day exclusion rules to (shift_id, person_id, day) cells of the given days
+    """
+    return {
+        (shift_id, person_id, day)
+        for rule in schedule["day_exclusions"]
+        for shift_id in rule["shifts"]
+        for person_id in rule["people"]
+        for day in rule["days"]
+        if day in days
+    }
+
+
+def expand_rules(rules):
+    return {
+        (shift_id, person_id, day)
+        for shift_ids, person_ids, rule_days in rules
+        for shift_id in shift_ids
+        for person_id in person_ids
+        for day in rule_days
+    }
+
+
+def test_exclusion_rules_match_expanded_rules(write_schedule, load_schedule):
+    schedule = schedule_with_exclusions()
+    num_of_days = schedule["schedule"]["num_of_days"]
+    json_file_path = write_schedule(schedule)
+    db_adapter = load_schedule(json_file_path)
+    model = load_schedule(json_file_path, model=True)
+
+    # rules are stored once, not expanded
+    assert len(db_adapter.select("exclusion_rule", ["id"])) == len(
+        schedule["day_exclusions"]
+    )
+    assert len(db_adapter.select("exclusion_person", ["rule_id"])) == sum(
+        len(rule["people"]) for rule in schedule["day_exclusions"]
+    )
+
+    all_days = range(-1, num_of_days + 7)
+    assert set(
+        db_adapter.select("exclusion", ["shift_id", "person_id", "day"])
+    ) == expand_exclusions(schedule, all_days)
+    # days before schedule start are never drawn and not kept by the model
+    assert set(
+        model.select("exclusion", ["shift_id", "person_id", "day"])
+    ) == expand_exclusions(schedule, all_days[1:])
+
+    for first_day, last_day in [(0, num_of_days), (1, 5), (13, 20)]:
+        days = range(first_day, last_day)
+        reference = expand_exclusions(schedule, days)
+        for db in [db_adapter, model]:
+            assert expand_rules(db.select_exclusion_rules(first_day, last_day)) == (
+                reference
+            )
@@ -0,0 +1,48 @@
+import pytest
+
+from schedule_ascii.model import ScheduleModel
+from schedule_ascii.synth import generate_schedule
+
+
+@pytest.mark.parametrize(
+    "people, days, seed, day_range",
+    [
+        (20, 14, 0, None),
+        (60, 35, 1, None),
+        (40, 28, 2, range(7, 14)),
+        (5, 7, 3, None),
+    ],
+)
+def test_model_report_matches_sqlite(
+    write_schedule, load_schedule, draw_report, people, days, seed, day_range
+):
+    json_file_path = write_schedule(
+        generate_schedule(people=people, days=days, seed=seed)
+    )
+    model = load_schedule(json_file_path, model=True)
+    assert isinstance(model, ScheduleModel)
+    db_adapter = load_schedule(json_file_path)
+    assert draw_report(model, day_range=day_range) == draw_report(
+        db_adapter, day_range=day_range
+    )
+
+
+def test_model_queries_match_sqlite(write_schedule, load_schedule):
+    json_file_path = write_schedule(generate_schedule(people=30, days=21, seed=4))
+    model = load_schedule(json_file_path, model=True)
+    db_adapter = load_schedule(json_file_path)
+    for method in [
+        "select_coverage_needs",
+        "select_coverage_people",
+        "select_capacities",
+        "select_total_capacities",
+        "select_exclusion_rules",
+    ]:
+        for first_day, last_day in [(0, 21), (5, 12)]:
+            model_rows = getattr(model, method)(first_day, last_day)
+            db_rows = getattr(db_adapter, method)(first_day, last_day)
+            assert sorted(map(repr, model_rows)) == sorted(map(repr, db_rows)), method
+    for method in ["select_tasks_grid", "select_task_keys"]:
+        assert list(getattr(model, method)(0, 21)) == list(
+            getattr(db_adapter, method)(0, 21)
+        ), method
@@ -0,0 +1,68 @@
+import io
+import json
+
+from schedule_ascii import parser
+from schedule_ascii.parser import JSONStreamReader
+from schedule_ascii.synth import generate_schedule
+
+DOCUMENT = {
+    "version": 1.5,
+    "count": 1234,
+    "ratio": -2.5e-3,
+    "name": "schedule",
+    "active": True,
+    "shifts": [{"id": "S0", "duration": 7.75}, 12.25, 3],
+    "empty": [],
+}
+
+
+def expected_items(document):
+    items = []
+    for key, value in document.items():
+        if isinstance(value, list):
+            items.extend((key, element) for element in value)
+        else:
+            items.append((key, value))
+    return items
+
+
+def test_stream_reader_matches_json_loads():
+    text = json.dumps(DOCUMENT)
+    assert list(JSONStreamReader(io.StringIO(text))) == expected_items(DOCUMENT)
+
+
+def test_stream_reader_numbers_cut_by_chunk_boundary():
+    text = json.dumps(DOCUMENT)
+    # every chunk size cuts numbers at every position, ie "1." of "1.5"
+    for chunk_size in range(1, len(text) + 1):
+        reader = JSONStreamReader(io.StringIO(text), chunk_size=chunk_size)
+        assert list(reader) == expected_items(DOCUMENT), chunk_size
+
+
+def test_stream_reader_float_split_after_dot():
+    text = '{"version": 1.5, "people": []}'
+    chunk_size = text.index(".") + 1
+    reader = JSONStreamReader(io.StringIO(text), chunk_size=chunk_size)
+    assert list(reader) == [("version", 1.5)]
+
+
+def test_streaming_reads_file_once_with_schedule_last(monkeypatch, write_schedule):
+    schedule = generate_schedule(people=6, days=10, seed=8)
+    schedule["schedule"] = schedule.pop("schedule")
+    json_file_path = write_schedule(schedule)
+    readers = []
+
+    class CountedReader(parser.JSONStreamReader):
+        def __init__(self, *args, **kwargs):
+            readers.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(parser, "JSONStreamReader", CountedReader)
+    streamed_rows = list(parser.JSONParser(json_file_path, streaming=True).rows())
+    assert len(readers) == 1
+    # sections are read in file order, rows of each table keep the same order
+    loaded_rows = list(parser.JSONParser(json_file_path).rows())
+    assert streamed_rows[0] == loaded_rows[0]
+    assert sorted(streamed_rows, key=lambda table_row: table_row[0]) == sorted(
+        loaded_rows, key=lambda table_row: table_row[0]
+    )
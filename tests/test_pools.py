@@ -0,0 +1,48 @@
+from schedule_ascii.synth import generate_schedule
+
+
+def schedule_with_pools():
+    schedule = generate_schedule(people=12, days=7, seed=9)
+    people = [person["id"] for person in schedule["people"]]
+    coverages = schedule["coverages"]
+    coverages[0]["people"] = people[:4]
+    coverages[1]["people"] = people[:4]
+    # same people in another order, a person missing from people, empty list
+    coverages[2]["people"] = people[3::-1]
+    coverages[3]["people"] = people[:2] + ["ghost"]
+    coverages[4]["people"] = []
+    return schedule
+
+
+def test_coverages_share_people_pools(write_schedule, load_schedule):
+    schedule = schedule_with_pools()
+    json_file_path = write_schedule(schedule)
+    db_adapter = load_schedule(json_file_path)
+    model = load_schedule(json_file_path, model=True)
+    coverages = schedule["coverages"]
+
+    distinct_lists = {tuple(coverage["people"]) for coverage in coverages}
+    assert len(db_adapter.select("people_pool", ["id"])) == len(distinct_lists)
+    assert len(db_adapter.select("pool_person", ["pool_id"])) == sum(
+        len(people) for people in distinct_lists
+    )
+
+    coverage_people = {}
+    for coverage_id, person_id in db_adapter.select(
+        "coverage_person", ["coverage_id", "person_id"]
+    ):
+        coverage_people.setdefault(coverage_id, []).append(person_id)
+    for coverage_id, coverage in enumerate(coverages):
+        assert sorted(coverage_people.get(coverage_id, [])) == sorted(
+            coverage["people"]
+        )
+
+    num_of_days = schedule["schedule"]["num_of_days"]
+    reference = sorted(
+        (coverage["shift"], coverage["day"], person_id)
+        for coverage in coverages
+        if 0 <= coverage["day"] < num_of_days
+        for person_id in coverage["people"]
+    )
+    for db in [db_adapter, model]:
+        assert sorted(db.select_coverage_people(0, num_of_days)) == reference
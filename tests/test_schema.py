@@ -0,0 +1,80 @@
+import datetime
+
+from schedule_ascii.synth import generate_schedule
+
+
+def schedule_with_unknown_ids():
+    schedule = generate_schedule(people=10, days=7, seed=10)
+    tasks = schedule["tasks"]
+    # tasks of a person and a shift without their own row
+    tasks.append(dict(tasks[0], person="ghost"))
+    tasks.append(dict(tasks[1], shift="NOSHIFT"))
+    # several tasks of a person on one day, inserted out of person order
+    tasks.insert(0, dict(tasks[-3], shift=schedule["shifts"][0]["id"]))
+    return schedule
+
+
+def task_days(schedule):
+    start_date = datetime.date.fromisoformat(schedule["schedule"]["start_day"])
+    return [
+        (datetime.date.fromisoformat(task["day"]) - start_date).days
+        for task in schedule["tasks"]
+    ]
+
+
+def test_keyed_views_read_back_ids(write_schedule, load_schedule):
+    schedule = schedule_with_unknown_ids()
+    db_adapter = load_schedule(write_schedule(schedule))
+
+    assert sorted(
+        db_adapter.select("task", ["id", "person_id", "shift_id", "day"])
+    ) == [
+        (task_id, task["person"], task["shift"], day)
+        for task_id, (task, day) in enumerate(
+            zip(schedule["tasks"], task_days(schedule))
+        )
+    ]
+    assert sorted(
+        db_adapter.select("coverage", ["id", "min_value", "shift_id", "day"])
+    ) == [
+        (coverage_id, coverage["min_value"], coverage["shift"], coverage["day"])
+        for coverage_id, coverage in enumerate(schedule["coverages"])
+    ]
+    assert sorted(
+        db_adapter.select("preallocation", ["id", "shift_id", "person_id", "type"])
+    ) == [
+        (
+            preallocation_id,
+            preallocation["shift"] or "",
+            preallocation["person"],
+            preallocation["type"],
+        )
+        for preallocation_id, preallocation in enumerate(schedule["preallocations"])
+    ]
+    assert sorted(db_adapter.select("shift_label", ["shift_id", "label"])) == sorted(
+        (shift["id"], label)
+        for shift in schedule["shifts"]
+        for label in shift.get("labels", [])
+    )
+
+
+def test_task_keys_are_sorted_by_person_day_and_task(write_schedule, load_schedule):
+    schedule = schedule_with_unknown_ids()
+    num_of_days = schedule["schedule"]["num_of_days"]
+    json_file_path = write_schedule(schedule)
+    tasks = sorted(
+        (task["person"], day, task_id, task["shift"])
+        for task_id, (task, day) in enumerate(
+            zip(schedule["tasks"], task_days(schedule))
+        )
+        if 0 <= day < num_of_days
+    )
+    reference = [(person_id, day, shift_id) for person_id, day, _, shift_id in tasks]
+    db_adapter = load_schedule(json_file_path)
+    assert list(db_adapter.select_task_keys(0, num_of_days)) == reference
+    # the model grid keeps the last task of each day
+    last_tasks = {(person_id, day): shift_id for person_id, day, shift_id in reference}
+    model = load_schedule(json_file_path, model=True)
+    assert list(model.select_task_keys(0, num_of_days)) == [
+        (person_id, day, shift_id) for (person_id, day), shift_id in last_tasks.items()
+    ]
@@ -0,0 +1,52 @@
+import pytest
+
+from schedule_ascii.db import DBAdapter
+from schedule_ascii.model import Person, Shift
+from schedule_ascii.snapshot import (
+    ScheduleSnapshot,
+    open_snapshot,
+    pack_numbers,
+    write_snapshot,
+)
+from schedule_ascii.synth import generate_schedule
+
+# source hashes are sha256 hex digests
+SOURCE_HASH = "0" * 64
+
+
+def schedule_with_nulls():
+    schedule = generate_schedule(people=12, days=14, seed=5)
+    schedule["shifts"][0]["display_name"] = None
+    schedule["shifts"][1]["start_time"] = None
+    schedule["shifts"][2]["end_time"] = None
+    schedule["shifts"][3]["id"] = 42
+    schedule["people"][0]["activity_rate"] = None
+    schedule["people"][1]["id"] = 7
+    return schedule
+
+
+def test_snapshot_stores_nulls_and_non_string_ids(tmp_path, load_schedule):
+    db_adapter = load_schedule(schedule_with_nulls())
+    snapshot_path = str(tmp_path / "schedule.snap")
+    write_snapshot(snapshot_path, db_adapter, SOURCE_HASH)
+    schedule_snapshot = open_snapshot(snapshot_path, SOURCE_HASH)
+    try:
+        for table, columns in [("person", Person.COLUMNS), ("shift", Shift.COLUMNS)]:
+            assert schedule_snapshot.select(table, columns) == db_adapter.select(
+                table, columns
+            )
+    finally:
+        schedule_snapshot.close()
+
+
+def test_pack_numbers_rejects_non_numbers():
+    with pytest.raises(ValueError):
+        pack_numbers("person_activity_rate", [80, "80"])
+
+
+def test_unpackable_snapshot_falls_back_to_db(load_schedule):
+    schedule = generate_schedule(people=5, days=7, seed=6)
+    schedule["people"][0]["activity_rate"] = "high"
+    db_adapter = load_schedule(schedule, in_memory=False, snapshot=True)
+    assert isinstance(db_adapter, DBAdapter)
+    assert not isinstance(db_adapter, ScheduleSnapshot)
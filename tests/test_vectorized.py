@@ -0,0 +1,28 @@
+import pytest
+
+from schedule_ascii.synth import generate_schedule
+
+pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize(
+    "people, days, seed", [(20, 14, 0), (50, 28, 1), (120, 35, 2), (0, 7, 3)]
+)
+def test_numpy_backend_matches_sql(load_schedule, draw_capacity, people, days, seed):
+    db_adapter = load_schedule(generate_schedule(people=people, days=days, seed=seed))
+    assert draw_capacity(db_adapter, "numpy") == draw_capacity(db_adapter, "sql")
+
+
+def test_numpy_backend_matches_sql_mixed_int_float_needs(load_schedule, draw_capacity):
+    schedule = generate_schedule(people=30, days=21, seed=4)
+    coverages = schedule["coverages"]
+    for i, coverage in enumerate(coverages):
+        if i % 3 == 1:
+            coverage["min_value"] += 0.5
+        elif i % 3 == 2:
+            coverage["min_value"] = float(coverage["min_value"])
+    # cells summing an int and a float, or two ints
+    for coverage in coverages[:10]:
+        coverages.append(dict(coverage, min_value=1))
+    db_adapter = load_schedule(schedule)
+    assert draw_capacity(db_adapter, "numpy") == draw_capacity(db_adapter, "sql")
@@ -0,0 +1,84 @@
+import io
+
+import pytest
+
+from schedule_ascii.synth import generate_schedule
+from schedule_ascii.watch import ScheduleWatcher
+
+
+@pytest.fixture
+def watch(write_schedule, load_schedule, draw_report):
+    """
+    Return a function writing a schedule and applying it to a watcher, it returns the watched
+    report, the report of a full reload of the same file and the watcher
+    """
+    watchers = []
+
+    def write_and_draw(schedule):
+        json_file_path = write_schedule(schedule)
+        if not watchers:
+            watchers.append(
+                ScheduleWatcher(json_file_path, in_memory=True, persist=False)
+            )
+            watchers[0].load()
+        else:
+            assert watchers[0].update() is not None
+        output = io.StringIO()
+        watchers[0].draw(output)
+        return (
+            output.getvalue(),
+            draw_report(load_schedule(json_file_path)),
+            watchers[0],
+        )
+
+    yield write_and_draw
+    for watcher in watchers:
+        watcher.db_adapter.close()
+
+
+def person_tasks(schedule, person_id):
+    return [task for task in schedule["tasks"] if task["person"] == person_id]
+
+
+def test_task_moved_to_occupied_day_matches_reload(watch):
+    schedule = generate_schedule(people=10, days=14, seed=7)
+    watched, reloaded, _ = watch(schedule)
+    assert watched == reloaded
+
+    first_task, second_task = person_tasks(schedule, "person-00000")[:2]
+    # first task is drawn on top of second task day if it is inserted last
+    first_task["day"] = second_task["day"]
+    first_task["shift"] = next(
+        shift["id"]
+        for shift in schedule["shifts"]
+        if shift["id"] != second_task["shift"]
+    )
+    watched, reloaded, _ = watch(schedule)
+    assert watched == reloaded
+
+    # tasks of a day swapped, same rows in another order
+    tasks = schedule["tasks"]
+    i, j = tasks.index(first_task), tasks.index(second_task)
+    tasks[i], tasks[j] = tasks[j], tasks[i]
+    watched, reloaded, _ = watch(schedule)
+    assert watched == reloaded
+
+
+def test_unused_people_pools_are_deleted(watch):
+    schedule = generate_schedule(people=10, days=14, seed=9)
+    _, _, watcher = watch(schedule)
+    db_adapter = watcher.db_adapter
+    pool_count = db_adapter.select("people_pool", ["count(*)"])[0][0]
+
+    # coverages of a shift share a people list, replace it with a new one
+    shift_id = schedule["coverages"][0]["shift"]
+    people = [person["id"] for person in schedule["people"][:3]]
+    for coverage in schedule["coverages"]:
+        if coverage["shift"] == shift_id:
+            coverage["people"] = people
+    watched, reloaded, _ = watch(schedule)
+    assert watched == reloaded
+    assert db_adapter.select("people_pool", ["count(*)"])[0][0] == pool_count
+    assert db_adapter.select(
+        "pool_person", ["count(*)"], "pool_id NOT IN (SELECT pool_id FROM coverage)"
+    ) == [(0,)]